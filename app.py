@@ -1,25 +1,87 @@
 # Add this as the first line after imports
 import streamlit as st
 st.set_page_config(page_title="Have I Met You Before?", page_icon="📸")
-from datetime import datetime
-import json
 import os
-from PIL import Image
 import math
-import plotly.express as px
-import pandas as pd
+import functools
+import uuid
+from datetime import date, timedelta
+import photo_meta
+import profiling
+from imaging import ImageTooLargeError, process_image
+from image_cache import ImageCache
+from image_store import ImageStore, derivative_path
+from integrity import SCAN_INTERVAL, IntegrityScanner
+from locations import COUNTRIES, US_STATES, build_map_figures
+from shared_data import SharedData
+from visual_index import image_hash
+from storage import open_store
+from uploads import DONE, FAILED, QueueFull, UploadQueue
+
+def current_profile():
+    # Spans of this run; callbacks that run before the script land here too
+    if 'profile' not in st.session_state:
+        st.session_state.profile = profiling.RunProfile()
+    return st.session_state.profile
+
+def span(name):
+    return current_profile().span(name)
+
+def timed(name):
+    return profiling.timed(name, current_profile)
+
+current_profile().begin()
+# Fragment reruns skip the top of the script; this tells them apart from app runs
+st.session_state.app_running = True
+if 'profile_session' not in st.session_state:
+    st.session_state.profile_session = uuid.uuid4().hex[:8]
+
+def record_run(fragment=None):
+    """Record this run's timings; the next run starts a new profile"""
+    run = current_profile().finish(session=st.session_state.profile_session, fragment=fragment)
+    st.session_state.profile = profiling.RunProfile()
+    get_metrics().record(run)
+    return run
+
+@st.cache_resource
+def get_image_cache():
+    # Bytes of recently drawn photos, shared by every session
+    return ImageCache()
+
+@st.cache_resource
+def get_metrics():
+    # Timings of every session, for the debug panel and the exports
+    metrics = profiling.Metrics()
+    metrics.add_collector(get_image_cache().metrics)
+    return metrics
+
+@st.cache_resource
+def get_image_store():
+    return ImageStore()
+
+@st.cache_resource
+def get_uploads():
+    # Background workers that process and save uploads for every session
+    uploads = UploadQueue(get_image_store())
+    get_metrics().add_collector(uploads.metrics)
+    return uploads
+
+image_store = get_image_store()
+image_cache = get_image_cache()
+uploads = get_uploads()
 
 # Initialize session states
-if 'people' not in st.session_state:
-    if os.path.exists('people_data.json'):
-        with open('people_data.json', 'r') as f:
-            st.session_state.people = json.load(f)
-    else:
-        st.session_state.people = []
-
 if 'show_modal' not in st.session_state:
     st.session_state.show_modal = False
-    st.session_state.current_person_idx = None
+    st.session_state.current_person_id = None
+
+if 'upload_jobs' not in st.session_state:
+    # Ids of this session's unfinished uploads
+    st.session_state.upload_jobs = []
+
+if 'notices' not in st.session_state:
+    # (message, icon) shown as toasts by the next app run
+    st.session_state.notices = []
 
 if 'button_clicked' not in st.session_state:
     st.session_state.button_clicked = False
@@ -27,271 +89,436 @@ if 'button_clicked' not in st.session_state:
 if 'button_states' not in st.session_state:
     st.session_state.button_states = {}
 
-if 'events' not in st.session_state:
-    if os.path.exists('events_data.json'):
-        with open('events_data.json', 'r') as f:
-            st.session_state.events = json.load(f)
-    else:
-        st.session_state.events = []
-
-# Dictionary of state abbreviations
-COUNTRIES = {
-    'United States': 'USA',
-    'Canada': 'CAN',
-    'Mexico': 'MEX',
-    'United Kingdom': 'GBR'
-}
-
-# For US states, we'll keep them as regions
-US_STATES = {
-    'Alabama': 'AL', 'Alaska': 'AK', 'Arizona': 'AZ', 'Arkansas': 'AR', 'California': 'CA',
-    'Colorado': 'CO', 'Connecticut': 'CT', 'Delaware': 'DE', 'Florida': 'FL', 'Georgia': 'GA',
-    'Hawaii': 'HI', 'Idaho': 'ID', 'Illinois': 'IL', 'Indiana': 'IN', 'Iowa': 'IA',
-    'Kansas': 'KS', 'Kentucky': 'KY', 'Louisiana': 'LA', 'Maine': 'ME', 'Maryland': 'MD',
-    'Massachusetts': 'MA', 'Michigan': 'MI', 'Minnesota': 'MN', 'Mississippi': 'MS', 'Missouri': 'MO',
-    'Montana': 'MT', 'Nebraska': 'NE', 'Nevada': 'NV', 'New Hampshire': 'NH', 'New Jersey': 'NJ',
-    'New Mexico': 'NM', 'New York': 'NY', 'North Carolina': 'NC', 'North Dakota': 'ND', 'Ohio': 'OH',
-    'Oklahoma': 'OK', 'Oregon': 'OR', 'Pennsylvania': 'PA', 'Rhode Island': 'RI', 'South Carolina': 'SC',
-    'South Dakota': 'SD', 'Tennessee': 'TN', 'Texas': 'TX', 'Utah': 'UT', 'Vermont': 'VT',
-    'Virginia': 'VA', 'Washington': 'WA', 'West Virginia': 'WV', 'Wisconsin': 'WI', 'Wyoming': 'WY'
-}
-
-def crop_center_square(image):
-    width, height = image.size
-    size = min(width, height)
-    left = (width - size) // 2
-    top = (height - size) // 2
-    right = left + size
-    bottom = top + size
-    return image.crop((left, top, right, bottom))
-
-def save_image(image_file, person_name):
-    if not os.path.exists('images'):
-        os.makedirs('images')
-    
-    image_path = f"images/{person_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-    img = Image.open(image_file)
-    img = crop_center_square(img)
-    img = img.resize((300, 300))
-    img.save(image_path)
-    return image_path
-
-def save_people_data():
-    with open('people_data.json', 'w') as f:
-        json.dump(st.session_state.people, f)
-
+@st.cache_resource
+def get_data():
+    # One copy of the people, events and their indexes shared by every session
+    return SharedData(open_store(), COUNTRIES, US_STATES)
+
+@st.cache_resource
+def get_scanner():
+    # Reconciles the photo directories with the records in the background
+    scanner = IntegrityScanner(get_data(), get_image_store())
+    get_metrics().add_collector(scanner.metrics)
+    scanner.start(SCAN_INTERVAL)
+    return scanner
+
+shared = get_data()
+data = profiling.Instrumented(shared, 'data', current_profile)
+scanner = get_scanner()
+
+# Pick up writes of other processes; remember which version this run draws
+data.sync()
+st.session_state.seen_version = data.version
+# Every section is drawn by this run
+st.session_state.stale_sections = set()
+
+def notify(message, icon=None):
+    st.session_state.notices.append((message, icon))
+
+def invalidate(*sections):
+    """Mark sections out of date; the page is redrawn before a fragment run ends"""
+    st.session_state.stale_sections.update(sections)
+
+def redraw_if_stale(name):
+    # A fragment can only redraw itself; other sections need the whole page
+    if (st.session_state.stale_sections - {name}
+            or data.version != st.session_state.seen_version):
+        st.rerun(scope="app")
+
+def section(name, **fragment_args):
+    """Draw a page section as a fragment, so its widgets rerun only this section.
+
+    When a fragment run invalidates another section, or changes the data,
+    the whole page is redrawn instead.  Fragment runs are profiled as runs
+    of their own.
+    """
+    def decorate(draw):
+        @st.fragment(**fragment_args)
+        @functools.wraps(draw)
+        def fragment():
+            partial = not st.session_state.app_running
+            if partial:
+                redraw_if_stale(name)
+            with span(name):
+                draw()
+            if partial:
+                redraw_if_stale(name)
+                st.session_state.stale_sections.discard(name)
+                record_run(fragment=name)
+        return fragment
+    return decorate
+
+def queue_upload(label, files, on_photo=None, on_done=None):
+    """Hand uploads to the background workers; returns whether they were accepted.
+
+    The callbacks run in a worker thread: they use ``shared`` rather than
+    ``data`` (whose timings belong to this session's run) and never ``st``.
+    """
+    try:
+        job = uploads.submit(label, [(f.name, f.getvalue()) for f in files], on_photo, on_done)
+    except QueueFull as e:
+        st.error(str(e))
+        return False
+    st.session_state.upload_jobs.append(job.id)
+    invalidate("uploads")
+    return True
+
+def attach_photo(person_id, meeting=None):
+    """``on_photo`` callback adding the photo (and a meeting) to an existing person"""
+    def on_photo(path, meta):
+        if shared.add_photo(person_id, path, meta) is None:
+            raise LookupError("The person was deleted before the photo was ready")
+        if meeting:
+            shared.add_meeting(person_id, meeting)
+    return on_photo
+
+UPLOAD_POLL_SECONDS = 0.5
+UPLOAD_ICONS = {DONE: "✅", FAILED: "⚠️"}
+
+@st.fragment(run_every=UPLOAD_POLL_SECONDS)
+def show_uploads():
+    """Progress of this session's uploads; redraws the page when one finishes"""
+    jobs = [job for job in map(uploads.get, st.session_state.upload_jobs) if job]
+    for job in jobs:
+        done, total = job.progress()
+        st.progress(done / total, text=f"{job.label}: {done} of {total} photos")
+        st.caption("  ".join(f"{UPLOAD_ICONS.get(status, '⏳')} {name}"
+                             for name, status in zip(job.names, job.status)))
+    finished = [job for job in jobs if job.finished]
+    if finished or len(jobs) < len(st.session_state.upload_jobs):
+        st.session_state.upload_jobs = [job.id for job in jobs if not job.finished]
+        for job in finished:
+            for photo_name, error in job.errors:
+                notify(f"{job.label}: skipped {photo_name}: {error}" if photo_name
+                       else f"{job.label}: {error}", icon="⚠️")
+            if not job.errors:
+                notify(f"{job.label}: done", icon="✅")
+        st.rerun(scope="app")
+
+@timed("delete_image")
 def delete_image(image_path):
-    if os.path.exists(image_path):
-        os.remove(image_path)
+    # Only removes the file once nothing else references it
+    image_store.release(image_path)
+    image_cache.discard(image_path)
+    image_cache.discard(derivative_path(image_path, 'medium'))
 
-def show_person_modal(idx):
+def show_person_modal(person_id):
     st.session_state.show_modal = True
-    st.session_state.current_person_idx = idx
+    st.session_state.current_person_id = person_id
+    invalidate("modal")
 
 def close_modal():
     st.session_state.show_modal = False
-    st.session_state.current_person_idx = None
-
-def get_photo_timestamp(photo_path):
-    """Extract timestamp from photo filename"""
+    st.session_state.current_person_id = None
+
+def photo_data(path, size=None):
+    """Bytes of a photo at ``size`` if one is stored (None: the thumbnail)"""
+    if size:
+        try:
+            return image_cache.get(derivative_path(path, size))
+        except FileNotFoundError:
+            # Photos from before derivatives, or uploads too small for this size
+            pass
+    return image_cache.get(path)
+
+@timed("show_photo")
+def show_photo(record, path, mark_missing, size=None, **kwargs):
+    """Draw a photo; if its file can't be read, mark it as missing instead of failing.
+
+    The integrity scan clears the mark once the file can be read again.
+    Other errors are not recorded: they may be gone on the next run.
+    """
+    try:
+        data = photo_data(path, size)
+    except OSError:
+        mark_missing(record['id'], path)
+        return False
     try:
-        # Extract the timestamp part from the filename (assumes format: name_YYYYMMDD_HHMMSS.jpg)
-        timestamp_str = photo_path.split('_')[-1].split('.')[0]
-        return datetime.strptime(timestamp_str, '%Y%m%d_%H%M%S')
-    except:
-        return datetime.min
+        st.image(data, **kwargs)
+    except Exception:
+        st.caption("⚠️ This photo can't be shown right now")
+        return False
+    return True
 
 def set_button_clicked():
     st.session_state.button_clicked = True
 
-def handle_photo_nav(person_name, direction):
+def handle_photo_nav(person_name, direction, photo_count):
     current_idx = st.session_state[f"current_photo_{person_name}"]
     if direction == "prev" and current_idx > 0:
         st.session_state[f"current_photo_{person_name}"] = current_idx - 1
-    elif direction == "next":
+    elif direction == "next" and current_idx < photo_count - 1:
         st.session_state[f"current_photo_{person_name}"] = current_idx + 1
 
 def handle_photo_delete(person, current_idx):
-    delete_image(person['photos'][current_idx])
-    person['photos'].pop(current_idx)
+    photo_path = person['photos'][current_idx]
+    if data.remove_photo(person['id'], photo_path):
+        delete_image(photo_path)
+    person = data.get_person(person['id']) or person
     st.session_state[f"current_photo_{person['name']}"] = min(
         current_idx,
         len(person['photos']) - 1
     ) if person['photos'] else 0
-    save_people_data()
-
-def handle_date_delete(person, date):
-    person['dates'].remove(date)
-    save_people_data()
 
-def handle_date_add(person, new_date):
-    date_str = new_date.strftime("%Y-%m-%d")
-    if date_str not in person['dates']:
-        person['dates'].append(date_str)
-        person['dates'].sort()
-        save_people_data()
+def handle_meeting_delete(person, meeting):
+    data.remove_meeting(person['id'], meeting)
+
+def handle_meeting_add(person, meeting):
+    data.add_meeting(person['id'], meeting)
+
+GALLERY_MODES = ["Pages", "Show more"]
+GALLERY_PAGE_SIZE = int(os.environ.get('GALLERY_PAGE_SIZE', 12))
+SEARCH_RESULTS = 60
+SECTIONS = ["People", "Map", "Analytics", "Box Cutters"]
+# Seconds between checks for changes made by other sessions (0 turns them off)
+SYNC_INTERVAL = float(os.environ.get('SYNC_INTERVAL', 5))
+
+def get_page_size():
+    return st.session_state.get('gallery_page_size', GALLERY_PAGE_SIZE)
+
+def get_page_bounds(gallery, total):
+    """Range of the items of a gallery to draw on this run"""
+    page_size = get_page_size()
+    if st.session_state.get('gallery_mode', GALLERY_MODES[0]) == "Pages":
+        pages = max(1, math.ceil(total / page_size))
+        page = min(st.session_state.get(f"{gallery}_page", 0), pages - 1)
+        st.session_state[f"{gallery}_page"] = page
+        return page * page_size, min(total, (page + 1) * page_size)
+    visible = st.session_state.get(f"{gallery}_visible", page_size)
+    return 0, min(total, visible)
+
+def change_page(gallery, step):
+    st.session_state[f"{gallery}_page"] = st.session_state.get(f"{gallery}_page", 0) + step
+
+def reset_page(gallery):
+    # A gallery whose contents changed starts again from the top
+    st.session_state[f"{gallery}_page"] = 0
+    st.session_state.pop(f"{gallery}_visible", None)
+
+def not_seen_cutoff(months):
+    return date.today() - timedelta(days=round(months * 30.44))
+
+def date_range(value):
+    """``(start, end)`` of a date range input, None for the ends not picked"""
+    value = tuple(value or ())
+    return (value[0] if value else None), (value[1] if len(value) > 1 else None)
+
+def show_more(gallery):
+    st.session_state[f"{gallery}_visible"] = (
+        st.session_state.get(f"{gallery}_visible", get_page_size()) + get_page_size())
+
+def render_pager(gallery, total):
+    start, stop = get_page_bounds(gallery, total)
+    if st.session_state.get('gallery_mode', GALLERY_MODES[0]) == "Pages":
+        pages = math.ceil(total / get_page_size())
+        if pages <= 1:
+            return
+        page = st.session_state[f"{gallery}_page"]
+        col1, col2, col3 = st.columns([1, 3, 1])
+        with col1:
+            if page > 0:
+                st.button("←", key=f"{gallery}_prev", on_click=change_page, args=(gallery, -1))
+        with col2:
+            st.write(f"Page {page + 1} of {pages}")
+        with col3:
+            if page < pages - 1:
+                st.button("→", key=f"{gallery}_next", on_click=change_page, args=(gallery, 1))
+    elif stop < total:
+        st.button(f"Show more ({total - stop} left)",
+                  key=f"{gallery}_more", on_click=show_more, args=(gallery,))
+
+def page_event_photos(events, start, stop):
+    """Photos ``start:stop`` of the gallery, without flattening every event"""
+    page = []
+    offset = 0
+    for event in events:
+        count = len(event['photos'])
+        if offset + count > start:
+            for i in range(max(0, start - offset), min(count, stop - offset)):
+                page.append({
+                    'index': offset + i,
+                    'path': event['photos'][i],
+                    'event_name': event['name'],
+                    'date': event['date'],
+                    'event': event  # Keep reference to full event
+                })
+        offset += count
+        if offset >= stop:
+            break
+    return page
+
+@st.fragment(run_every=SYNC_INTERVAL or None)
+def watch_for_changes():
+    # Redraw the page once another session or process changed the data.
+    # Not profiled: these timer runs are no one's rerun, and a span opened
+    # here would start the next run's clock while the session sits idle.
+    shared.sync()
+    if shared.version != st.session_state.seen_version:
+        st.rerun()
 
-def save_events_data():
-    with open('events_data.json', 'w') as f:
-        json.dump(st.session_state.events, f)
+@st.cache_resource(max_entries=16)
+def get_map_figures(digest, _map_data):
+    """Map figures for the given rows, shared by all sessions"""
+    return build_map_figures(_map_data)
 
 # Modal dialog
-if st.session_state.show_modal:
-    person = st.session_state.people[st.session_state.current_person_idx]
+@section("modal")
+def person_modal():
+    person = data.get_person(st.session_state.current_person_id)
+    if not st.session_state.show_modal or person is None:
+        close_modal()
+        return
+
+    col1, col2 = st.columns([1, 4])
+    with col1:
+        st.button("✕", key="close_modal", on_click=close_modal)
+    with col2:
+        st.subheader(person['name'])
     
-    with st.container():
-        col1, col2 = st.columns([1, 4])
-        with col1:
-            if st.button("✕", key="close_modal"):
-                close_modal()
-        with col2:
-            st.subheader(person['name'])
-        
-        # Create two columns for image and details
-        img_col, details_col = st.columns([1, 1])
+    # Create two columns for image and details
+    img_col, details_col = st.columns([1, 1])
+    
+    with img_col:
+        # Initialize current photo index in session state if not exists
+        if f"current_photo_{person['name']}" not in st.session_state:
+            st.session_state[f"current_photo_{person['name']}"] = 0
         
-        with img_col:
-            # Initialize current photo index in session state if not exists
-            if f"current_photo_{person['name']}" not in st.session_state:
-                st.session_state[f"current_photo_{person['name']}"] = 0
+        if person['photos']:
+            # Another session may have removed photos since
+            current_idx = min(st.session_state[f"current_photo_{person['name']}"],
+                              len(person['photos']) - 1)
+            
+            # Navigation buttons
+            col1, col2, col3 = st.columns([1, 3, 1])
+            with col1:
+                if current_idx > 0:
+                    st.button("←", 
+                             key=f"prev_{person['name']}_{current_idx}",
+                             on_click=handle_photo_nav,
+                             args=(person['name'], "prev", len(person['photos'])))
             
-            # Migrate old format to new format
-            if 'photo' in person and 'photos' not in person:
-                person['photos'] = [person['photo']]
-                del person['photo']
-                save_people_data()
-            elif 'photos' not in person:
-                person['photos'] = []
-                save_people_data()
+            with col2:
+                st.write(f"Photo {current_idx + 1} of {len(person['photos'])}")
             
-            if person['photos']:
-                current_idx = st.session_state[f"current_photo_{person['name']}"]
-                
-                # Navigation buttons
-                col1, col2, col3 = st.columns([1, 3, 1])
-                with col1:
-                    if current_idx > 0:
-                        st.button("←", 
-                                 key=f"prev_{person['name']}_{current_idx}",
-                                 on_click=handle_photo_nav,
-                                 args=(person['name'], "prev"))
-                
-                with col2:
-                    st.write(f"Photo {current_idx + 1} of {len(person['photos'])}")
-                
-                with col3:
-                    if current_idx < len(person['photos']) - 1:
-                        st.button("→", 
-                                 key=f"next_{person['name']}_{current_idx}",
-                                 on_click=handle_photo_nav,
-                                 args=(person['name'], "next"))
-                
-                # Display current photo
-                if os.path.exists(person['photos'][current_idx]):
-                    st.image(person['photos'][current_idx], use_container_width=True)
-                    st.button("Delete Current Photo",
-                             key=f"delete_photo_{person['name']}_{current_idx}",
-                             on_click=handle_photo_delete,
-                             args=(person, current_idx))
+            with col3:
+                if current_idx < len(person['photos']) - 1:
+                    st.button("→", 
+                             key=f"next_{person['name']}_{current_idx}",
+                             on_click=handle_photo_nav,
+                             args=(person['name'], "next", len(person['photos'])))
             
-            # Add new photo
-            new_photo = st.file_uploader("Add new photo", type=['jpg', 'jpeg', 'png'])
-            if new_photo:
-                # Create a unique key for this upload
-                upload_key = f"uploaded_{person['name']}_{new_photo.name}"
-                
-                # Check if this photo was already uploaded
-                if upload_key not in st.session_state:
-                    new_path = save_image(new_photo, person['name'])
-                    person['photos'].append(new_path)
-                    save_people_data()
+            # Display current photo
+            current_photo = person['photos'][current_idx]
+            if person['photo_meta'].get(current_photo, {}).get('ok', True):
+                show_photo(person, current_photo, data.mark_photo_missing, size='medium',
+                           use_container_width=True)
+                # Read the photos either side now so ←/→ never waits on disk
+                image_cache.prefetch([derivative_path(p, 'medium') for p in
+                                      person['photos'][max(0, current_idx - 1):current_idx + 2]])
+                st.button("Delete Current Photo",
+                         key=f"delete_photo_{person['name']}_{current_idx}",
+                         on_click=handle_photo_delete,
+                         args=(person, current_idx))
+        
+        # Add new photo
+        new_photo = st.file_uploader("Add new photo", type=['jpg', 'jpeg', 'png'])
+        if new_photo:
+            # Create a unique key for this upload
+            upload_key = f"uploaded_{person['name']}_{new_photo.name}"
+            
+            # Check if this photo was already uploaded
+            if upload_key not in st.session_state:
+                if queue_upload(f"Photo of {person['name']}", [new_photo],
+                                on_photo=attach_photo(person['id'])):
                     # Mark this photo as uploaded
                     st.session_state[upload_key] = True
+    
+    with details_col:
+        # Edit fields
+        new_name = st.text_input("Name", person['name'])
         
-        with details_col:
-            # Edit fields
-            new_name = st.text_input("Name", person['name'])
-            
-            # Location fields
-            new_country = st.selectbox("Country", 
-                                     options=list(COUNTRIES.keys()), 
-                                     index=list(COUNTRIES.keys()).index(person.get('country', 'United States')))
-            
-            if new_country == "United States":
-                new_state = st.selectbox("State", 
-                                       options=list(US_STATES.keys()),
-                                       index=list(US_STATES.keys()).index(person.get('state', 'New York')))
-            else:
-                new_state = None
-            
-            # Show and edit meetings
-            st.write("**Meetings:**")
-            meetings_to_remove = []
-            for i, meeting in enumerate(person['meetings']):
-                col1, col2, col3 = st.columns([2, 2, 1])
-                with col1:
-                    st.write(f"- {meeting['date']}")
-                with col2:
-                    st.write(meeting['location'])
-                with col3:
-                    if st.button("🗑", key=f"delete_meeting_{person['name']}_{i}"):
-                        meetings_to_remove.append(meeting)
-            
-            # Remove selected meetings
-            for meeting in meetings_to_remove:
-                person['meetings'].remove(meeting)
-            
-            # Add new meeting
-            new_date = st.date_input("Add new date")
-            new_location = st.text_input("Location")
-            if st.button("Add Meeting", key=f"add_meeting_{person['name']}_modal"):
-                date_str = new_date.strftime("%Y-%m-%d")
-                if not any(m['date'] == date_str for m in person['meetings']):
-                    person['meetings'].append({
-                        "date": date_str,
-                        "location": new_location
-                    })
-                    person['meetings'].sort(key=lambda x: x['date'])
-                    save_people_data()
-                    st.success("Meeting added!")
-            
-            # Save changes
-            if (new_name != person['name'] or 
-                new_country != person.get('country') or
-                new_state != person.get('state')):
-                
-                person.update({
-                    "name": new_name,
-                    "country": new_country,
-                    "state": new_state if new_country == "United States" else None
+        # Location fields
+        new_country = st.selectbox("Country", 
+                                 options=list(COUNTRIES.keys()), 
+                                 index=list(COUNTRIES.keys()).index(person.get('country', 'United States')))
+        
+        if new_country == "United States":
+            new_state = st.selectbox("State", 
+                                   options=list(US_STATES.keys()),
+                                   index=list(US_STATES.keys()).index(person.get('state') or 'New York'))
+        else:
+            new_state = None
+        
+        # Show and edit meetings
+        st.write("**Meetings:**")
+        meetings_to_remove = []
+        for i, meeting in enumerate(person['meetings']):
+            col1, col2, col3 = st.columns([2, 2, 1])
+            with col1:
+                st.write(f"- {meeting['date']}")
+            with col2:
+                st.write(meeting['location'])
+            with col3:
+                if st.button("🗑", key=f"delete_meeting_{person['name']}_{i}"):
+                    meetings_to_remove.append(meeting)
+        
+        # Remove selected meetings
+        for meeting in meetings_to_remove:
+            handle_meeting_delete(person, meeting)
+            person = data.get_person(person['id']) or person
+        
+        # Add new meeting
+        new_date = st.date_input("Add new date")
+        new_location = st.text_input("Location")
+        if st.button("Add Meeting", key=f"add_meeting_{person['name']}_modal"):
+            date_str = new_date.strftime("%Y-%m-%d")
+            if not data.has_meeting(person['id'], date_str):
+                handle_meeting_add(person, {
+                    "date": date_str,
+                    "location": new_location
                 })
-                save_people_data()
-                st.success("Changes saved!")
+                person = data.get_person(person['id']) or person
+                notify("Meeting added!")
+        
+        # Save changes
+        if (new_name != person['name'] or 
+            new_country != person.get('country') or
+            new_state != person.get('state')):
             
-            # Delete person
-            if st.button("Delete Person", type="primary"):
-                for photo in person['photos']:
+            person = data.update_person(
+                person['id'],
+                name=new_name,
+                country=new_country,
+                state=new_state if new_country == "United States" else None
+            ) or person
+            notify("Changes saved!")
+        
+        # Delete person
+        if st.button("Delete Person", type="primary"):
+            removed = data.delete_person(person['id'])
+            if removed:
+                for photo in removed['photos']:
                     delete_image(photo)
-                st.session_state.people.pop(st.session_state.current_person_idx)
-                save_people_data()
-                close_modal()
+            close_modal()
+
+person_modal()
 
 # App title
 st.title("MLH Coaches You've Met")
 
 # Sidebar for adding new people
-with st.sidebar:
-    st.header("Add New Meeting")
+@section("add_meeting")
+def add_meeting_form():
     with st.form("add_person"):
         name = st.text_input("Name")
         
-        # Check if person already exists
+        # Check if person already exists (ignoring case and accents)
         existing_person = None
+        similar_people = []
         if name:  # Only check if name is entered
-            for p in st.session_state.people:
-                if p['name'].lower() == name.lower():
-                    existing_person = p
-                    break
+            existing_person = data.lookup(name)
+            if not existing_person:
+                similar_people = data.similar(name)
         
         photo = st.file_uploader("Photo", type=['jpg', 'jpeg', 'png'])
         location_met = st.text_input("Location Met")
@@ -308,310 +535,405 @@ with st.sidebar:
             state = st.selectbox(
                 "State",
                 options=list(US_STATES.keys()),
-                index=list(US_STATES.keys()).index(existing_person.get('state', 'New York')) if existing_person else 0
+                index=list(US_STATES.keys()).index(existing_person.get('state') or 'New York') if existing_person else 0
             )
         else:
             state = None
         
         if existing_person:
-            st.write(f"Adding new meeting for existing person: {name}")
+            st.write(f"Adding new meeting for existing person: {existing_person['name']}")
+        
+        confirm_new = False
+        if similar_people:
+            st.warning("Have you met before? Similar names: "
+                       + ", ".join(p['name'] for p in similar_people))
+            confirm_new = st.checkbox(f"{name} is a new person")
         
         date_met = st.date_input("Date Met")
         
         submitted = st.form_submit_button("Add Meeting")
         
-        if submitted and name and photo and location_met and date_met:
-            image_path = save_image(photo, name)
-            
+        if submitted and similar_people and not confirm_new:
+            st.error("Use the existing name to add a meeting, or confirm this is a new person.")
+        elif submitted and name and photo and location_met and date_met:
+            meeting = {
+                "date": date_met.strftime("%Y-%m-%d"),
+                "location": location_met
+            }
             if existing_person:
-                # Add to existing person
-                existing_person['photos'].append(image_path)
-                # Store date with location
-                existing_person['meetings'].append({
-                    "date": date_met.strftime("%Y-%m-%d"),
-                    "location": location_met
-                })
-                # Sort meetings by date
-                existing_person['meetings'].sort(key=lambda x: x['date'])
-                st.success("Meeting added successfully!")
+                # Add the photo and the meeting to the existing person once the photo is saved
+                queue_upload(f"Meeting with {existing_person['name']}", [photo],
+                             on_photo=attach_photo(existing_person['id'], meeting))
             else:
-                # Create new person
+                # Create the new person once the photo is saved
                 person = {
                     "name": name,
-                    "photos": [image_path],
+                    "photos": [],
+                    "photo_meta": {},
+                    "cover_photo": None,
                     "country": country,
                     "state": state if country == "United States" else None,
-                    "meetings": [{
-                        "date": date_met.strftime("%Y-%m-%d"),
-                        "location": location_met
-                    }]
+                    "meetings": [meeting]
                 }
-                st.session_state.people.append(person)
-                st.success("Person added successfully!")
-            
-            save_people_data()
+                def add_new_person(image_path, image_meta, person=person):
+                    photo_meta.add_photo(person, image_path, image_meta)
+                    shared.add_person(person)
+                queue_upload(f"New person {name}", [photo], on_photo=add_new_person)
             
             # Clear the form by removing the uploaded file from session state
             if 'add_person' in st.session_state:
                 del st.session_state.add_person
+
+with st.sidebar, span("sidebar"):
+    st.header("Add New Meeting")
+    add_meeting_form()
+
+    # Uploads still being processed, and what happened since the last run
+    if st.session_state.upload_jobs:
+        show_uploads()
+    for message, icon in st.session_state.notices:
+        st.toast(message, icon=icon)
+    st.session_state.notices = []
             
     # Add this after the sidebar form section
     with st.sidebar:
         st.markdown("---")  # Add a visual separator
         st.header("Settings")
         
+        st.radio("Gallery mode", GALLERY_MODES, key="gallery_mode", horizontal=True)
+        st.number_input("Photos per page", min_value=3, max_value=60, step=3,
+                        value=GALLERY_PAGE_SIZE, key="gallery_page_size")
+        
         # Create two columns for the clear buttons
         col1, col2 = st.columns(2)
         
         with col1:
             if st.button("Clear People", type="secondary"):
-                if st.session_state.people:
-                    # Delete all photos
-                    for person in st.session_state.people:
+                if data.people:
+                    # Clear the list, then delete all photos
+                    for person in data.clear_people():
                         for photo in person.get('photos', []):
-                            if photo and os.path.exists(photo):
-                                os.remove(photo)
-                    # Clear the list
-                    st.session_state.people = []
-                    save_people_data()
+                            delete_image(photo)
                     st.success("People gallery cleared!")
                     st.rerun()
         
         with col2:
             if st.button("Clear Events", type="secondary"):
-                if st.session_state.events:
-                    # Delete all event photos
-                    for event in st.session_state.events:
+                if data.events:
+                    # Clear the list, then delete all event photos
+                    for event in data.clear_events():
                         for photo in event.get('photos', []):
-                            if photo and os.path.exists(photo):
-                                os.remove(photo)
-                    # Clear the list
-                    st.session_state.events = []
-                    save_events_data()
+                            delete_image(photo)
                     st.success("Events gallery cleared!")
                     st.rerun()
 
 # Main content - Display people grid
 # st.header("People You've Met")
 
-# Create grid layout
-COLS = 3
-rows = math.ceil(len(st.session_state.people) / COLS)
-
-for row in range(rows):
-    cols = st.columns(COLS, gap="small")
-    for col in range(COLS):
-        idx = row * COLS + col
-        if idx < len(st.session_state.people):
-            person = st.session_state.people[idx]
-            with cols[col]:
-                # Handle both old and new format
-                photos = person.get('photos', [person.get('photo')]) if 'photos' in person or 'photo' in person else []
-                if photos and photos[0] is not None:
-                    # Sort photos by timestamp and get the most recent one
-                    valid_photos = [p for p in photos if p and os.path.exists(p)]
-                    if valid_photos:
-                        most_recent_photo = max(valid_photos, key=get_photo_timestamp)
-                        st.image(most_recent_photo, 
-                                caption=person['name'], 
-                                use_container_width=True)
-                        # Add last seen date and location
-                        if person.get('meetings'):
-                            last_meeting = person['meetings'][-1]
-                            st.caption(f"Last seen: {last_meeting['date']}")
-                            st.caption(f"At: {last_meeting['location']}")
+# Each section is a fragment: using its widgets redraws only that section
+@section("people")
+def people_section():
+    with span("search"):
+        search_query = st.text_input("Search people", placeholder="Have I met you before?")
+        if search_query:
+            shown_people = data.search(search_query, limit=SEARCH_RESULTS)
+            if not shown_people:
+                st.info(f"No one like \"{search_query}\" yet.")
+        else:
+            shown_people = data.people
+
+        with st.expander("Search by photo"):
+            query_photo = st.file_uploader("Photo of someone you may have met",
+                                           type=['jpg', 'jpeg', 'png'], key="visual_query",
+                                           help="Finds stored copies of the same photo, "
+                                                "even resized or recompressed")
+            if query_photo:
+                # Hash each uploaded query once, not on every rerun
+                if st.session_state.get('visual_query_id') != query_photo.file_id:
+                    try:
+                        st.session_state.visual_query_hash = image_hash(process_image(query_photo))
+                    except ImageTooLargeError as e:
+                        st.session_state.visual_query_hash = None
+                        st.error(str(e))
+                    st.session_state.visual_query_id = query_photo.file_id
+
+                matches = []
+                if st.session_state.visual_query_hash:
+                    matches = data.visual_query(st.session_state.visual_query_hash)
+                if not matches:
+                    st.info("No near-duplicate of this photo yet.")
+                for person_id, match_path, distance in matches:
+                    match = data.get_person(person_id)
+                    if match is None:
+                        # Deleted since the query
+                        continue
+                    col1, col2 = st.columns([1, 3])
+                    with col1:
+                        show_photo(match, match_path, data.mark_photo_missing,
+                                   use_container_width=True)
+                    with col2:
+                        st.write(f"**{match['name']}**")
+                        # Bits of the 128-bit perceptual hashes that differ: finds copies
+                        # of the same photo (resized, recompressed), not the same face
+                        st.caption(f"Near-duplicate photo: {distance} of 128 hash bits differ")
                         st.button("View Details",
-                                 key=f"view_{idx}",
+                                 key=f"visual_view_{person_id}",
                                  on_click=show_person_modal,
-                                 args=(idx,))
-
-# Add this at the bottom of the file, after the grid display
-st.header("Where Coaches Are From")
-
-# Create DataFrame for the map
-people_by_location = {}
-for person in st.session_state.people:
-    country = person.get('country', 'Unknown')
-    if country not in people_by_location:
-        people_by_location[country] = []
-    people_by_location[country].append(person['name'])
-
-map_data = []
-for country, names in people_by_location.items():
-    location = {
-        'country': country,
-        'country_code': COUNTRIES.get(country, ''),
-        'people': ', '.join(names),
-        'count': len(names)
-    }
-    map_data.append(location)
-    
-    # Add US states if country is United States
-    if country == 'United States':
-        us_people_by_state = {}
-        for person in [p for p in st.session_state.people if p.get('country') == 'United States']:
-            state = person.get('state')
-            if state:
-                if state not in us_people_by_state:
-                    us_people_by_state[state] = []
-                us_people_by_state[state].append(person['name'])
-        
-        for state, state_names in us_people_by_state.items():
-            map_data.append({
-                'country': 'United States',
-                'country_code': 'USA',
-                'state': state,
-                'state_code': US_STATES[state],
-                'people': ', '.join(state_names),
-                'count': len(state_names)
-            })
-
-if map_data:
-    df = pd.DataFrame(map_data)
-    
-    # Create world map
-    fig = px.choropleth(
-        df,
-        locations='country_code',
-        locationmode='ISO-3',
-        color='count',
-        scope='world',
-        hover_data=['people'],
-        color_continuous_scale='Viridis',
-        labels={'count': 'Number of People', 'people': 'Names'}
-    )
-    
-    # Customize the map view to focus on our countries of interest
-    fig.update_layout(
-        title_text='Coaches Met by Country',
-        geo=dict(
-            scope='world',
-            projection_type='equirectangular',
-            visible=True,
-            center=dict(lat=45, lon=-100),  # Center roughly between North America and UK
-            lonaxis_range=[-130, 0],  # Longitude range to show
-            lataxis_range=[15, 75],   # Latitude range to show
-        )
-    )
-    
-    st.plotly_chart(fig, use_container_width=True)
-    
-    # If there are US people, show US state map
-    us_data = df[df['country_code'] == 'USA'].copy()
-    if not us_data.empty and 'state_code' in us_data.columns:
-        st.subheader("United States Breakdown")
-        fig_us = px.choropleth(
-            us_data,
-            locations='state_code',
-            locationmode='USA-states',
-            color='count',
-            scope='usa',
-            hover_data=['people'],
-            color_continuous_scale='Viridis',
-            labels={'count': 'Number of People', 'people': 'Names'}
-        )
-        
-        fig_us.update_layout(
-            title_text='People Met by State (US)',
-            geo_scope='usa',
-        )
-        
-        st.plotly_chart(fig_us, use_container_width=True)
-else:
-    st.info("Add people to see them on the map!")
-
-# Box Cutters Gallery section
-st.header("Hackathon Box Cutters")
-
-# Add event form
-with st.expander("Add New Event"):
-    event_name = st.text_input("Event Name")
-    event_date = st.date_input("Event Date")
-    event_photos = st.file_uploader(
-        "Upload Photos", 
-        type=['jpg', 'jpeg', 'png'],
-        accept_multiple_files=True
-    )
-    
-    if st.button("Add Event") and event_name and event_date and event_photos:
-        # Create event directory if it doesn't exist
-        event_dir = "event_images"
-        if not os.path.exists(event_dir):
-            os.makedirs(event_dir)
-        
-        # Save photos and get their paths
-        photo_paths = []
-        for photo in event_photos:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            photo_path = f"{event_dir}/{event_name}_{timestamp}.jpg"
-            
-            # Process and save the image
-            img = Image.open(photo)
-            img = crop_center_square(img)
-            img = img.resize((300, 300))
-            img.save(photo_path)
-            photo_paths.append(photo_path)
-        
-        # Create event entry
-        event = {
-            "name": event_name,
-            "date": event_date.strftime("%Y-%m-%d"),
-            "photos": photo_paths
+                                 args=(person_id,))
+
+    # Every filter is answered from an index; together they are an intersection of ids
+    with span("filters"):
+        with st.expander("Filter people"):
+            options = data.facet_options()
+            country = st.selectbox("Country", ["Any"] + options['countries'], key="filter_country",
+                                   on_change=reset_page, args=("people",))
+            state = "Any"
+            if country == "United States":
+                state = st.selectbox("State", ["Any"] + options['states'], key="filter_state",
+                                     on_change=reset_page, args=("people",))
+            location = st.selectbox("Met at", ["Any"] + options['locations'],
+                                    key="filter_location", on_change=reset_page, args=("people",))
+            met_from, met_to = date_range(st.date_input(
+                "Met between", value=(), min_value=date(2000, 1, 1), key="filter_met",
+                on_change=reset_page, args=("people",)))
+            not_seen = st.number_input("Not seen in (months)", min_value=0, max_value=120, value=0,
+                                       key="filter_not_seen", help="0 shows everyone",
+                                       on_change=reset_page, args=("people",))
+        filters = {
+            "country": None if country == "Any" else country,
+            "state": None if state == "Any" else state,
+            "location": None if location == "Any" else location,
+            "met_from": met_from,
+            "met_to": met_to,
+            "not_seen_since": not_seen_cutoff(not_seen) if not_seen else None,
         }
-        
-        st.session_state.events.append(event)
-        save_events_data()
-        st.success("Event added successfully!")
-        st.rerun()
+        if any(value is not None for value in filters.values()):
+            matching = data.filter_people(**filters)
+            if search_query:
+                matching_ids = {person['id'] for person in matching}
+                shown_people = [person for person in shown_people if person['id'] in matching_ids]
+            else:
+                shown_people = matching
+            if shown_people:
+                st.caption(f"{len(shown_people)} of {len(data.people)} people")
+            else:
+                st.info("No one matches these filters.")
+
+    # Create grid layout for the current page only
+    with span("grid"):
+        COLS = 3
+        page_start, page_stop = get_page_bounds("people", len(shown_people))
+        rows = math.ceil((page_stop - page_start) / COLS)
+
+        for row in range(rows):
+            cols = st.columns(COLS, gap="small")
+            for col in range(COLS):
+                idx = page_start + row * COLS + col
+                if idx < page_stop:
+                    person = shown_people[idx]
+                    with cols[col]:
+                        # The most recent healthy photo is kept up to date at ingest
+                        if person.get('cover_photo'):
+                            if show_photo(person, person['cover_photo'], data.mark_photo_missing,
+                                          caption=person['name'],
+                                          use_container_width=True):
+                                # Add last seen date and location
+                                last_meeting = data.last_seen(person['id'])
+                                if last_meeting:
+                                    st.caption(f"Last seen: {last_meeting['date']}")
+                                    st.caption(f"At: {last_meeting['location']}")
+                                st.button("View Details",
+                                         key=f"view_{person['id']}",
+                                         on_click=show_person_modal,
+                                         args=(person['id'],))
+
+        render_pager("people", len(shown_people))
+
+@section("map")
+def map_section():
+    st.header("Where Coaches Are From")
+
+    # Aggregates are kept up to date as people change; figures are cached by their content
+    map_digest, map_data = data.map_rows()
+
+    if map_data:
+        fig, fig_us = get_map_figures(map_digest, map_data)
+
+        st.plotly_chart(fig, use_container_width=True)
+
+        # If there are US people, show US state map
+        if fig_us is not None:
+            st.subheader("United States Breakdown")
+            st.plotly_chart(fig_us, use_container_width=True)
+    else:
+        st.info("Add people to see them on the map!")
+
+@section("analytics")
+def analytics_section():
+    st.header("Meetings")
+
+    months = st.number_input("Not seen in (months)", min_value=1, max_value=120, value=6)
+    stats = data.meeting_stats(not_seen_cutoff(months))
+    if stats['per_month'][0]:
+        import pandas as pd
+
+        st.subheader("Per Month")
+        month_labels, month_counts = stats['per_month']
+        st.bar_chart(pd.DataFrame({"Meetings": month_counts}, index=month_labels))
+
+        location_col, country_col = st.columns(2)
+        with location_col:
+            st.subheader("Per Location")
+            location_labels, location_counts = stats['per_location']
+            st.bar_chart(pd.DataFrame({"Meetings": location_counts}, index=location_labels))
+        with country_col:
+            st.subheader("Per Country")
+            country_labels, country_counts = stats['per_country']
+            st.bar_chart(pd.DataFrame({"Meetings": country_counts}, index=country_labels))
+
+        st.subheader(f"Not Seen in {months} Months")
+        if stats['not_seen']:
+            st.dataframe(pd.DataFrame(
+                [{"Name": person['name'], "Country": person.get('country'), "Last seen": last}
+                 for person, last in stats['not_seen']]),
+                hide_index=True, use_container_width=True)
+        else:
+            st.write("Everyone has been seen recently.")
+        if stats['never_met']:
+            st.caption(f"{stats['never_met']} people have no meetings recorded.")
+    else:
+        st.info("Add meetings to see them here!")
+
+@section("events")
+def events_section():
+    # Box Cutters Gallery section
+    st.header("Hackathon Box Cutters")
+
+    # Add event form
+    with st.expander("Add New Event"), span("add_event"):
+        event_name = st.text_input("Event Name")
+        event_date = st.date_input("Event Date")
+        event_photos = st.file_uploader(
+            "Upload Photos", 
+            type=['jpg', 'jpeg', 'png'],
+            accept_multiple_files=True
+        )
 
-# Display events in a grid
-if st.session_state.events:
-    # Sort events by date (most recent first)
-    sorted_events = sorted(
-        st.session_state.events,
-        key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'),
-        reverse=True
-    )
-    
-    # Calculate grid layout
-    COLS = 3
-    all_photos = []
-    
-    # Prepare all photos with their event info
-    for event in sorted_events:
-        for photo_path in event['photos']:
-            if os.path.exists(photo_path):
-                all_photos.append({
-                    'path': photo_path,
-                    'event_name': event['name'],
-                    'date': event['date'],
-                    'event': event  # Keep reference to full event
+        if st.button("Add Event") and event_name and event_date and event_photos:
+            def add_new_event(photos, errors, name=event_name,
+                              date=event_date.strftime("%Y-%m-%d")):
+                if not photos:
+                    raise ValueError("None of the photos could be processed.")
+                # Create event entry
+                shared.add_event({
+                    "name": name,
+                    "date": date,
+                    "photos": [path for path, meta in photos],
+                    "photo_meta": dict(photos)
                 })
-    
-    # Create grid layout
-    rows = math.ceil(len(all_photos) / COLS)
-    
-    for row in range(rows):
-        cols = st.columns(COLS, gap="small")
-        for col in range(COLS):
-            idx = row * COLS + col
-            if idx < len(all_photos):
-                photo_info = all_photos[idx]
-                with cols[col]:
-                    st.image(photo_info['path'], use_container_width=True)
-                    st.caption(f"{photo_info['event_name']}")
-                    st.caption(f"{photo_info['date']}")
-                    
-                    # Add delete button for each event
-                    if st.button("Delete Event", key=f"delete_event_{photo_info['event_name']}_{idx}"):
-                        event = photo_info['event']
-                        # Delete all photos
-                        for path in event['photos']:
-                            if os.path.exists(path):
-                                os.remove(path)
-                        # Remove event from list
-                        st.session_state.events.remove(event)
-                        save_events_data()
-                        st.rerun()
-else:
-    st.info("No events added yet. Add your first event above!")
\ No newline at end of file
+            # The photos are processed in the background; the event appears once all are done
+            queue_upload(f"Event {event_name}", event_photos, on_done=add_new_event)
+
+    # Display events in a grid
+    with span("gallery"):
+        if data.events:
+            with st.expander("Filter events"):
+                name_filter = st.text_input("Search events", key="filter_event_name",
+                                            on_change=reset_page, args=("events",))
+                dated_from, dated_to = date_range(st.date_input(
+                    "Dated between", value=(), min_value=date(2000, 1, 1), key="filter_event_dates",
+                    on_change=reset_page, args=("events",)))
+
+            # Most recent first, from the date index
+            sorted_events = data.filter_events(name=name_filter, start=dated_from, end=dated_to)
+            if not sorted_events:
+                st.info("No events match these filters.")
+
+            # Calculate grid layout
+            COLS = 3
+            total_photos = sum(len(event['photos']) for event in sorted_events)
+            page_start, page_stop = get_page_bounds("events", total_photos)
+
+            # Only the photos of the current page are sent to the browser
+            page_photos = [p for p in page_event_photos(sorted_events, page_start, page_stop)
+                           if p['event']['photo_meta'].get(p['path'], {}).get('ok', True)]
+
+            # Create grid layout
+            rows = math.ceil(len(page_photos) / COLS)
+
+            for row in range(rows):
+                cols = st.columns(COLS, gap="small")
+                for col in range(COLS):
+                    if row * COLS + col < len(page_photos):
+                        photo_info = page_photos[row * COLS + col]
+                        idx = photo_info['index']
+                        with cols[col]:
+                            show_photo(photo_info['event'], photo_info['path'],
+                                       data.mark_event_photo_missing, use_container_width=True)
+                            st.caption(f"{photo_info['event_name']}")
+                            st.caption(f"{photo_info['date']}")
+
+                            # Add delete button for each event
+                            if st.button("Delete Event", key=f"delete_event_{photo_info['event_name']}_{idx}"):
+                                # Remove event from list, then delete all photos
+                                event = data.delete_event(photo_info['event']['id'])
+                                if event:
+                                    for path in event['photos']:
+                                        delete_image(path)
+                                st.rerun()
+
+            render_pager("events", total_photos)
+        else:
+            st.info("No events added yet. Add your first event above!")
+
+# Only the selected section is computed; the others wait until they are opened
+people_tab, map_tab, analytics_tab, events_tab = st.tabs(SECTIONS, key="section", on_change="rerun")
+
+with people_tab:
+    if people_tab.open:
+        people_section()
+
+with map_tab:
+    if map_tab.open:
+        map_section()
+
+with analytics_tab:
+    if analytics_tab.open:
+        analytics_section()
+
+with events_tab:
+    if events_tab.open:
+        events_section()
+
+
+if SYNC_INTERVAL:
+    watch_for_changes()
+
+run_profile = record_run()
+st.session_state.app_running = False
+metrics = get_metrics()
+
+if profiling.DEBUG_PANEL or st.query_params.get('debug') == '1':
+    with st.sidebar:
+        st.markdown("---")
+        st.header("Performance")
+        st.caption(f"This run: {run_profile['total_s'] * 1000:.1f} ms")
+        st.code('\n'.join(
+            f"{'  ' * s['depth'] + s['name'].rsplit('/', 1)[-1]:<28}{s['calls']:>5} {s['seconds'] * 1000:9.1f} ms"
+            for s in run_profile['spans']))
+        st.caption(f"Averages over {metrics.runs} runs of all sessions")
+        st.code('\n'.join(
+            f"{name:<28} {mean * 1000:9.1f} ms  max {max_seconds * 1000:9.1f} ms"
+            for name, runs, mean, max_seconds in metrics.summary()))
+        cache_stats = image_cache.stats()
+        st.caption(
+            f"Image cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+            f"{cache_stats['prefetched']} prefetched, {cache_stats['entries']} photos in "
+            f"{cache_stats['bytes'] / 2**20:.1f} of {cache_stats['max_bytes'] / 2**20:.0f} MB")
+        report = scanner.last_report
+        if report:
+            st.caption(
+                f"Integrity scan: {report['files']} files, {report['dangling']} missing, "
+                f"{report['orphans']} orphans, {report['refcount_drift']} counts off; "
+                f"{report['reclaimed']} reclaimed ({report['reclaimed_bytes'] / 2**20:.1f} MB) "
+                f"in {report['seconds'] * 1000:.0f} ms")
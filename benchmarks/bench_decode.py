@@ -0,0 +1,87 @@
+"""Peak RSS and latency of one upload through the old and the new decode path.
+
+Each measurement runs in a fresh interpreter so peak RSS is not polluted by
+earlier runs.  Usage::
+
+    python benchmarks/bench_decode.py [--megapixels 48] [--format JPEG] [--runs 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+from PIL import Image
+from imaging import crop_center_square, process_image
+
+def legacy(path):
+    img = Image.open(path)
+    img = crop_center_square(img)
+    return img.resize((300, 300))
+
+mode, path = sys.argv[1], sys.argv[2]
+func = legacy if mode == 'before' else process_image
+base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+func(path).convert('RGB').save('/dev/null', format='JPEG')
+elapsed = time.perf_counter() - start
+peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'seconds': elapsed, 'peak_rss_kb': peak_rss, 'delta_rss_kb': peak_rss - base_rss}}))
+"""
+
+
+def make_image(path, megapixels, fmt):
+    # Runs in a child process: Linux carries the peak RSS of a forked parent
+    # over into the measured children, so the parent must stay small
+    from PIL import Image
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    # A gradient compresses realistically without being a flat colour
+    gradient = Image.linear_gradient('L').resize((width, height))
+    img = Image.merge('RGB', (gradient, gradient.transpose(Image.Transpose.ROTATE_180), gradient))
+    img.save(path, format=fmt, quality=90)
+    return width, height
+
+
+def measure(mode, path):
+    code = CHILD.format(root=ROOT)
+    out = subprocess.run([sys.executable, '-c', code, mode, path],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--megapixels', type=float, default=48)
+    parser.add_argument('--format', default='JPEG', choices=['JPEG', 'PNG'])
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'upload.' + args.format.lower())
+        code = (f'import sys; sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); '
+                f'import bench_decode; '
+                f'print(*bench_decode.make_image({path!r}, {args.megapixels}, {args.format!r}))')
+        out = subprocess.run([sys.executable, '-c', code],
+                             check=True, capture_output=True, text=True).stdout
+        width, height = map(int, out.split())
+        results = {'image': {'width': width, 'height': height, 'format': args.format,
+                             'bytes': os.path.getsize(path)}}
+        for mode in ('before', 'after'):
+            runs = [measure(mode, path) for _ in range(args.runs)]
+            results[mode] = {
+                'seconds_min': min(r['seconds'] for r in runs),
+                'peak_rss_kb_max': max(r['peak_rss_kb'] for r in runs),
+                'delta_rss_kb_max': max(r['delta_rss_kb'] for r in runs),
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
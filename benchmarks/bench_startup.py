@@ -0,0 +1,115 @@
+"""Cold-start cost of the app: module imports and the first render.
+
+Each measurement runs in a fresh interpreter.  The first render is a full
+run of ``app.py`` (through Streamlit's ``AppTest``) against a synthetic data
+set, first for a new process and then for a second session in the same
+process.  Exits with status 1 when a budget is exceeded.  Usage::
+
+    python benchmarks/bench_startup.py [--people 1000] [--import-budget 0.25] [--render-budget 3]
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+# Modules that must not be imported before a section needs them
+LAZY_MODULES = ['pandas', 'plotly.express']
+
+IMPORT_CHILD = r"""
+import json, sys, time
+sys.path.insert(0, {root!r})
+import streamlit
+start = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+RENDER_CHILD = r"""
+import json, os, sys, time
+os.environ['SYNC_INTERVAL'] = '0'
+os.chdir(sys.argv[1])
+from streamlit.testing.v1 import AppTest
+times = []
+for _ in range(2):
+    start = time.perf_counter()
+    at = AppTest.from_file({app!r}, default_timeout=600)
+    at.run()
+    times.append(time.perf_counter() - start)
+    if at.exception:
+        raise SystemExit(at.exception[0].value)
+print(json.dumps({{'first_session': times[0], 'second_session': times[1],
+                  'loaded': [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def app_imports():
+    """Modules ``app.py`` imports at the top level, but Streamlit itself"""
+    with open(os.path.join(ROOT, 'app.py')) as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and not node.level:
+            modules.append(node.module)
+    return [m for m in dict.fromkeys(modules) if m.split('.')[0] != 'streamlit']
+
+
+def run_child(code, *args):
+    out = subprocess.run([sys.executable, '-c', code, *args],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--people', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--import-budget', type=float, default=0.25,
+                        help="seconds allowed for importing the app's modules")
+    parser.add_argument('--render-budget', type=float, default=3.0,
+                        help="seconds allowed for the first render of a new process")
+    args = parser.parse_args()
+
+    imports = [run_child(IMPORT_CHILD.format(root=ROOT, modules=app_imports(), lazy=LAZY_MODULES))
+               for _ in range(args.runs)]
+    with tempfile.TemporaryDirectory() as tmp:
+        subprocess.run([sys.executable, os.path.join(BENCHMARKS, 'synthetic.py'),
+                        '--people', str(args.people), '--out', tmp],
+                       check=True, capture_output=True)
+        code = RENDER_CHILD.format(app=os.path.join(ROOT, 'app.py'), lazy=LAZY_MODULES)
+        renders = [run_child(code, tmp) for _ in range(args.runs)]
+
+    results = {
+        'people': args.people,
+        'import_seconds_min': min(r['seconds'] for r in imports),
+        'imported_lazy_modules': imports[0]['loaded'],
+        'first_render_seconds_min': min(r['first_session'] for r in renders),
+        'second_session_seconds_min': min(r['second_session'] for r in renders),
+        'rendered_lazy_modules': renders[0]['loaded'],
+        'budgets': {'import_seconds': args.import_budget, 'first_render_seconds': args.render_budget},
+    }
+    print(json.dumps(results, indent=2))
+
+    failures = []
+    if results['import_seconds_min'] > args.import_budget:
+        failures.append(f"imports took {results['import_seconds_min']:.3f}s")
+    if results['first_render_seconds_min'] > args.render_budget:
+        failures.append(f"first render took {results['first_render_seconds_min']:.3f}s")
+    if results['imported_lazy_modules'] or results['rendered_lazy_modules']:
+        failures.append("heavy modules were imported eagerly: "
+                        + ", ".join(results['imported_lazy_modules'] + results['rendered_lazy_modules']))
+    if failures:
+        sys.exit("Over budget: " + "; ".join(failures))
+
+
+if __name__ == '__main__':
+    main()
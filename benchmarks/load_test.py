@@ -0,0 +1,417 @@
+"""Load test: many concurrent sessions against a local server.
+
+Starts ``streamlit run app.py`` on a synthetic data set and drives
+simulated users against it over the websocket protocol the browser uses,
+so every rerun goes through the real server: widget states in, deltas out.
+Each user opens the app and then, with a short think time between actions,
+picks one of these flows:
+
+* ``add_meeting``   fills in the sidebar form (with a photo) and submits it
+* ``open_modal``    opens a person, pages through their photos and closes it
+* ``page_people``   moves through the pages of the people grid
+* ``upload_event``  opens the event tab and uploads photos for a new event,
+                    then polls like the browser until they are processed
+
+For each number of sessions (a fresh server every time) it reports the
+p50/p95/p99 latency of the reruns, per action and overall, the reruns per
+second, and the resident memory of the server (with its ingest workers)
+before and after, per session::
+
+    python benchmarks/load_test.py --people 1000 --sessions 1 10 25 --duration 60 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import requests
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.Common_pb2 import FileUploaderState
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS)
+
+import synthetic  # noqa: E402
+
+FLOWS = {'add_meeting': 2, 'open_modal': 3, 'page_people': 2, 'upload_event': 1}
+WIDGETS = ('button', 'text_input', 'date_input', 'file_uploader', 'number_input', 'checkbox')
+# script_finished statuses that end an interaction (the others start another run)
+FINISHED = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_WITH_COMPILE_ERROR,
+            ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY)
+RERUN_TIMEOUT = 120
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of ``values``"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values) + 0.5) - 1))]
+
+
+def latency_summary(values):
+    return {'count': len(values),
+            'p50_s': percentile(values, 50),
+            'p95_s': percentile(values, 95),
+            'p99_s': percentile(values, 99),
+            'max_s': max(values) if values else None}
+
+
+def tree_rss(pid):
+    """Resident memory in bytes of ``pid`` and its child processes (Linux)"""
+    total = 0
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    total += int(line.split()[1]) * 1024
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                total += sum(tree_rss(int(child)) for child in f.read().split())
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    return total
+
+
+class Session:
+    """One simulated browser tab"""
+
+    def __init__(self, url, rng, photo):
+        self.url = url
+        self.rng = rng
+        self.photo = photo
+        self.ws = None
+        self.session_id = None
+        # widget id -> WidgetState fields carried into every rerun, like the browser does
+        self.state = {}
+        # widget id -> (type, label, fragment id, form id)
+        self.widgets = {}
+        self.tabs = None
+        # fragment id -> seconds, for the fragments that rerun on a timer
+        self.auto_reruns = {}
+        self.latencies = {}
+        # exception message -> times the app showed it
+        self.exceptions = Counter()
+
+    async def connect(self):
+        self.ws = await websockets.connect(f"ws://{self.url}/_stcore/stream",
+                                           subprotocols=['streamlit'], max_size=2 ** 28)
+
+    async def close(self):
+        await self.ws.close()
+
+    def _record(self, fm):
+        kind = fm.WhichOneof('type')
+        if kind == 'new_session':
+            self.session_id = self.session_id or fm.new_session.initialize.session_id
+            fragments = set(fm.new_session.fragment_ids_this_run)
+            if fragments:
+                # A fragment run redraws only the widgets of its fragments
+                self.widgets = {widget_id: widget for widget_id, widget in self.widgets.items()
+                                if widget[2] not in fragments}
+            else:
+                self.widgets.clear()
+                self.auto_reruns.clear()
+        elif kind == 'auto_rerun':
+            self.auto_reruns[fm.auto_rerun.fragment_id] = fm.auto_rerun.interval
+        elif kind == 'delta':
+            delta = fm.delta
+            if delta.WhichOneof('type') == 'add_block' and delta.add_block.WhichOneof('type') == 'tab_container':
+                self.tabs = delta.add_block.tab_container.id
+            elif delta.WhichOneof('type') == 'new_element':
+                element = delta.new_element
+                element_type = element.WhichOneof('type')
+                if element_type in WIDGETS:
+                    widget = getattr(element, element_type)
+                    self.widgets[widget.id] = (element_type, widget.label, delta.fragment_id,
+                                               getattr(widget, 'form_id', ''))
+                elif element_type == 'exception':
+                    self.exceptions[element.exception.message] += 1
+
+    async def rerun(self, action, trigger=None, fragment_id='', auto=False):
+        """Send a rerun like the browser does and wait until it (and any rerun it starts) ends"""
+        msg = BackMsg()
+        msg.rerun_script.page_script_hash = ''
+        msg.rerun_script.is_auto_rerun = auto
+        if fragment_id:
+            msg.rerun_script.fragment_id = fragment_id
+        for widget_id, fields in self.state.items():
+            widget = msg.rerun_script.widget_states.widgets.add(id=widget_id)
+            for name, value in fields.items():
+                if name == 'string_array_value':
+                    widget.string_array_value.data.extend(value)
+                elif name == 'file_uploader_state_value':
+                    widget.file_uploader_state_value.CopyFrom(value)
+                else:
+                    setattr(widget, name, value)
+        if trigger:
+            msg.rerun_script.widget_states.widgets.add(id=trigger, trigger_value=True)
+        start = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        app_rerun = False
+        while True:
+            fm = ForwardMsg()
+            fm.ParseFromString(await asyncio.wait_for(self.ws.recv(), RERUN_TIMEOUT))
+            self._record(fm)
+            if fm.WhichOneof('type') == 'script_finished':
+                if fm.script_finished in FINISHED:
+                    break
+                app_rerun = True
+        self.latencies.setdefault(action, []).append(time.perf_counter() - start)
+        return app_rerun
+
+    def find(self, element_type, label, form_id=None):
+        """``(widget id, fragment id)`` of the widgets with this type and label"""
+        return [(widget_id, fragment) for widget_id, (kind, text, fragment, form) in self.widgets.items()
+                if kind == element_type and text == label and (form_id is None or form == form_id)]
+
+    def set(self, widget_id, **fields):
+        self.state[widget_id] = fields
+
+    async def upload(self, files):
+        """Upload ``[(name, bytes)]`` through the file endpoint; returns the uploader state"""
+        msg = BackMsg()
+        msg.file_urls_request.request_id = str(self.rng.random())
+        msg.file_urls_request.session_id = self.session_id
+        msg.file_urls_request.file_names.extend(name for name, _ in files)
+        await self.ws.send(msg.SerializeToString())
+        while True:
+            fm = ForwardMsg()
+            fm.ParseFromString(await asyncio.wait_for(self.ws.recv(), RERUN_TIMEOUT))
+            if fm.WhichOneof('type') == 'file_urls_response':
+                break
+            self._record(fm)
+        state = FileUploaderState()
+        for (name, data), urls in zip(files, fm.file_urls_response.file_urls):
+            await asyncio.to_thread(
+                requests.put, f"http://{self.url}{urls.upload_url}",
+                files={'file': (name, data, 'image/jpeg')}, timeout=RERUN_TIMEOUT)
+            info = state.uploaded_file_info.add(name=name, size=len(data), file_id=urls.file_id)
+            info.file_urls.CopyFrom(urls)
+        return state
+
+    # Flows
+
+    async def open_app(self):
+        await self.connect()
+        await self.rerun('open_app')
+
+    async def add_meeting(self, number):
+        name = f"Load Test {self.session_id[:8]} {number}"
+        form = self.find('text_input', 'Name', 'add_person')
+        submit = [w for w in self.find('button', 'Add Meeting') if self.widgets[w[0]][3] == 'add_person']
+        if not form or not submit:
+            return
+        self.set(form[0][0], string_value=name)
+        self.set(self.find('text_input', 'Location Met')[0][0], string_value='Load Test')
+        self.set(self.find('date_input', 'Date Met')[0][0],
+                 string_array_value=[synthetic.random_day(self.rng).strftime('%Y/%m/%d')])
+        photo = self.find('file_uploader', 'Photo')[0][0]
+        self.set(photo, file_uploader_state_value=await self.upload([('photo.jpg', self.photo)]))
+        await self.rerun('add_meeting', trigger=submit[0][0], fragment_id=submit[0][1])
+        # A name close to another one has to be confirmed
+        confirm = [widget_id for widget_id, (kind, label, _, form_id) in self.widgets.items()
+                   if kind == 'checkbox' and form_id == 'add_person' and label.endswith('is a new person')]
+        if confirm:
+            self.set(confirm[0], bool_value=True)
+            await self.rerun('add_meeting', trigger=submit[0][0], fragment_id=submit[0][1])
+        # The form is cleared once submitted
+        for widget_id, (_, _, _, form_id) in list(self.widgets.items()):
+            if form_id == 'add_person':
+                self.state.pop(widget_id, None)
+
+    async def open_modal(self):
+        buttons = self.find('button', 'View Details')
+        if not buttons:
+            return
+        await self.rerun('open_modal', *self.rng.choice(buttons))
+        close = self.find('button', '✕')
+        if not close:
+            return
+        modal = close[0][1]
+        for _ in range(self.rng.randint(1, 3)):
+            forward = [button for button in self.find('button', '→') if button[1] == modal]
+            if not forward:
+                break
+            await self.rerun('page_photos', *forward[0])
+        await self.rerun('close_modal', *self.find('button', '✕')[0])
+
+    async def page_people(self):
+        for _ in range(self.rng.randint(1, 3)):
+            people = {fragment for _, fragment in self.find('button', 'View Details')}
+            forward = [button for button in self.find('button', '→') if button[1] in people]
+            if not forward:
+                break
+            await self.rerun('page_people', *forward[0])
+
+    async def upload_event(self, number):
+        if not self.tabs:
+            return
+        self.set(self.tabs, string_value='Box Cutters')
+        await self.rerun('open_events')
+        name = self.find('text_input', 'Event Name')
+        add = self.find('button', 'Add Event')
+        if name and add:
+            self.set(name[0][0], string_value=f"Load Test {self.session_id[:8]} {number}")
+            photos = self.find('file_uploader', 'Upload Photos')[0][0]
+            self.set(photos, file_uploader_state_value=await self.upload(
+                [(f'event{i}.jpg', self.photo) for i in range(2)]))
+            submitted = time.perf_counter()
+            await self.rerun('add_event', *add[0])
+            self.state.pop(photos, None)
+            # Poll the progress like the browser, until it redraws the page
+            while self.auto_reruns and time.perf_counter() - submitted < RERUN_TIMEOUT:
+                fragment, interval = next(iter(self.auto_reruns.items()))
+                await asyncio.sleep(interval)
+                if await self.rerun('upload_progress', fragment_id=fragment, auto=True):
+                    break
+            self.latencies.setdefault('event_processed', []).append(time.perf_counter() - submitted)
+        self.set(self.tabs, string_value='People')
+        await self.rerun('open_people')
+
+
+async def run_session(session, deadline, think):
+    await session.open_app()
+    number = 0
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(session.rng.expovariate(1 / think) if think else 0)
+        flow = session.rng.choices(list(FLOWS), weights=list(FLOWS.values()))[0]
+        number += 1
+        if flow == 'add_meeting':
+            await session.add_meeting(number)
+        elif flow == 'upload_event':
+            await session.upload_event(number)
+        else:
+            await getattr(session, flow)()
+    await session.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def start_server(data_dir, port, env):
+    # The server's output goes to a file: an unread pipe would fill up and block it
+    log_path = os.path.join(data_dir, 'server.log')
+    with open(log_path, 'w') as log:
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'streamlit', 'run', os.path.join(ROOT, 'app.py'),
+             '--server.headless', 'true', '--server.port', str(port),
+             '--server.enableXsrfProtection', 'false', '--server.fileWatcherType', 'none',
+             '--browser.gatherUsageStats', 'false'],
+            cwd=data_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    for _ in range(600):
+        if server.poll() is not None:
+            with open(log_path) as log:
+                raise SystemExit(f"The server exited: {log.read()}")
+        try:
+            if requests.get(f'http://localhost:{port}/_stcore/health', timeout=1).ok:
+                return server
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.1)
+    server.kill()
+    raise SystemExit("The server did not start")
+
+
+async def measure_level(url, pid, sessions, duration, think, photo, seed):
+    # One session first, so imports and shared caches are loaded before the baseline
+    warmup = Session(url, random.Random(seed), photo)
+    await warmup.open_app()
+    await warmup.close()
+    baseline = tree_rss(pid)
+    peak = baseline
+    users = [Session(url, random.Random(seed + i + 1), photo) for i in range(sessions)]
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(run_session(user, start + duration, think)) for user in users]
+    while not all(task.done() for task in tasks):
+        peak = max(peak, tree_rss(pid))
+        await asyncio.sleep(0.5)
+    elapsed = time.perf_counter() - start
+    errors = [repr(task.exception()) for task in tasks if task.exception()]
+    final = tree_rss(pid)
+
+    by_action = {}
+    for user in users:
+        for action, values in user.latencies.items():
+            by_action.setdefault(action, []).extend(values)
+    reruns = [v for action, values in by_action.items() if action != 'event_processed' for v in values]
+    return {
+        'sessions': sessions,
+        'seconds': elapsed,
+        'reruns': len(reruns),
+        'reruns_per_second': len(reruns) / elapsed,
+        'latency': latency_summary(reruns),
+        'actions': {action: latency_summary(values) for action, values in sorted(by_action.items())},
+        'rss_baseline_mb': baseline / 2 ** 20,
+        'rss_peak_mb': peak / 2 ** 20,
+        'rss_final_mb': final / 2 ** 20,
+        'rss_per_session_mb': (final - baseline) / 2 ** 20 / sessions,
+        'app_exceptions': dict(sum((user.exceptions for user in users), Counter())),
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--people', type=int, default=1000)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 10, 25])
+    parser.add_argument('--duration', type=float, default=60, help="seconds per session count")
+    parser.add_argument('--think', type=float, default=1.0,
+                        help="mean seconds a user waits between actions")
+    parser.add_argument('--photo-megapixels', type=float, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    photo = synthetic.upload_bytes(random.Random(args.seed), megapixels=args.photo_megapixels)
+    env = dict(os.environ, SYNC_INTERVAL=os.environ.get('SYNC_INTERVAL', '5'),
+               SCAN_INTERVAL=os.environ.get('SCAN_INTERVAL', '0'))
+    levels = []
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source')
+        subprocess.run([sys.executable, os.path.join(BENCHMARKS, 'synthetic.py'),
+                        '--people', str(args.people), '--out', source, '--seed', str(args.seed)],
+                       check=True, capture_output=True)
+        for sessions in args.sessions:
+            # A fresh copy and server per level, so every level starts from the same state
+            data_dir = os.path.join(tmp, f'level{sessions}')
+            shutil.copytree(source, data_dir)
+            port = free_port()
+            server = start_server(data_dir, port, env)
+            try:
+                level = asyncio.run(measure_level(f'localhost:{port}', server.pid, sessions,
+                                                  args.duration, args.think, photo, args.seed))
+            finally:
+                server.terminate()
+                server.wait()
+            levels.append(level)
+            latency = level['latency']
+            print(f"{sessions:>4} sessions: {level['reruns_per_second']:7.1f} reruns/s  "
+                  f"p50 {latency['p50_s'] * 1000:7.1f} ms  p95 {latency['p95_s'] * 1000:7.1f} ms  "
+                  f"p99 {latency['p99_s'] * 1000:7.1f} ms  "
+                  f"{level['rss_per_session_mb']:6.1f} MB/session", file=sys.stderr)
+
+    results = {'people': args.people, 'duration': args.duration, 'think': args.think,
+               'levels': levels}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
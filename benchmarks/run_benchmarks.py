@@ -0,0 +1,289 @@
+"""Micro-benchmarks of the app's hot paths on synthetic data.
+
+Results are written as JSON so runs from different versions can be compared:
+
+    python benchmarks/run_benchmarks.py --scales 100 1000 10000 --output bench.json
+    python benchmarks/run_benchmarks.py --scales 1000 --compare bench.json
+
+With ``--compare`` the exit status is 1 when any benchmark got slower than
+``--threshold`` times its previous median.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image  # noqa: E402
+
+import synthetic  # noqa: E402
+from facets import EventIndex, intersect  # noqa: E402
+from imaging import crop_center_square, process_image  # noqa: E402
+from locations import LocationIndex, build_map_figures  # noqa: E402
+from names import NameIndex  # noqa: E402
+from storage import JsonStore, SQLiteStore  # noqa: E402
+from timeline import MeetingTimeline  # noqa: E402
+from visual_index import VisualIndex  # noqa: E402
+
+COUNTRIES = {'United States': 'USA', 'Canada': 'CAN', 'Mexico': 'MEX', 'United Kingdom': 'GBR'}
+US_STATES = {name: name[:2].upper() for name in synthetic.US_STATES}
+PAGE_SIZE = 12
+
+
+def measure(func, repeat, setup=None):
+    """Run ``func`` ``repeat`` times and return timing statistics in seconds"""
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg) if setup else func()
+        times.append(time.perf_counter() - start)
+    return {
+        'runs': repeat,
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+        'mean_s': statistics.fmean(times),
+    }
+
+
+def legacy_photo_timestamp(photo_path):
+    """The filename parsing the grid used before covers were kept at ingest"""
+    try:
+        timestamp_str = photo_path.split('_')[-1].split('.')[0]
+        return datetime.strptime(timestamp_str, '%Y%m%d_%H%M%S')
+    except ValueError:
+        return datetime.min
+
+
+def legacy_grid_selection(people):
+    for person in people:
+        valid_photos = [p for p in person['photos'] if p and os.path.exists(p)]
+        if valid_photos:
+            max(valid_photos, key=legacy_photo_timestamp)
+
+
+def legacy_location_rows(people):
+    """The per-rerun aggregation the map section used to do"""
+    by_country = {}
+    for person in people:
+        by_country.setdefault(person.get('country', 'Unknown'), []).append(person['name'])
+    rows = []
+    for country, names in by_country.items():
+        rows.append({'country': country, 'country_code': COUNTRIES.get(country, ''),
+                     'people': ', '.join(names), 'count': len(names)})
+        if country == 'United States':
+            by_state = {}
+            for person in [p for p in people if p.get('country') == 'United States']:
+                if person.get('state'):
+                    by_state.setdefault(person['state'], []).append(person['name'])
+            for state, state_names in by_state.items():
+                rows.append({'country': 'United States', 'country_code': 'USA', 'state': state,
+                             'state_code': US_STATES[state], 'people': ', '.join(state_names),
+                             'count': len(state_names)})
+    return rows
+
+
+def legacy_meeting_stats(people, cutoff):
+    """Meeting analytics as a loop over every person and meeting"""
+    per_month, per_location, per_country, not_seen = {}, {}, {}, []
+    for person in people:
+        for meeting in person['meetings']:
+            month = meeting['date'][:7]
+            per_month[month] = per_month.get(month, 0) + 1
+            per_location[meeting['location']] = per_location.get(meeting['location'], 0) + 1
+            per_country[person['country']] = per_country.get(person['country'], 0) + 1
+        if person['meetings'] and max(m['date'] for m in person['meetings']) < cutoff:
+            not_seen.append(person['id'])
+    return per_month, per_location, per_country, not_seen
+
+
+def legacy_filter_people(people, country, location, met_from):
+    """People filters as a scan over every person and meeting"""
+    return [person for person in people
+            if person.get('country') == country
+            and any(m['location'] == location for m in person['meetings'])
+            and any(m['date'] >= met_from for m in person['meetings'])]
+
+
+def legacy_save_people(people):
+    """The whole-file rewrite ``save_people_data`` did on every change"""
+    with open('legacy_people.json', 'w') as f:
+        json.dump(people, f)
+
+
+def bench_ingest(results, repeat):
+    rng = random.Random(1)
+    upload = synthetic.upload_bytes(rng, megapixels=12)
+    results.append(dict(name='process_image_12mp', scale=1,
+                        **measure(lambda: process_image(io.BytesIO(upload)), repeat)))
+    big = Image.open(io.BytesIO(upload))
+    big.load()
+    results.append(dict(name='crop_center_square_12mp', scale=1,
+                        **measure(lambda: crop_center_square(big), repeat)))
+
+
+def bench_scale(results, scale, repeat, workdir):
+    people, events = synthetic.generate(scale, workdir, seed=scale)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        def add(name, stats):
+            results.append(dict(name=name, scale=scale, **stats))
+
+        # Persistence: whole-file JSON vs row-level SQLite
+        add('legacy_save_people_json', measure(lambda: legacy_save_people(people), repeat))
+        synthetic.write_json(people, events, '.')
+        json_store = JsonStore()
+        add('json_store_update_person', measure(
+            lambda: json_store.update_person(people[len(people) // 2]), repeat))
+        sqlite_store = SQLiteStore('bench.db')
+        for person in people:
+            sqlite_store.add_person(person)
+        for event in events:
+            sqlite_store.add_event(event)
+        meeting = {"date": "2024-06-01", "location": "Bench"}
+        add('sqlite_add_meeting', measure(
+            lambda: sqlite_store.add_meeting(people[len(people) // 2], meeting), repeat))
+        add('sqlite_load_people', measure(sqlite_store.load_people, max(1, repeat // 5)))
+        sqlite_store.close()
+
+        # People grid
+        add('legacy_grid_photo_selection', measure(lambda: legacy_grid_selection(people), repeat))
+        add('grid_cover_page', measure(
+            lambda: [p['cover_photo'] for p in people[:PAGE_SIZE] if p['cover_photo']], repeat))
+
+        # Map section
+        add('legacy_location_aggregation', measure(lambda: legacy_location_rows(people), repeat))
+        add('location_index_build', measure(
+            lambda: LocationIndex(COUNTRIES, US_STATES, people), max(1, repeat // 5)))
+        locations = LocationIndex(COUNTRIES, US_STATES, people)
+
+        def change_and_refresh():
+            locations.update(people[0])
+            locations.map_rows()
+        add('location_update_and_rows', measure(change_and_refresh, repeat))
+        add('location_rows_unchanged', measure(locations.map_rows, repeat))
+        add('map_figures_build', measure(
+            lambda: build_map_figures(locations.map_rows()), max(1, repeat // 5)))
+
+        # Meeting analytics
+        add('legacy_meeting_stats', measure(lambda: legacy_meeting_stats(people, '2024-01-01'), repeat))
+        add('timeline_build', measure(lambda: MeetingTimeline(people), max(1, repeat // 5)))
+        timeline = MeetingTimeline(people)
+
+        def timeline_stats():
+            timeline.add(people[0]['id'], meeting)
+            timeline.per_month()
+            timeline.per_location()
+            timeline.per_country()
+            timeline.not_seen_since('2024-01-01')
+            timeline.remove(people[0]['id'], meeting)
+        add('timeline_change_and_stats', measure(timeline_stats, repeat))
+
+        # Filters
+        location = people[0]['meetings'][0]['location'] if people[0]['meetings'] else 'HackMIT'
+        add('legacy_filter_people', measure(
+            lambda: legacy_filter_people(people, 'United States', location, '2022-01-01'), repeat))
+        add('facet_filter_people', measure(lambda: intersect([
+            locations.by_country.get('United States', {}),
+            timeline.people_at(location),
+            timeline.people_between('2022-01-01')]), repeat))
+
+        # Event gallery
+        add('legacy_event_sort', measure(lambda: sorted(
+            events, key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'), reverse=True), repeat))
+        add('event_sort', measure(lambda: sorted(events, key=lambda x: x['date'], reverse=True), repeat))
+        event_index = EventIndex(events)
+        add('event_index_filter', measure(lambda: event_index.between('2022-01-01'), repeat))
+
+        # Lookups
+        names = NameIndex(people)
+        queries = [p['name'][:-1] for p in people[:50]]
+        add('name_search', measure(lambda: [names.search(q) for q in queries], repeat))
+        # People known by one short name, looked up with two letters swapped
+        first_names = NameIndex([{"id": -i, "name": p['name'].split()[0]}
+                                 for i, p in enumerate(people, 1)] + people)
+        typos = [name[0] + name[2] + name[1] + name[3:]
+                 for name in (p['name'].split()[0] for p in people[:50])]
+        add('name_similar_short', measure(lambda: [first_names.similar(q) for q in typos], repeat))
+        add('name_search_short', measure(lambda: [first_names.search(q) for q in typos], repeat))
+        visual = VisualIndex(people)
+        query_hash = people[0]['photo_meta'][people[0]['photos'][0]]['phash']
+        add('visual_query', measure(lambda: visual.query(query_hash), repeat))
+    finally:
+        os.chdir(cwd)
+
+
+def run_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = {(r['name'], r['scale']): r for r in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        before = baseline.get((result['name'], result['scale']))
+        if not before or not before['median_s']:
+            continue
+        ratio = result['median_s'] / before['median_s']
+        marker = 'REGRESSION' if ratio > threshold else ''
+        print(f"{result['name']:32} {result['scale']:>7} {before['median_s'] * 1000:10.3f} ms "
+              f"-> {result['median_s'] * 1000:10.3f} ms  x{ratio:5.2f} {marker}")
+        if ratio > threshold:
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    results = []
+    bench_ingest(results, args.repeat)
+    for scale in args.scales:
+        with tempfile.TemporaryDirectory() as workdir:
+            bench_scale(results, scale, args.repeat, workdir)
+
+    report = {'info': run_info(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Synthetic people, meetings, events and images at a configurable scale.
+
+Records have the same shape as the ones the app stores (ids, photos,
+photo_meta, cover_photo, meetings).  Images are a small pool of real JPEGs
+in a content-addressed store that the records share, like duplicate
+uploads do in the app, so generating 100k people stays cheap.
+
+    python benchmarks/synthetic.py --people 10000 --out /tmp/data
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image  # noqa: E402
+
+from image_store import encode_jpeg, write_blob  # noqa: E402
+from visual_index import image_hash  # noqa: E402
+
+COUNTRIES = ['United States', 'Canada', 'Mexico', 'United Kingdom']
+US_STATES = ['California', 'New York', 'Texas', 'Washington', 'Massachusetts', 'Illinois',
+             'Florida', 'Georgia', 'Ohio', 'Oregon', 'Colorado', 'Pennsylvania']
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Jamie', 'Casey', 'Riley', 'John',
+               'Jon', 'Maria', 'José', 'Zoë', 'Chen', 'Wei', 'Fatima', 'Olga', 'Łukasz', 'Anne']
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'ten', 'bo', 'vi', 'son', 'der', 'ng', 'ha', 'zu', 'qui']
+LOCATIONS = ['ConUHacks', 'HackMIT', 'PennApps', 'TreeHacks', 'HackTheNorth', 'MHacks',
+             'CalHacks', 'HackNY', 'nwHacks', 'DeltaHacks', 'QHacks', 'HackUTD']
+
+
+def random_image(rng, size=300):
+    """A blocky random image, so perceptual hashes differ between images"""
+    cells = bytes(rng.getrandbits(8) for _ in range(8 * 8 * 3))
+    return Image.frombytes('RGB', (8, 8), cells).resize((size, size), Image.Resampling.BILINEAR)
+
+
+def upload_bytes(rng, megapixels=12, fmt='JPEG'):
+    """Encoded bytes of a phone-sized upload"""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    img = random_image(rng).resize((width, int(width * 3 / 4)), Image.Resampling.BILINEAR)
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, quality=90)
+    return buffer.getvalue()
+
+
+def image_pool(rng, root, count):
+    """Write ``count`` processed images into a store under ``root``"""
+    pool = []
+    for _ in range(count):
+        img = random_image(rng)
+        path = write_blob(encode_jpeg(img), root)
+        pool.append((path, {
+            "captured_at": None,
+            "uploaded_at": None,
+            "width": 300,
+            "height": 300,
+            "bytes": os.path.getsize(path),
+            "ok": True,
+            "phash": image_hash(img),
+        }))
+    return pool
+
+
+def random_name(rng):
+    last = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+    return f"{rng.choice(FIRST_NAMES)} {last}"
+
+
+def random_day(rng, start=date(2019, 1, 1), days=6 * 365):
+    return start + timedelta(days=rng.randrange(days))
+
+
+def generate(num_people, root, seed=0, photos_per_person=3, meetings_per_person=4,
+             num_events=None, photos_per_event=10, pool_size=64):
+    """Return ``(people, events)`` with images written under ``root``"""
+    rng = random.Random(seed)
+    pool = image_pool(rng, os.path.join(root, 'images'), pool_size)
+    base = datetime(2024, 1, 1)
+
+    people = []
+    for person_id in range(1, num_people + 1):
+        photos = []
+        meta = {}
+        for _ in range(rng.randint(1, photos_per_person)):
+            path, pool_meta = rng.choice(pool)
+            photos.append(path)
+            meta[path] = dict(pool_meta, uploaded_at=(
+                base + timedelta(minutes=rng.randrange(500_000))).isoformat(timespec='seconds'))
+        country = rng.choice(COUNTRIES)
+        meetings = sorted(({"date": random_day(rng).isoformat(), "location": rng.choice(LOCATIONS)}
+                           for _ in range(rng.randint(1, meetings_per_person))),
+                          key=lambda m: m['date'])
+        people.append({
+            "id": person_id,
+            "name": random_name(rng),
+            "photos": photos,
+            "photo_meta": meta,
+            "cover_photo": max(photos, key=lambda p: meta[p]['uploaded_at']),
+            "country": country,
+            "state": rng.choice(US_STATES) if country == 'United States' else None,
+            "meetings": meetings,
+        })
+
+    if num_events is None:
+        num_events = max(1, num_people // 20)
+    events = []
+    for event_id in range(1, num_events + 1):
+        chosen = [rng.choice(pool) for _ in range(rng.randint(1, photos_per_event))]
+        events.append({
+            "id": event_id,
+            "name": f"{rng.choice(LOCATIONS)} {rng.randint(2019, 2025)}",
+            "date": random_day(rng).isoformat(),
+            "photos": [path for path, _ in chosen],
+            "photo_meta": dict(chosen),
+        })
+    return people, events
+
+
+def write_json(people, events, root):
+    with open(os.path.join(root, 'people_data.json'), 'w') as f:
+        json.dump(people, f)
+    with open(os.path.join(root, 'events_data.json'), 'w') as f:
+        json.dump(events, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--people', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', required=True, help="directory to write the data set into")
+    parser.add_argument('--format', choices=['json', 'sqlite'], default='sqlite')
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    people, events = generate(args.people, args.out, seed=args.seed, num_events=args.events)
+    if args.format == 'json':
+        write_json(people, events, args.out)
+    else:
+        from storage import SQLiteStore
+        store = SQLiteStore(os.path.join(args.out, 'app_data.db'))
+        store.set_meta('migrated_from_json', '1')
+        for person in people:
+            store.add_person(person)
+        for event in events:
+            store.add_event(event)
+    print(f"Wrote {len(people)} people and {len(events)} events to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
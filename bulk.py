@@ -0,0 +1,368 @@
+"""Bulk import and export of people, meetings and photos.
+
+    python bulk.py import people.csv --photos photos.zip
+    python bulk.py export people.jsonl --photos exported_photos/
+
+Input is streamed record by record, photos are processed in the ingest
+process pool with a bounded number in flight, and progress is checkpointed
+after every chunk, so an interrupted import picks up where it stopped
+(``--restart`` starts over).  Records are applied idempotently: a photo or
+meeting a person already has is not added twice, so replaying a chunk after
+a crash is harmless.
+
+Formats, chosen by file extension:
+
+* JSONL: one person per line, shaped like the app's records:
+  ``{"name": ..., "country": ..., "state": ..., "photos": ["a.jpg"],
+  "meetings": [{"date": "2024-01-31", "location": ...}]}``
+* CSV: columns ``name, country, state, date, location, photos``, one
+  meeting per row; ``photos`` holds ``;``-separated file names.  Rows with
+  the same name are merged into one person.
+
+Records are matched to people already stored by name (ignoring case and
+accents).  Photo names are relative to ``--photos``, a directory or a zip
+file.  The export writes the same formats, with photos copied into a
+directory.  Data goes to the store the app is configured with
+(``STORAGE_BACKEND``, ``DATA_DB_PATH``, ``IMAGE_STORE_DIR``); a running app
+picks the changes up on its own.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import shutil
+import sys
+import time
+import zipfile
+
+import photo_meta
+from image_store import ImageStore, derivative_files, is_blob_path
+from ingest import ingest_iter
+from names import normalize_name
+from storage import open_store
+
+CHUNK_SIZE = 256
+CSV_FIELDS = ['name', 'country', 'state', 'date', 'location', 'photos']
+
+
+def _format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    raise SystemExit(f"Can't tell the format of {path}; use a .csv or .jsonl file")
+
+
+def read_records(path):
+    """Yield person records from a CSV or JSONL file, one at a time"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if _format(path) == 'jsonl':
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        for row in csv.DictReader(f):
+            yield {
+                "name": row['name'],
+                "country": row.get('country') or None,
+                "state": row.get('state') or None,
+                "photos": [p.strip() for p in (row.get('photos') or '').split(';') if p.strip()],
+                "meetings": ([{"date": row['date'], "location": row.get('location') or ""}]
+                             if row.get('date') else []),
+            }
+
+
+class PhotoSource:
+    """One photo of the input, read only when the ingest pool asks for it"""
+
+    def __init__(self, photos, name):
+        self.photos = photos
+        self.name = name
+
+    def getvalue(self):
+        return self.photos.read(self.name)
+
+
+class PhotoDirectory:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def read(self, name):
+        path = os.path.abspath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"{name} is outside the photo directory")
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+class PhotoZip:
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path)
+
+    def read(self, name):
+        return self.zip.read(name)
+
+
+def open_photos(path):
+    if path is None:
+        return None
+    if zipfile.is_zipfile(path):
+        return PhotoZip(path)
+    if os.path.isdir(path):
+        return PhotoDirectory(path)
+    raise SystemExit(f"{path} is neither a directory nor a zip file")
+
+
+class Checkpoint:
+    """Progress of an import or export, tied to the input file it reads (if any)"""
+
+    def __init__(self, path, source=None):
+        self.path = path
+        self.source = None
+        if source:
+            stat = os.stat(source)
+            self.source = {"input": os.path.abspath(source), "size": stat.st_size,
+                           "mtime_ns": stat.st_mtime_ns}
+        self.state = {}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return self.state
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get('source') != self.source:
+            raise SystemExit(f"{self.path} belongs to another version of the input; "
+                             "use --restart to start over")
+        self.state = state
+        return state
+
+    def save(self, **state):
+        self.state.update(state, source=self.source)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Importer:
+    def __init__(self, store, image_store, photos):
+        self.store = store
+        self.image_store = image_store
+        self.photos = photos
+        # Normalized name -> id of everyone stored; a person's record is read
+        # when a record for them comes up, so memory doesn't grow with their photos
+        self.person_ids = {normalize_name(p['name']): p['id'] for p in store.iter_people()}
+        self.imported = {"people": 0, "photos": 0, "meetings": 0}
+        self.errors = []
+
+    def _new_person(self, record):
+        country = record.get('country') or 'United States'
+        return {
+            "name": record['name'],
+            "photos": [],
+            "photo_meta": {},
+            "cover_photo": None,
+            "country": country,
+            "state": record.get('state') if country == 'United States' else None,
+            "meetings": [],
+        }
+
+    def apply(self, record, photos):
+        """Add ``record`` with its processed ``photos`` (``[(path, meta)]``)"""
+        key = normalize_name(record['name'])
+        person_id = self.person_ids.get(key)
+        person = self.store.get_person(person_id) if person_id is not None else None
+        is_new = person is None
+        if is_new:
+            person = self._new_person(record)
+
+        for path, meta in photos:
+            if path in person['photos']:
+                # Already there (a replayed chunk or a duplicate photo)
+                self.image_store.release(path)
+                continue
+            photo_meta.add_photo(person, path, meta)
+            if not is_new:
+                self.store.add_photo(person, path)
+            self.imported['photos'] += 1
+
+        for meeting in record.get('meetings', []):
+            meeting = {"date": meeting['date'], "location": meeting.get('location') or ""}
+            if meeting in person['meetings']:
+                continue
+            person['meetings'].append(meeting)
+            person['meetings'].sort(key=lambda x: x['date'])
+            if not is_new:
+                self.store.add_meeting(person, meeting)
+            self.imported['meetings'] += 1
+
+        if is_new:
+            self.store.add_person(person)
+            self.person_ids[key] = person['id']
+            self.imported['people'] += 1
+
+    def import_chunk(self, records):
+        sources = [(r, PhotoSource(self.photos, name))
+                   for r, record in enumerate(records) for name in record.get('photos', [])]
+        if sources and self.photos is None:
+            raise SystemExit("The input names photos; pass --photos")
+        photos = [[] for _ in records]
+        for i, photo, error in ingest_iter([s for _, s in sources], self.image_store):
+            record_index, source = sources[i]
+            if error is None:
+                photos[record_index].append((i, photo))
+            else:
+                self.errors.append((records[record_index]['name'], source.name, str(error)))
+                print(f"Skipped {source.name} ({records[record_index]['name']}): {error}",
+                      file=sys.stderr)
+        for record, record_photos in zip(records, photos):
+            # Keep the input order of each person's photos
+            self.apply(record, [photo for _, photo in sorted(record_photos, key=lambda p: p[0])])
+
+
+def run_import(args):
+    store = open_store()
+    importer = Importer(store, ImageStore(), open_photos(args.photos))
+    checkpoint = Checkpoint(args.checkpoint or args.input + '.checkpoint', args.input)
+    if args.restart:
+        checkpoint.remove()
+    done = checkpoint.load().get('records', 0)
+    if done:
+        print(f"Resuming after {done} records", file=sys.stderr)
+
+    started = time.perf_counter()
+    records = itertools.islice(read_records(args.input), done, None)
+    while True:
+        chunk = list(itertools.islice(records, args.chunk_size))
+        if not chunk:
+            break
+        importer.import_chunk(chunk)
+        done += len(chunk)
+        checkpoint.save(records=done)
+        elapsed = time.perf_counter() - started
+        print(f"{done} records, {importer.imported['photos']} photos "
+              f"({importer.imported['photos'] / elapsed:.1f}/s), {len(importer.errors)} errors",
+              file=sys.stderr)
+    checkpoint.remove()
+    print(json.dumps(dict(importer.imported, records=done, errors=len(importer.errors))))
+
+
+def export_source(path):
+    """The largest version stored of a photo: the original upload if it was kept"""
+    derivatives = {os.path.splitext(os.path.splitext(p)[0])[1][1:]: p for p in derivative_files(path)}
+    return derivatives.get('original') or derivatives.get('medium') or path
+
+
+def export_name(person, path):
+    """File name of a photo in the export; blobs are unique by their hash already"""
+    name = os.path.basename(path)
+    return name if is_blob_path(path) else f"{person['id']}_{name}"
+
+
+def export_record(person, photo_names):
+    return {
+        "name": person['name'],
+        "country": person.get('country'),
+        "state": person.get('state'),
+        "photos": photo_names,
+        "meetings": [{"date": m['date'], "location": m.get('location')} for m in person['meetings']],
+    }
+
+
+def write_record(f, fmt, record):
+    if fmt == 'jsonl':
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return
+    writer = csv.DictWriter(f, CSV_FIELDS)
+    # One row per meeting; the photos go on the first row
+    meetings = record['meetings'] or [{"date": "", "location": ""}]
+    for i, meeting in enumerate(meetings):
+        writer.writerow({
+            "name": record['name'],
+            "country": record['country'] or "",
+            "state": record['state'] or "",
+            "date": meeting['date'],
+            "location": meeting.get('location') or "",
+            "photos": ';'.join(record['photos']) if i == 0 else "",
+        })
+
+
+def copy_photo(path, destination):
+    if os.path.exists(destination):
+        return
+    temp_path = destination + '.tmp'
+    shutil.copyfile(path, temp_path)
+    os.replace(temp_path, destination)
+
+
+def run_export(args):
+    store = open_store()
+    fmt = _format(args.output)
+    if args.photos:
+        os.makedirs(args.photos, exist_ok=True)
+    checkpoint = Checkpoint(args.checkpoint or args.output + '.checkpoint')
+    if args.restart or not os.path.exists(args.output):
+        checkpoint.remove()
+    state = checkpoint.load()
+
+    exported = state.get('people', 0)
+    with open(args.output, 'a+', newline='', encoding='utf-8') as f:
+        # Drop whatever was written after the last checkpoint
+        f.truncate(state.get('offset', 0))
+        f.seek(0, os.SEEK_END)
+        if fmt == 'csv' and not state:
+            csv.DictWriter(f, CSV_FIELDS).writeheader()
+        last_id = state.get('last_id', 0)
+        for person in store.iter_people(after_id=last_id):
+            names = []
+            for path in person['photos']:
+                if not person['photo_meta'].get(path, {}).get('ok', True) or not os.path.exists(path):
+                    continue
+                source = export_source(path)
+                name = export_name(person, source)
+                if args.photos:
+                    copy_photo(source, os.path.join(args.photos, name))
+                names.append(name)
+            write_record(f, fmt, export_record(person, names))
+            exported += 1
+            last_id = person['id']
+            if exported % args.chunk_size == 0:
+                f.flush()
+                os.fsync(f.fileno())
+                checkpoint.save(people=exported, last_id=last_id, offset=f.tell())
+                print(f"{exported} people", file=sys.stderr)
+    checkpoint.remove()
+    print(json.dumps({"people": exported}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    importer = commands.add_parser('import', help="add people from a CSV/JSONL file")
+    importer.add_argument('input')
+    importer.add_argument('--photos', help="directory or zip file the photo names are relative to")
+    exporter = commands.add_parser('export', help="write every person to a CSV/JSONL file")
+    exporter.add_argument('output')
+    exporter.add_argument('--photos', help="directory to copy the photos into")
+    for command in (importer, exporter):
+        command.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                             help="records between checkpoints")
+        command.add_argument('--checkpoint', help="checkpoint file (default: next to the data file)")
+        command.add_argument('--restart', action='store_true', help="ignore an earlier checkpoint")
+    args = parser.parse_args()
+    if args.command == 'import':
+        run_import(args)
+    else:
+        run_export(args)
+
+
+if __name__ == '__main__':
+    main()
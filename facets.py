@@ -0,0 +1,97 @@
+"""Filters over the people and events, answered from indexes.
+
+Filtering used to mean a pass over every person and their meetings on each
+rerun.  Every filter now maps to a set of ids taken from an index that is
+kept up to date as records change, and the filters combine by intersecting
+those sets, smallest first:
+
+* country and US state: the people per country and state of ``LocationIndex``
+* meeting location: the people per location of ``MeetingTimeline``
+* met between two dates and not seen since a date: the date-sorted meetings
+  and last-seen days of ``MeetingTimeline`` (a binary search each)
+* event name and date: ``EventIndex`` here, which also keeps the gallery's
+  most-recent-first order so it is not sorted again on every rerun
+"""
+import bisect
+
+from names import normalize_name
+
+
+def intersect(sets):
+    """Ids in every one of ``sets`` (sets, dicts or key views); None stands for no filter.
+
+    Returns None when no filter is given.
+    """
+    sets = sorted((s for s in sets if s is not None), key=len)
+    if not sets:
+        return None
+    result = set(sets[0])
+    for ids in sets[1:]:
+        result = {item for item in result if item in ids}
+        if not result:
+            break
+    return result
+
+
+def _discard(pairs, pair):
+    i = bisect.bisect_left(pairs, pair)
+    if i < len(pairs) and pairs[i] == pair:
+        del pairs[i]
+
+
+class EventIndex:
+    """Events by date and by the words of their name"""
+
+    def __init__(self, events=()):
+        # Sorted (date, event id) and (word, event id) pairs
+        self._by_date = []
+        self._words = []
+        # event id -> (date, words) it is filed under
+        self._keys = {}
+        for event in events:
+            self.add(event, keep_sorted=False)
+        self._by_date.sort()
+        self._words.sort()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, event, keep_sorted=True):
+        date = event.get('date') or ''
+        words = set(normalize_name(event['name']).split())
+        self._keys[event['id']] = (date, words)
+        insert = bisect.insort if keep_sorted else list.append
+        insert(self._by_date, (date, event['id']))
+        for word in words:
+            insert(self._words, (word, event['id']))
+
+    def remove(self, event_id):
+        keys = self._keys.pop(event_id, None)
+        if keys is None:
+            return
+        date, words = keys
+        _discard(self._by_date, (date, event_id))
+        for word in words:
+            _discard(self._words, (word, event_id))
+
+    def clear(self):
+        self.__init__()
+
+    def named(self, query):
+        """Ids of the events with a word of their name starting with each word of ``query``"""
+        sets = []
+        for word in set(normalize_name(query).split()):
+            ids = set()
+            i = bisect.bisect_left(self._words, (word,))
+            while i < len(self._words) and self._words[i][0].startswith(word):
+                ids.add(self._words[i][1])
+                i += 1
+            sets.append(ids)
+        return intersect(sets)
+
+    def between(self, start=None, end=None):
+        """Ids of the events dated ``start`` to ``end`` (both included), most recent first"""
+        lo = bisect.bisect_left(self._by_date, (str(start),)) if start else 0
+        hi = (bisect.bisect_right(self._by_date, (str(end), float('inf'))) if end
+              else len(self._by_date))
+        return [event_id for _, event_id in reversed(self._by_date[lo:hi])]
@@ -0,0 +1,109 @@
+"""Build the map geometry bundled with the app from TopoJSON sources.
+
+The maps draw only the countries the app offers and the US states, so the
+bundled GeoJSON holds just those shapes, with coordinates rounded to
+``PRECISION`` decimal (about 10 km, under a pixel at the zoom the maps
+open at) to keep what is sent to the browser small.  The sources are Natural Earth world and US states
+topologies (public domain), e.g. the ``WorldMap.json`` and
+``USStatesMap.json`` that ship with bqplot::
+
+    python geo/build_geo.py WorldMap.json USStatesMap.json
+
+writes ``geo/countries.geojson`` (features keyed by ISO-3 code) and
+``geo/us_states.geojson`` (keyed by state name).
+"""
+import argparse
+import json
+import os
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PRECISION = 1
+# ISO 3166 numeric -> alpha-3 of the countries in the app's COUNTRIES
+COUNTRY_IDS = {840: 'USA', 124: 'CAN', 484: 'MEX', 826: 'GBR'}
+# FIPS codes of the 50 states and DC (the rest are territories)
+MAX_STATE_FIPS = 56
+
+
+def decode_arcs(topology):
+    """Absolute coordinates of every arc of a quantized topology"""
+    transform = topology.get('transform')
+    arcs = []
+    for arc in topology['arcs']:
+        points, x, y = [], 0, 0
+        for dx, dy in arc:
+            if transform:
+                x, y = x + dx, y + dy
+                (sx, sy), (tx, ty) = transform['scale'], transform['translate']
+                points.append([x * sx + tx, y * sy + ty])
+            else:
+                points.append([dx, dy])
+        arcs.append(points)
+    return arcs
+
+
+def _ring(arcs, indexes):
+    ring = []
+    for index in indexes:
+        points = arcs[index] if index >= 0 else arcs[~index][::-1]
+        # Consecutive arcs share their end point
+        ring.extend(points[1:] if ring else points)
+    rounded = []
+    for x, y in ring:
+        point = [round(x, PRECISION), round(y, PRECISION)]
+        if not rounded or rounded[-1] != point:
+            rounded.append(point)
+    if rounded[0] != rounded[-1]:
+        rounded.append(rounded[0])
+    return rounded
+
+
+def to_geometry(arcs, geometry):
+    if geometry['type'] == 'Polygon':
+        rings = [_ring(arcs, ring) for ring in geometry['arcs']]
+        return {'type': 'Polygon', 'coordinates': [r for r in rings if len(r) >= 4]}
+    if geometry['type'] == 'MultiPolygon':
+        polygons = [[r for r in (_ring(arcs, ring) for ring in polygon) if len(r) >= 4]
+                    for polygon in geometry['arcs']]
+        return {'type': 'MultiPolygon', 'coordinates': [p for p in polygons if p]}
+    raise ValueError(f"Unsupported geometry {geometry['type']}")
+
+
+def _name(geometry):
+    return (geometry.get('properties') or {}).get('name')
+
+
+def features(path, key):
+    """GeoJSON features of the ``subunits`` of a topology, ``key(geometry)`` giving their id"""
+    with open(path) as f:
+        topology = json.load(f)
+    arcs = decode_arcs(topology)
+    result = []
+    for geometry in topology['objects']['subunits']['geometries']:
+        feature_id = key(geometry)
+        if feature_id is not None and geometry.get('arcs'):
+            result.append({'type': 'Feature', 'id': feature_id,
+                           'properties': {'name': _name(geometry)},
+                           'geometry': to_geometry(arcs, geometry)})
+    return sorted(result, key=lambda feature: feature['id'])
+
+
+def write(name, collection):
+    path = os.path.join(HERE, name)
+    with open(path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': collection}, f, separators=(',', ':'))
+    print(f"{path}: {len(collection)} features, {os.path.getsize(path)} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the bundled map geometry")
+    parser.add_argument('world', help="world TopoJSON with ISO numeric ids")
+    parser.add_argument('states', help="US states TopoJSON with FIPS ids and names")
+    args = parser.parse_args()
+    write('countries.geojson', features(args.world, lambda g: COUNTRY_IDS.get(g.get('id'))))
+    write('us_states.geojson', features(
+        args.states,
+        lambda g: _name(g) if g.get('id') and int(g['id']) <= MAX_STATE_FIPS else None))
+
+
+if __name__ == '__main__':
+    main()
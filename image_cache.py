@@ -0,0 +1,124 @@
+"""Encoded image bytes kept in memory for every session.
+
+The grid, the event gallery and the modal draw the same few photos on every
+rerun, and every session used to read them from disk again each time.
+``ImageCache`` keeps the file contents of recently drawn photos, keyed by
+path and modification time (a file changed on disk is read again), bounded
+by total bytes with least-recently-used eviction.
+
+    IMAGE_CACHE_MB=64   memory for cached photos
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_CACHE_BYTES = int(float(os.environ.get('IMAGE_CACHE_MB', 64)) * 1024 * 1024)
+PREFETCH_WORKERS = 2
+
+
+class ImageCache:
+    def __init__(self, max_bytes=IMAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetched = 0
+        # path -> (mtime_ns, bytes), least recently used first
+        self._entries = OrderedDict()
+        self._loading = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _cached(self, path, mtime):
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == mtime:
+            self._entries.move_to_end(path)
+            return entry[1]
+        return None
+
+    def _store(self, path, mtime, data):
+        if len(data) > self.max_bytes:
+            return
+        old = self._entries.pop(path, None)
+        if old is not None:
+            self.size -= len(old[1])
+        self._entries[path] = (mtime, data)
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def get(self, path):
+        """Contents of the file at ``path``; raises ``OSError`` if it can't be read"""
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            data = self._cached(path, mtime)
+            if data is not None:
+                self.hits += 1
+                return data
+            self.misses += 1
+        with open(path, 'rb') as f:
+            data = f.read()
+        with self._lock:
+            self._store(path, mtime, data)
+        return data
+
+    def _prefetch_one(self, path):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return
+        finally:
+            with self._lock:
+                self._loading.discard(path)
+        with self._lock:
+            self._store(path, mtime, data)
+            self.prefetched += 1
+
+    def prefetch(self, paths):
+        """Read ``paths`` into the cache in the background"""
+        with self._lock:
+            todo = [p for p in paths if p not in self._entries and p not in self._loading]
+            self._loading.update(todo)
+            if todo and self._executor is None:
+                self._executor = ThreadPoolExecutor(PREFETCH_WORKERS, thread_name_prefix='prefetch')
+        for path in todo:
+            self._executor.submit(self._prefetch_one, path)
+
+    def discard(self, path):
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self.size -= len(entry[1])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "prefetched": self.prefetched,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def metrics(self):
+        """``[(name, type, help, value)]`` for the Prometheus export"""
+        stats = self.stats()
+        return [
+            ("app_image_cache_hits_total", "counter", "Photos served from memory.", stats['hits']),
+            ("app_image_cache_misses_total", "counter", "Photos read from disk.", stats['misses']),
+            ("app_image_cache_prefetched_total", "counter", "Photos read ahead of time.",
+             stats['prefetched']),
+            ("app_image_cache_evictions_total", "counter", "Photos dropped to stay in budget.",
+             stats['evictions']),
+            ("app_image_cache_bytes", "gauge", "Memory used by cached photos.", stats['bytes']),
+        ]
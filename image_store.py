@@ -0,0 +1,266 @@
+"""Content-addressed store for processed images.
+
+A processed image is saved once under the SHA-256 of its encoded bytes,
+sharded as ``images/ab/cd/abcd....webp`` (``.jpg`` for older photos).
+Uploading the same photo again, for the same or another person or event,
+only adds a reference; the file is deleted when its last reference is
+released.  User-supplied names never end up in file paths.
+
+New photos are stored as WebP.  Next to a blob live its derivatives, named
+after it (``abcd....medium.webp``, ``abcd....original.jpg``): other sizes of
+the same photo, written before the blob and deleted with it.  The blob
+itself is the thumbnail; records only ever refer to it.
+"""
+import glob
+import hashlib
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+IMAGE_STORE_DIR = os.environ.get('IMAGE_STORE_DIR', 'images')
+JPEG_QUALITY = 90
+WEBP_QUALITY = int(os.environ.get('WEBP_QUALITY', 80))
+# Derivatives a blob can have, besides itself
+DERIVATIVES = ('medium', 'original')
+
+
+def encode_jpeg(img, quality=JPEG_QUALITY):
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def encode_webp(img, quality=WEBP_QUALITY):
+    buffer = io.BytesIO()
+    # method 4 of 0-6: most of the size win of the slower methods
+    img.save(buffer, format='WEBP', quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def blob_path(digest, root=IMAGE_STORE_DIR, ext='jpg'):
+    return f"{root}/{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def is_blob_path(path, root=IMAGE_STORE_DIR):
+    """Whether ``path`` has the layout of a blob in the store under ``root``"""
+    prefix = root.rstrip('/') + '/'
+    if not path.startswith(prefix):
+        return False
+    parts = path[len(prefix):].split('/')
+    digest = parts[-1].split('.')[0]
+    return (len(parts) == 3 and len(digest) == 64
+            and parts[0] == digest[:2] and parts[1] == digest[2:4])
+
+
+def derivative_path(path, name, ext='webp'):
+    """Path of the ``name`` derivative of the blob at ``path``"""
+    return f"{os.path.splitext(path)[0]}.{name}.{ext}"
+
+
+def derivative_of(path):
+    """The stem (path without extension) of the blob ``path`` is a derivative of, or None"""
+    stem, ext = os.path.splitext(path)
+    stem, name = os.path.splitext(stem)
+    return stem if ext and name[1:] in DERIVATIVES else None
+
+
+def derivative_files(path):
+    """Paths of the derivatives stored for the blob ``path``"""
+    stem = os.path.splitext(path)[0]
+    return [p for p in glob.glob(glob.escape(stem) + '.*.*') if derivative_of(p) == stem]
+
+
+def _write_file(path, data):
+    """Write ``data`` to ``path`` through a temporary file and a rename"""
+    if os.path.exists(path):
+        return
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_blob(data, root=IMAGE_STORE_DIR, ext='jpg', derivatives=()):
+    """Write ``data`` under its content hash and return the path.
+
+    ``derivatives`` are ``(name, data, ext)`` written next to it first, so a
+    blob that exists always has its derivatives.  Safe to call from several
+    processes at once: files are written to a temporary name and renamed
+    into place, and identical content always produces an identical file.
+    A blob that exists is not written again, but it may still be deleted
+    before the caller's ``add_ref``, which tells whether it is still there.
+    """
+    path = blob_path(hashlib.sha256(data).hexdigest(), root, ext)
+    if os.path.exists(path):
+        return path
+    for name, derivative, derivative_ext in derivatives:
+        _write_file(derivative_path(path, name, derivative_ext), derivative)
+    _write_file(path, data)
+    return path
+
+
+def remove_blob(path):
+    """Delete a blob and its derivatives; returns whether the blob existed"""
+    for derivative in derivative_files(path):
+        os.remove(derivative)
+    if os.path.exists(path):
+        os.remove(path)
+        return True
+    return False
+
+
+class ImageStore:
+    """Reference-counted blobs; the counts live in ``{root}/refs.db``"""
+
+    def __init__(self, root=IMAGE_STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, 'refs.db'),
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS blobs ('
+            'path TEXT PRIMARY KEY, refcount INTEGER NOT NULL, size INTEGER)')
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(blobs)')]
+        if 'touched_at' not in columns:
+            # When the count last changed; the integrity scanner leaves
+            # recently touched blobs alone
+            self._conn.execute('ALTER TABLE blobs ADD COLUMN touched_at REAL')
+
+    def add_ref(self, path):
+        """Take a reference to ``path``; returns whether its file exists.
+
+        If it doesn't, the last reference was released (and the file
+        deleted) after the caller found it, so the caller writes it again;
+        with this reference held it is not deleted any more.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                size = os.path.getsize(path) if os.path.exists(path) else None
+                self._conn.execute(
+                    'INSERT INTO blobs (path, refcount, size, touched_at) VALUES (?, 1, ?, ?) '
+                    'ON CONFLICT (path) DO UPDATE SET refcount = refcount + 1, '
+                    'touched_at = excluded.touched_at',
+                    (path, size, time.time()))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return size is not None
+
+    def refcount(self, path):
+        with self._lock:
+            row = self._conn.execute('SELECT refcount FROM blobs WHERE path = ?', (path,)).fetchone()
+        return row[0] if row else 0
+
+    def release(self, path):
+        """Drop one reference to ``path``; returns True if the file was deleted.
+
+        Paths from before the store existed (``images/{name}_{timestamp}.jpg``)
+        belong to exactly one record and are deleted right away.  Untracked
+        blob paths are left alone.
+        """
+        if not is_blob_path(path, self.root):
+            if os.path.exists(path):
+                os.remove(path)
+                return True
+            return False
+
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    'SELECT refcount FROM blobs WHERE path = ?', (path,)).fetchone()
+                if row is None:
+                    self._conn.execute('COMMIT')
+                    return False
+                if row[0] > 1:
+                    self._conn.execute(
+                        'UPDATE blobs SET refcount = refcount - 1, touched_at = ? WHERE path = ?',
+                        (time.time(), path))
+                    self._conn.execute('COMMIT')
+                    return False
+                self._conn.execute('DELETE FROM blobs WHERE path = ?', (path,))
+                # Remove the file inside the transaction: an add_ref of the same
+                # content either came first (and the count was not 1) or runs
+                # after this commits and finds the file gone
+                remove_blob(path)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return True
+
+    def counts(self):
+        """``{path: (refcount, touched_at)}`` of every tracked blob"""
+        with self._lock:
+            return {path: (refcount, touched_at) for path, refcount, touched_at in
+                    self._conn.execute('SELECT path, refcount, touched_at FROM blobs')}
+
+    def set_refcount(self, path, refcount, expected, before):
+        """Correct the count of ``path`` to ``refcount``.
+
+        Only applies if the count is still ``expected`` (``None``: untracked)
+        and it was not touched after ``before``, so uploads and deletes that
+        happened since the caller looked are not undone.  Returns whether it
+        applied.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    'SELECT refcount, touched_at FROM blobs WHERE path = ?', (path,)).fetchone()
+                if (row[0] if row else None) != expected or (row and (row[1] or 0) > before):
+                    self._conn.execute('COMMIT')
+                    return False
+                size = os.path.getsize(path) if os.path.exists(path) else None
+                self._conn.execute(
+                    'INSERT INTO blobs (path, refcount, size, touched_at) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (path) DO UPDATE SET refcount = excluded.refcount, '
+                    'touched_at = excluded.touched_at',
+                    (path, refcount, size, time.time()))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return True
+
+    def reclaim(self, path, before):
+        """Delete a photo file nothing refers to, with its count.
+
+        The file must be older than ``before`` and its count (if tracked) not
+        touched since, so a blob that was just written for an upload whose
+        record isn't saved yet is kept.  Works for pre-store paths as well.
+        Returns whether anything was deleted.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    'SELECT touched_at FROM blobs WHERE path = ?', (path,)).fetchone()
+                try:
+                    mtime = os.stat(path).st_mtime
+                except FileNotFoundError:
+                    mtime = None
+                if (row and (row[0] or 0) > before) or (mtime is not None and mtime > before):
+                    self._conn.execute('COMMIT')
+                    return False
+                self._conn.execute('DELETE FROM blobs WHERE path = ?', (path,))
+                remove_blob(path)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return row is not None or mtime is not None
@@ -0,0 +1,152 @@
+"""Image decoding and processing for uploads.
+
+Uploads only ever end up as squares of a few hundred pixels (one per size
+the app draws, see ``process_sizes``), so decoding works at reduced
+resolution: JPEGs are scaled by the decoder itself (``draft``) and other
+formats are shrunk with ``reduce()`` before cropping, which keeps the peak
+memory of a 48 MP phone photo to a few MB instead of a few hundred.
+"""
+import os
+from datetime import datetime
+
+from PIL import Image
+
+THUMBNAIL_SIZE = 300
+# Square drawn in the person modal; uploads smaller than this only get a thumbnail
+MEDIUM_SIZE = int(os.environ.get('MEDIUM_SIZE', 768))
+
+# Largest source image (in pixels, read from the header) we agree to decode
+MAX_UPLOAD_PIXELS = int(os.environ.get('MAX_UPLOAD_PIXELS', 100_000_000))
+# Largest decoded bitmap we agree to hold in memory after draft/reduce
+MAX_DECODE_BYTES = int(os.environ.get('MAX_DECODE_BYTES', 256 * 1024 * 1024))
+
+EXIF_ORIENTATION = 0x0112
+EXIF_DATETIME = 0x0132
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 0x9003
+ORIENTATION_TRANSPOSE = {
+    2: [Image.Transpose.FLIP_LEFT_RIGHT],
+    3: [Image.Transpose.ROTATE_180],
+    4: [Image.Transpose.FLIP_TOP_BOTTOM],
+    5: [Image.Transpose.TRANSPOSE],
+    6: [Image.Transpose.ROTATE_270],
+    7: [Image.Transpose.TRANSVERSE],
+    8: [Image.Transpose.ROTATE_90],
+}
+
+
+class ImageTooLargeError(ValueError):
+    """The upload exceeds MAX_UPLOAD_PIXELS or MAX_DECODE_BYTES"""
+
+
+def crop_center_square(image):
+    width, height = image.size
+    size = min(width, height)
+    left = (width - size) // 2
+    top = (height - size) // 2
+    right = left + size
+    bottom = top + size
+    return image.crop((left, top, right, bottom))
+
+
+def get_orientation(img):
+    """EXIF orientation tag (1 = upright) read without decoding pixels"""
+    try:
+        return img.getexif().get(EXIF_ORIENTATION, 1)
+    except Exception:
+        return 1
+
+
+def get_capture_time(img):
+    """EXIF capture time as an ISO string, or None"""
+    try:
+        exif = img.getexif()
+        value = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+        return datetime.strptime(value.strip('\x00 '), '%Y:%m:%d %H:%M:%S').isoformat()
+    except Exception:
+        return None
+
+
+def apply_orientation(img, orientation):
+    for method in ORIENTATION_TRANSPOSE.get(orientation, []):
+        img = img.transpose(method)
+    return img
+
+
+def open_reduced(image_file, min_side=THUMBNAIL_SIZE,
+                 max_pixels=None, max_decode_bytes=None):
+    """Decode ``image_file`` at the smallest resolution whose short side is
+    still at least ``min_side``.
+
+    Returns ``(image, info)``.  The reduced image no longer carries the EXIF
+    data, so ``info`` holds what is needed from it: ``orientation`` (to be
+    applied by the caller), ``captured_at``, the ``source_size`` and the
+    ``format``.
+    """
+    max_pixels = MAX_UPLOAD_PIXELS if max_pixels is None else max_pixels
+    max_decode_bytes = MAX_DECODE_BYTES if max_decode_bytes is None else max_decode_bytes
+
+    img = Image.open(image_file)
+    width, height = img.size
+    if width * height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image is {width}x{height}, more than the {max_pixels} pixel limit")
+    info = {
+        'orientation': get_orientation(img),
+        'captured_at': get_capture_time(img),
+        'source_size': img.size,
+        'format': img.format,
+    }
+
+    # JPEG: let the decoder scale by 1/2, 1/4 or 1/8 while decoding
+    if img.format == 'JPEG':
+        img.draft('RGB', (min_side, min_side))
+
+    width, height = img.size
+    bands = len(img.getbands())
+    if width * height * bands > max_decode_bytes:
+        raise ImageTooLargeError(
+            f"Decoding a {width}x{height} image needs more than {max_decode_bytes} bytes")
+
+    factor = min(width, height) // min_side
+    if factor > 1:
+        if img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        img = img.reduce(factor)
+    return img, info
+
+
+def process_sizes(image_file, sizes):
+    """Decode, orient and center-crop an upload once, then resize it to squares.
+
+    Returns ``({size: image}, info)`` with ``info`` as in ``open_reduced``.
+    The smallest size is always produced; larger ones only when the upload
+    has enough pixels for them, so nothing is scaled up.
+    """
+    sizes = sorted(sizes)
+    img, info = open_reduced(image_file, min_side=sizes[-1])
+    img = crop_center_square(img)
+    img = apply_orientation(img, info['orientation'])
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    source_side = min(info['source_size'])
+    images = {}
+    for size in reversed(sizes):
+        if size == sizes[0] or size <= source_side:
+            # Each size is resized from the previous, larger one
+            img = img.resize((size, size))
+            images[size] = img
+    return images, info
+
+
+def process_upload(image_file, size=THUMBNAIL_SIZE):
+    """Decode, orient, center-crop and resize an upload to a ``size`` square.
+
+    Returns ``(image, info)`` with ``info`` as in ``open_reduced``.
+    """
+    images, info = process_sizes(image_file, [size])
+    return images[size], info
+
+
+def process_image(image_file, size=THUMBNAIL_SIZE):
+    return process_upload(image_file, size)[0]
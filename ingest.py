@@ -0,0 +1,188 @@
+"""Batch ingestion of uploaded photos.
+
+Photos are decoded, cropped and resized in a process pool shared by all
+sessions, so a large "Add Event" upload uses every core instead of the
+Streamlit script thread.  Workers write straight into the content-addressed
+image store; references are taken in the calling process.  A worker that
+dies (a crash, the OOM killer) breaks the whole pool: it is replaced, and
+the uploads that were in flight are tried once more.
+"""
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from image_store import encode_webp, write_blob
+from imaging import MEDIUM_SIZE, THUMBNAIL_SIZE, process_sizes
+from photo_meta import new_photo_meta
+
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', os.cpu_count() or 1))
+# Keep the uploaded file as it was, next to the sizes the app draws
+KEEP_ORIGINALS = os.environ.get('KEEP_ORIGINALS', '') not in ('', '0')
+# Uploads held in memory for the pool at once, per worker
+IN_FLIGHT_PER_WORKER = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The process pool shared by every session, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: the Streamlit server is multi-threaded
+            _executor = ProcessPoolExecutor(
+                max_workers=INGEST_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _replace_executor(broken):
+    """A new pool in place of ``broken``, one of whose workers died"""
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+            broken.shutdown(wait=False, cancel_futures=True)
+    return get_executor()
+
+
+def process_to_blob(data, root):
+    """Worker entry point: process raw upload bytes into a blob under ``root``.
+
+    The blob is the thumbnail; the modal-sized square (and, with
+    ``KEEP_ORIGINALS``, the upload itself) are stored as its derivatives.
+    Returns ``(path, photo_meta)``.
+    """
+    images, info = process_sizes(io.BytesIO(data), [THUMBNAIL_SIZE, MEDIUM_SIZE])
+    derivatives = []
+    if MEDIUM_SIZE in images and MEDIUM_SIZE != THUMBNAIL_SIZE:
+        derivatives.append(('medium', encode_webp(images[MEDIUM_SIZE]), 'webp'))
+    if KEEP_ORIGINALS:
+        ext = (info['format'] or 'bin').lower().replace('jpeg', 'jpg')
+        derivatives.append(('original', data, ext))
+    thumbnail = images[THUMBNAIL_SIZE]
+    path = write_blob(encode_webp(thumbnail), root, 'webp', derivatives)
+    return path, new_photo_meta(path, thumbnail, info)
+
+
+def _add_ref(image_store, photo, data):
+    """Take the reference to the blob of ``photo``, writing it again if it is gone.
+
+    A worker doesn't write a blob that already exists, but its last
+    reference can be released, and the file deleted, before this one is
+    taken.  Returns the photo, which is ``photo`` unless it was written again.
+    """
+    if image_store.add_ref(photo[0]):
+        return photo
+    fresh = process_to_blob(data, image_store.root)
+    if fresh[0] != photo[0]:
+        image_store.add_ref(fresh[0])
+        image_store.release(photo[0])
+    return fresh
+
+
+def _read(upload):
+    if hasattr(upload, 'getvalue'):
+        return upload.getvalue()
+    upload.seek(0)
+    return upload.read()
+
+
+def ingest_iter(uploads, image_store, parallel=None):
+    """Process ``uploads`` into ``image_store``, yielding results as they finish.
+
+    Yields ``(index, photo, error)`` per upload, in completion order: ``photo``
+    is ``(path, photo_meta)`` and ``error`` None on success, the other way
+    round on failure.  One reference is taken per successful upload.
+    Uploads are read only when they are submitted, so a sequence of lazy
+    uploads keeps memory flat however long it is.
+    """
+    total = len(uploads)
+    if parallel is None:
+        parallel = total > 1 and INGEST_WORKERS > 1
+
+    if not parallel:
+        for i, upload in enumerate(uploads):
+            try:
+                data = _read(upload)
+                photo = _add_ref(image_store, process_to_blob(data, image_store.root), data)
+            except Exception as e:
+                yield i, None, e
+            else:
+                yield i, photo, None
+        return
+
+    executor = get_executor()
+    max_in_flight = INGEST_WORKERS * IN_FLIGHT_PER_WORKER
+    pending = {}
+    # Uploads already resubmitted after the pool broke
+    retried = set()
+
+    def submit(i, data):
+        nonlocal executor
+        try:
+            future = executor.submit(process_to_blob, data, image_store.root)
+        except BrokenProcessPool:
+            executor = _replace_executor(executor)
+            future = executor.submit(process_to_blob, data, image_store.root)
+        pending[future] = i, data
+
+    queue = iter(enumerate(uploads))
+    while True:
+        # Keep a bounded number of uploads in flight so memory stays flat
+        for i, upload in queue:
+            try:
+                data = _read(upload)
+            except Exception as e:
+                yield i, None, e
+                continue
+            submit(i, data)
+            if len(pending) >= max_in_flight:
+                break
+        if not pending:
+            break
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            i, data = pending.pop(future)
+            try:
+                photo = _add_ref(image_store, future.result(), data)
+            except BrokenProcessPool as e:
+                # Every upload in flight fails with the pool, not just the
+                # one that killed it; each gets one more try on a new pool
+                if i in retried:
+                    yield i, None, e
+                    continue
+                retried.add(i)
+                executor = _replace_executor(executor)
+                submit(i, data)
+            except Exception as e:
+                yield i, None, e
+            else:
+                yield i, photo, None
+
+
+def ingest_batch(uploads, image_store, progress=None, parallel=None):
+    """Process ``uploads`` into ``image_store`` and return ``(photos, errors)``.
+
+    One reference is taken per successful upload.  ``photos`` is a list of
+    ``(path, photo_meta)`` in the order of ``uploads``, without the files
+    that failed; ``errors`` is a list of
+    ``(upload_name, message)``.  ``progress`` is called as
+    ``progress(done, total)`` from the calling thread, so it can update
+    Streamlit elements.
+    """
+    total = len(uploads)
+    results = [None] * total
+    errors = []
+    for done, (i, photo, error) in enumerate(ingest_iter(uploads, image_store, parallel), 1):
+        if error is None:
+            results[i] = photo
+        else:
+            errors.append((getattr(uploads[i], 'name', str(i)), str(error)))
+        if progress:
+            progress(done, total)
+    return [p for p in results if p], errors
@@ -0,0 +1,370 @@
+"""Keeps the photo directories and the records that point into them in step.
+
+Files leak when a delete is interrupted, and records can point at files
+that are gone.  ``IntegrityScanner`` keeps a manifest of the photo
+directories and reconciles it with the people and events:
+
+* The manifest (``{IMAGE_STORE_DIR}/manifest.db``) remembers the files of
+  every directory with the directory's mtime.  Adding, renaming or removing
+  a file changes the mtime of its directory, so a scan only lists the
+  directories that changed since the last one.  A directory changed in the
+  last few seconds is listed again next time, as another change in the same
+  clock tick would not move its mtime.
+* Photos a record points at that are not in the manifest are marked
+  missing, so the galleries skip them, once they have been gone for
+  ``ORPHAN_GRACE_SECONDS`` (a drive mounted late is not a lost photo).
+  Record paths are matched to the manifest whatever their form (absolute,
+  ``./images/...``, through a symlink); paths outside the photo
+  directories are checked on disk.  Photos marked missing whose file is
+  back are shown again.
+* Files no record points at (nor at the blob they are a derivative of) are
+  deleted, and reference counts that don't
+  match the records are corrected, once they are older than
+  ``ORPHAN_GRACE_SECONDS`` (an upload writes its file before its record).
+
+The app runs a scan every ``SCAN_INTERVAL`` seconds in the background.
+From the command line::
+
+    python integrity.py            report drift without changing anything
+    python integrity.py --repair   fix it
+    python integrity.py --full     list every directory, ignoring the manifest
+
+    SCAN_INTERVAL=600           seconds between background scans (0 turns them off)
+    ORPHAN_GRACE_SECONDS=3600   age before an unreferenced file is deleted,
+                                or a gone photo marked missing
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+
+import photo_meta
+from image_store import ImageStore, derivative_of, is_blob_path
+
+SCAN_INTERVAL = float(os.environ.get('SCAN_INTERVAL', 600))
+ORPHAN_GRACE_SECONDS = float(os.environ.get('ORPHAN_GRACE_SECONDS', 3600))
+# Directories used for photos before the image store
+LEGACY_DIRS = ['event_images']
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+# A directory changed this recently may change again without a new mtime
+RACY_SECONDS = 2
+
+
+class Manifest:
+    """Files of the photo directories, listed again only when a directory changes"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS dirs ('
+                           'path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS files ('
+                           'path TEXT PRIMARY KEY, dir TEXT NOT NULL, size INTEGER)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS dangling ('
+                           'kind TEXT, record_id, path TEXT, since REAL, '
+                           'PRIMARY KEY (kind, record_id, path))')
+        self._conn.commit()
+        # dir -> [mtime_ns, subdirs, {path: size}]
+        rows = self._conn.execute('SELECT path, parent, mtime_ns FROM dirs').fetchall()
+        self.dirs = {path: [mtime_ns, [], {}] for path, _, mtime_ns in rows}
+        for path, parent, _ in rows:
+            if parent in self.dirs:
+                self.dirs[parent][1].append(path)
+        for path, directory, size in self._conn.execute('SELECT path, dir, size FROM files'):
+            if directory in self.dirs:
+                self.dirs[directory][2][path] = size
+
+    def files(self):
+        """``{path: size}`` of every photo file"""
+        return {path: size for _, _, files in self.dirs.values() for path, size in files.items()}
+
+    def _forget(self, directory):
+        entry = self.dirs.pop(directory, None)
+        if entry is None:
+            return
+        for subdir in entry[1]:
+            self._forget(subdir)
+        self._conn.execute('DELETE FROM dirs WHERE path = ?', (directory,))
+        self._conn.execute('DELETE FROM files WHERE dir = ?', (directory,))
+
+    def _list(self, directory, parent, mtime_ns, now):
+        subdirs, files = [], {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                path = f"{directory}/{entry.name}"
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(path)
+                elif (entry.is_file(follow_symlinks=False) and not entry.name.startswith('.')
+                      and entry.name.lower().endswith(PHOTO_EXTENSIONS)):
+                    files[path] = entry.stat(follow_symlinks=False).st_size
+        for gone in set(self.dirs.get(directory, [None, []])[1]) - set(subdirs):
+            self._forget(gone)
+        if now - mtime_ns / 1e9 < RACY_SECONDS:
+            mtime_ns = None
+        self.dirs[directory] = [mtime_ns, subdirs, files]
+        self._conn.execute('INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)',
+                           (directory, parent, mtime_ns))
+        self._conn.execute('DELETE FROM files WHERE dir = ?', (directory,))
+        self._conn.executemany('INSERT INTO files (path, dir, size) VALUES (?, ?, ?)',
+                               [(path, directory, size) for path, size in files.items()])
+
+    def update(self, roots, full=False):
+        """Bring the manifest up to date; returns ``(listed, skipped)`` directory counts"""
+        now = time.time()
+        listed = skipped = 0
+        pending = [(root, None) for root in roots]
+        while pending:
+            directory, parent = pending.pop()
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                self._forget(directory)
+                continue
+            entry = self.dirs.get(directory)
+            if full or entry is None or entry[0] != mtime_ns:
+                self._list(directory, parent, mtime_ns, now)
+                listed += 1
+            else:
+                skipped += 1
+            pending.extend((subdir, directory) for subdir in self.dirs[directory][1])
+        self._conn.commit()
+        return listed, skipped
+
+    def track_dangling(self, dangling, now):
+        """Remember since when each of ``dangling`` has been gone; returns ``{entry: since}``"""
+        seen = {(kind, record_id, path): since for kind, record_id, path, since
+                in self._conn.execute('SELECT kind, record_id, path, since FROM dangling')}
+        current = {entry: seen.get(entry, now) for entry in dangling}
+        self._conn.execute('DELETE FROM dangling')
+        self._conn.executemany('INSERT INTO dangling (kind, record_id, path, since) '
+                               'VALUES (?, ?, ?, ?)',
+                               [(*entry, since) for entry, since in current.items()])
+        self._conn.commit()
+        return current
+
+    def remove_file(self, path):
+        directory = os.path.dirname(path)
+        if directory in self.dirs:
+            self.dirs[directory][2].pop(path, None)
+        self._conn.execute('DELETE FROM files WHERE path = ?', (path,))
+        self._conn.commit()
+
+
+def manifest_key(path, roots):
+    """The manifest's key for ``path``, or None if it is outside ``roots``.
+
+    ``roots`` holds ``(absolute path, root)`` pairs; the key is spelled with
+    the root as the manifest lists it.
+    """
+    for resolved in (os.path.abspath(path), os.path.realpath(path)):
+        for base, root in roots:
+            if resolved.startswith(base + os.sep):
+                return root + '/' + resolved[len(base) + 1:].replace(os.sep, '/')
+    return None
+
+
+class StoreRecords:
+    """The records of a store, for scanning without the app's shared data"""
+
+    def __init__(self, store):
+        self.store = store
+        self._version = None
+        self.sync()
+
+    def sync(self):
+        """Reload if the store changed since it was last read; returns whether it did"""
+        version = self.store.data_version()
+        if version == self._version:
+            return False
+        self._version = version
+        self.people = self.store.load_people()
+        self.events = self.store.load_events()
+        return True
+
+    def mark_photo_missing(self, person_id, path):
+        for person in self.people:
+            if person['id'] == person_id:
+                photo_meta.mark_missing(person, path)
+                self.store.update_photo_meta(person, path)
+
+    def mark_event_photo_missing(self, event_id, path):
+        for event in self.events:
+            if event['id'] == event_id:
+                photo_meta.mark_missing(event, path)
+                self.store.update_event_photo_meta(event, path)
+
+    def mark_photo_found(self, person_id, path, meta):
+        for person in self.people:
+            if person['id'] == person_id:
+                photo_meta.mark_found(person, path, meta)
+                self.store.update_photo_meta(person, path)
+
+    def mark_event_photo_found(self, event_id, path, meta):
+        for event in self.events:
+            if event['id'] == event_id:
+                photo_meta.mark_found(event, path, meta)
+                self.store.update_event_photo_meta(event, path)
+
+
+class IntegrityScanner:
+    def __init__(self, data, image_store, roots=None, manifest_path=None,
+                 grace_seconds=ORPHAN_GRACE_SECONDS):
+        self.data = data
+        self.image_store = image_store
+        self.roots = roots or [image_store.root] + [d for d in LEGACY_DIRS if d != image_store.root]
+        self.manifest = Manifest(manifest_path or os.path.join(image_store.root, 'manifest.db'))
+        self.grace_seconds = grace_seconds
+        self.last_report = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def scan(self, repair=True, full=False):
+        """Reconcile the photo directories with the records; returns a report"""
+        with self._lock:
+            started = time.perf_counter()
+            now = time.time()
+            before = now - self.grace_seconds
+            # Take the records first: any photo they point at was written before.
+            # Another process (a bulk import) may have added records since the
+            # data was last synced, and their photos are not orphans.
+            self.data.sync()
+            people, events = self.data.people, self.data.events
+            listed, skipped = self.manifest.update(self.roots, full=full)
+            files = self.manifest.files()
+            roots = [(os.path.abspath(root), root) for root in self.roots]
+            roots += [(os.path.realpath(root), root) for root in self.roots]
+
+            references = Counter()
+            dangling = []
+            restored = []
+            for kind, records in (('person', people), ('event', events)):
+                for record in records:
+                    for path in record['photos']:
+                        key = path if path in files else manifest_key(path, roots)
+                        if key is None:
+                            # Not in a photo directory: only the disk can tell
+                            present = os.path.exists(path)
+                        else:
+                            references[key] += 1
+                            present = key in files
+                        missing = photo_meta.is_missing(record, path)
+                        if not present and not missing:
+                            dangling.append((kind, record['id'], path))
+                        elif present and missing:
+                            restored.append((kind, record['id'], path))
+            dangling_since = self.manifest.track_dangling(dangling, now)
+
+            # Derivatives go with their blob
+            stems = {os.path.splitext(path)[0] for path in references}
+            orphans = [path for path in files
+                       if path not in references and derivative_of(path) not in stems]
+            counts = self.image_store.counts()
+            drift = [(path, count, counts.get(path, (None,))[0])
+                     for path, count in references.items()
+                     if path in files and is_blob_path(path, self.image_store.root)
+                     and counts.get(path, (None,))[0] != count]
+            # Tracked blobs whose file is gone and no record wants
+            drift += [(path, 0, refcount) for path, (refcount, _) in counts.items()
+                      if path not in files and path not in references]
+
+            report = {
+                "scanned_at": time.time(),
+                "files": len(files),
+                "dirs_listed": listed,
+                "dirs_skipped": skipped,
+                "dangling": len(dangling),
+                "restored": len(restored),
+                "orphans": len(orphans),
+                "orphan_bytes": sum(files[path] or 0 for path in orphans),
+                "refcount_drift": len(drift),
+                "marked_missing": 0,
+                "marked_found": 0,
+                "reclaimed": 0,
+                "reclaimed_bytes": 0,
+                "refcounts_fixed": 0,
+            }
+            if repair:
+                for kind, record_id, path in dangling:
+                    if dangling_since[kind, record_id, path] > before:
+                        continue
+                    if kind == 'person':
+                        self.data.mark_photo_missing(record_id, path)
+                    else:
+                        self.data.mark_event_photo_missing(record_id, path)
+                    report['marked_missing'] += 1
+                # Photos marked missing whose file is back (a restored backup,
+                # a drive mounted again) are shown again once they decode
+                for kind, record_id, path in restored:
+                    meta = photo_meta.scan_photo_meta(path)
+                    if not meta['ok']:
+                        continue
+                    if kind == 'person':
+                        self.data.mark_photo_found(record_id, path, meta)
+                    else:
+                        self.data.mark_event_photo_found(record_id, path, meta)
+                    report['marked_found'] += 1
+                for path in orphans:
+                    if self.image_store.reclaim(path, before):
+                        self.manifest.remove_file(path)
+                        report['reclaimed'] += 1
+                        report['reclaimed_bytes'] += files[path] or 0
+                for path, count, refcount in drift:
+                    if path in files:
+                        fixed = self.image_store.set_refcount(path, count, refcount, before)
+                    else:
+                        fixed = self.image_store.reclaim(path, before)
+                    report['refcounts_fixed'] += fixed
+            report['seconds'] = time.perf_counter() - started
+            self.last_report = report
+            return report
+
+    def _run(self, interval):
+        while True:
+            try:
+                self.scan()
+            except Exception as e:
+                print(f"Integrity scan failed: {e}", file=sys.stderr)
+            time.sleep(interval)
+
+    def start(self, interval=SCAN_INTERVAL):
+        """Scan every ``interval`` seconds in a background thread"""
+        if self._thread is None and interval:
+            self._thread = threading.Thread(target=self._run, args=(interval,),
+                                            name='integrity-scan', daemon=True)
+            self._thread.start()
+
+    def metrics(self):
+        """``[(name, type, help, value)]`` for the Prometheus export"""
+        report = self.last_report
+        if report is None:
+            return []
+        return [
+            ("app_integrity_files", "gauge", "Photo files in the manifest.", report['files']),
+            ("app_integrity_dangling", "gauge", "Photos records point at that are gone.",
+             report['dangling']),
+            ("app_integrity_orphans", "gauge", "Photo files no record points at.", report['orphans']),
+            ("app_integrity_refcount_drift", "gauge", "Blob reference counts off from the records.",
+             report['refcount_drift']),
+            ("app_integrity_scan_seconds", "gauge", "Duration of the last scan.", report['seconds']),
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile the photo directories with the records")
+    parser.add_argument('--repair', action='store_true',
+                        help="mark dangling photos missing, delete orphans and fix reference counts")
+    parser.add_argument('--full', action='store_true', help="list every directory again")
+    parser.add_argument('--grace', type=float, default=ORPHAN_GRACE_SECONDS,
+                        help="seconds before an unreferenced file may be deleted")
+    args = parser.parse_args()
+
+    from storage import open_store
+    scanner = IntegrityScanner(StoreRecords(open_store()), ImageStore(), grace_seconds=args.grace)
+    print(json.dumps(scanner.scan(repair=args.repair, full=args.full), indent=2))
+
+
+if __name__ == '__main__':
+    main()
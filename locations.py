@@ -0,0 +1,204 @@
+"""Where people are from, kept up to date as people change.
+
+``LocationIndex`` holds the people per country and per US state.  It is
+updated when a person is added, edited or removed, and only rebuilds the
+map rows (and their digest, used as the cache key of the map figures) after
+such a change.
+
+The maps draw geometry bundled in ``geo/`` (the countries of ``COUNTRIES``
+and the US states, see ``geo/build_geo.py``), read once per process.  They
+are ``choroplethmap`` traces on the blank ``white-bg`` style: ``choropleth``
+traces make the browser fetch Plotly's topojson from its CDN even when given
+a GeoJSON, and other map styles fetch tiles, so neither works offline.
+"""
+import functools
+import hashlib
+import json
+import os
+
+GEO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'geo')
+
+# Dictionary of state abbreviations
+COUNTRIES = {
+    'United States': 'USA',
+    'Canada': 'CAN',
+    'Mexico': 'MEX',
+    'United Kingdom': 'GBR'
+}
+
+# For US states, we'll keep them as regions
+US_STATES = {
+    'Alabama': 'AL', 'Alaska': 'AK', 'Arizona': 'AZ', 'Arkansas': 'AR', 'California': 'CA',
+    'Colorado': 'CO', 'Connecticut': 'CT', 'Delaware': 'DE', 'Florida': 'FL', 'Georgia': 'GA',
+    'Hawaii': 'HI', 'Idaho': 'ID', 'Illinois': 'IL', 'Indiana': 'IN', 'Iowa': 'IA',
+    'Kansas': 'KS', 'Kentucky': 'KY', 'Louisiana': 'LA', 'Maine': 'ME', 'Maryland': 'MD',
+    'Massachusetts': 'MA', 'Michigan': 'MI', 'Minnesota': 'MN', 'Mississippi': 'MS', 'Missouri': 'MO',
+    'Montana': 'MT', 'Nebraska': 'NE', 'Nevada': 'NV', 'New Hampshire': 'NH', 'New Jersey': 'NJ',
+    'New Mexico': 'NM', 'New York': 'NY', 'North Carolina': 'NC', 'North Dakota': 'ND', 'Ohio': 'OH',
+    'Oklahoma': 'OK', 'Oregon': 'OR', 'Pennsylvania': 'PA', 'Rhode Island': 'RI', 'South Carolina': 'SC',
+    'South Dakota': 'SD', 'Tennessee': 'TN', 'Texas': 'TX', 'Utah': 'UT', 'Vermont': 'VT',
+    'Virginia': 'VA', 'Washington': 'WA', 'West Virginia': 'WV', 'Wisconsin': 'WI', 'Wyoming': 'WY'
+}
+
+
+class LocationIndex:
+    def __init__(self, countries, us_states, people=()):
+        self.countries = countries
+        self.us_states = us_states
+        self.by_country = {}
+        self.by_state = {}
+        # person id -> (country, state) it is currently counted under
+        self._located = {}
+        self.version = 0
+        self._rows_version = None
+        self._rows = []
+        self._digest = None
+        for person in people:
+            self.add(person)
+
+    @staticmethod
+    def _location(person):
+        country = person.get('country', 'Unknown')
+        return country, person.get('state') if country == 'United States' else None
+
+    def add(self, person):
+        country, state = self._location(person)
+        self.by_country.setdefault(country, {})[person['id']] = person['name']
+        if state:
+            self.by_state.setdefault(state, {})[person['id']] = person['name']
+        self._located[person['id']] = (country, state)
+        self.version += 1
+
+    def remove(self, person):
+        located = self._located.pop(person['id'], None)
+        if located is None:
+            return
+        country, state = located
+        self._discard(self.by_country, country, person['id'])
+        if state:
+            self._discard(self.by_state, state, person['id'])
+        self.version += 1
+
+    def update(self, person):
+        """Re-file a person after their name, country or state changed"""
+        located = self._location(person)
+        if (self._located.get(person['id']) == located
+                and self.by_country[located[0]].get(person['id']) == person['name']):
+            return
+        self.remove(person)
+        self.add(person)
+
+    def clear(self):
+        self.by_country.clear()
+        self.by_state.clear()
+        self._located.clear()
+        self.version += 1
+
+    @staticmethod
+    def _discard(groups, key, person_id):
+        names = groups.get(key)
+        if names is not None:
+            names.pop(person_id, None)
+            if not names:
+                del groups[key]
+
+    def _refresh(self):
+        if self._rows_version == self.version:
+            return
+        rows = []
+        for country, names in self.by_country.items():
+            rows.append({
+                'country': country,
+                'country_code': self.countries.get(country, ''),
+                'people': ', '.join(names.values()),
+                'count': len(names)
+            })
+            if country == 'United States':
+                for state, state_names in self.by_state.items():
+                    rows.append({
+                        'country': 'United States',
+                        'country_code': 'USA',
+                        'state': state,
+                        'state_code': self.us_states[state],
+                        'people': ', '.join(state_names.values()),
+                        'count': len(state_names)
+                    })
+        self._rows = rows
+        self._digest = hashlib.sha1(json.dumps(rows, sort_keys=True).encode()).hexdigest()
+        self._rows_version = self.version
+
+    def map_rows(self):
+        """Rows for the choropleth maps, one per country and one per US state"""
+        self._refresh()
+        return self._rows
+
+    def digest(self):
+        """Content hash of ``map_rows()``; equal data gives an equal digest"""
+        self._refresh()
+        return self._digest
+
+
+@functools.lru_cache(maxsize=None)
+def load_geometry(name):
+    """The bundled GeoJSON ``geo/{name}.geojson``, read once"""
+    with open(os.path.join(GEO_DIR, f'{name}.geojson')) as f:
+        return json.load(f)
+
+
+def _subset(geojson, ids):
+    """The features of ``geojson`` with the given ids, so only those are sent to the browser"""
+    ids = set(ids)
+    return {'type': 'FeatureCollection',
+            'features': [feature for feature in geojson['features'] if feature['id'] in ids]}
+
+
+def _outline(geojson):
+    """A light fill of ``geojson`` drawn under the choropleth, as the land"""
+    return [dict(source=geojson, type='fill', color='#e5ecf6', below='traces')]
+
+
+def build_map_figures(map_rows):
+    """World and US choropleths for the given ``map_rows()``"""
+    # pandas and plotly.express take a good part of a second to import,
+    # so only pay for them once a map is actually drawn
+    import pandas as pd
+    import plotly.express as px
+
+    df = pd.DataFrame(map_rows)
+    
+    # Create world map
+    countries = load_geometry('countries')
+    fig = px.choropleth_map(
+        df,
+        geojson=_subset(countries, df['country_code']),
+        locations='country_code',
+        color='count',
+        hover_data=['people'],
+        color_continuous_scale='Viridis',
+        labels={'count': 'Number of People', 'people': 'Names'},
+        map_style='white-bg',
+        center=dict(lat=45, lon=-65),  # Center roughly between North America and UK
+        zoom=1.4,
+    )
+    fig.update_layout(title_text='Coaches Met by Country', map_layers=_outline(countries))
+    
+    fig_us = None
+    if 'state' in df.columns:
+        us_data = df[(df['country_code'] == 'USA') & df['state'].notna()]
+    else:
+        us_data = df.iloc[:0]
+    if not us_data.empty:
+        fig_us = px.choropleth_map(
+            us_data,
+            geojson=_subset(load_geometry('us_states'), us_data['state']),
+            locations='state',
+            color='count',
+            hover_data=['people'],
+            color_continuous_scale='Viridis',
+            labels={'count': 'Number of People', 'people': 'Names'},
+            map_style='white-bg',
+            center=dict(lat=39, lon=-98),
+            zoom=2.4,
+        )
+        fig_us.update_layout(title_text='People Met by State (US)', map_layers=_outline(_subset(countries, ['USA'])))
+    return fig, fig_us
@@ -0,0 +1,255 @@
+"""Name lookup for "have I met you before?".
+
+Names are compared after Unicode normalization: accents are stripped,
+case is folded and whitespace collapsed, so "José", "jose" and " JOSE "
+are the same person.  Search combines prefix matches on any word of the
+name (a sorted list, found by bisection), names one edit from a short
+query (so "Jon" still finds "John") and fuzzy matches from a trigram
+index.  Edit distance decides what counts as "probably the same person":
+the trigram index finds the candidates for long names.  Short names, which a couple of edits can
+leave without a trigram in common ("Jhon" and "John"), are also indexed by
+the strings left after deleting a letter or two (as in SymSpell): two names
+within two edits of each other always leave one in common.
+"""
+import bisect
+import itertools
+import unicodedata
+
+# Fuzzy candidates come from the rarest trigrams of the query, stopping
+# once the candidate set would grow past this size
+CANDIDATE_BUDGET = 300
+MIN_SIMILARITY = 0.3
+# Search for a short name also finds names this many edits from it
+SEARCH_EDITS = 1
+# Names up to this long find the names a few edits away through their
+# deletions rather than their trigrams
+SHORT_NAME = 6
+# Deletions indexed per short name, so the most edits a short name lookup covers
+SHORT_EDITS = 2
+
+
+def normalize_name(name):
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split())
+
+
+def trigrams(normalized):
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def deletions(word, depth):
+    """``word`` and every string left after deleting up to ``depth`` of its letters"""
+    variants = frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        variants = variants | frontier
+    return variants
+
+
+def edit_distance(a, b, limit=None):
+    """Levenshtein distance; stops early once it exceeds ``limit``"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                                previous[j - 1] + (ca != cb)))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class NameIndex:
+    """People by id and by normalized name, with a trigram index for fuzzy search"""
+
+    def __init__(self, people=()):
+        self.people = {}
+        self._normalized = {}
+        self._grams = {}
+        self._exact = {}
+        self._trigrams = {}
+        # Deletion of a short normalized name -> the normalized names it comes from
+        self._deletes = {}
+        # Sorted (word or full name, person id) pairs for prefix search
+        self._prefixes = []
+        for person in people:
+            self.add(person, keep_sorted=False)
+        self._prefixes.sort()
+
+    def __len__(self):
+        return len(self.people)
+
+    def get(self, person_id):
+        return self.people.get(person_id)
+
+    def add(self, person, keep_sorted=True):
+        normalized = normalize_name(person['name'])
+        self.people[person['id']] = person
+        self._normalized[person['id']] = normalized
+        ids = self._exact.setdefault(normalized, [])
+        if not ids and len(normalized) <= SHORT_NAME + SHORT_EDITS:
+            for variant in deletions(normalized, SHORT_EDITS):
+                self._deletes.setdefault(variant, set()).add(normalized)
+        ids.append(person['id'])
+        grams = self._grams[person['id']] = trigrams(normalized)
+        for gram in grams:
+            self._trigrams.setdefault(gram, set()).add(person['id'])
+        for key in self._prefix_keys(normalized):
+            if keep_sorted:
+                bisect.insort(self._prefixes, (key, person['id']))
+            else:
+                self._prefixes.append((key, person['id']))
+
+    def remove(self, person):
+        person_id = person['id']
+        normalized = self._normalized.pop(person_id, None)
+        if normalized is None:
+            return
+        del self.people[person_id]
+        ids = self._exact[normalized]
+        ids.remove(person_id)
+        if not ids:
+            del self._exact[normalized]
+            if len(normalized) <= SHORT_NAME + SHORT_EDITS:
+                for variant in deletions(normalized, SHORT_EDITS):
+                    names = self._deletes[variant]
+                    names.discard(normalized)
+                    if not names:
+                        del self._deletes[variant]
+        for gram in self._grams.pop(person_id):
+            posting = self._trigrams[gram]
+            posting.discard(person_id)
+            if not posting:
+                del self._trigrams[gram]
+        for key in self._prefix_keys(normalized):
+            i = bisect.bisect_left(self._prefixes, (key, person_id))
+            if i < len(self._prefixes) and self._prefixes[i] == (key, person_id):
+                del self._prefixes[i]
+
+    def update(self, person):
+        """Re-index a person after a rename, or point at a new copy of them"""
+        if self._normalized.get(person['id']) == normalize_name(person['name']):
+            self.people[person['id']] = person
+            return
+        self.remove(person)
+        self.add(person)
+
+    def clear(self):
+        self.people.clear()
+        self._normalized.clear()
+        self._grams.clear()
+        self._exact.clear()
+        self._trigrams.clear()
+        self._deletes.clear()
+        self._prefixes.clear()
+
+    @staticmethod
+    def _prefix_keys(normalized):
+        words = normalized.split()
+        return set(words) | {normalized}
+
+    def lookup(self, name):
+        """The first person whose normalized name equals ``name``, or None"""
+        ids = self._exact.get(normalize_name(name))
+        return self.people[ids[0]] if ids else None
+
+    def _prefix_matches(self, normalized, limit):
+        ids = []
+        i = bisect.bisect_left(self._prefixes, (normalized,))
+        while i < len(self._prefixes) and len(ids) < limit:
+            key, person_id = self._prefixes[i]
+            if not key.startswith(normalized):
+                break
+            if person_id not in ids:
+                ids.append(person_id)
+            i += 1
+        return ids
+
+    def _fuzzy_matches(self, normalized, limit, min_similarity):
+        grams = trigrams(normalized)
+        postings = sorted((p for p in (self._trigrams.get(g) for g in grams) if p), key=len)
+        candidates = set()
+        for posting in postings:
+            if len(candidates) + len(posting) > CANDIDATE_BUDGET:
+                if not candidates:
+                    # Even the rarest trigram is very common: the query is too
+                    # vague for fuzzy matching to mean much, just sample it
+                    candidates.update(itertools.islice(posting, CANDIDATE_BUDGET))
+                break
+            candidates.update(posting)
+
+        scored = []
+        for person_id in candidates:
+            name_grams = self._grams[person_id]
+            shared = len(grams & name_grams)
+            similarity = shared / (len(grams) + len(name_grams) - shared)
+            if similarity >= min_similarity:
+                scored.append((-similarity, len(self._normalized[person_id]), person_id))
+        scored.sort()
+        return [person_id for *_, person_id in scored[:limit]]
+
+    def _edit_candidates(self, normalized, max_distance):
+        """Normalized names that may be within ``max_distance`` edits of ``normalized``.
+
+        Short names look up their deletions: a name within ``d`` edits of
+        another has a deletion of at most ``d`` letters in common with it.
+        For longer names, an edit changes at most three trigrams, so a name
+        that close shares all but ``3 * d`` of the ``k`` trigrams of
+        ``normalized``, and their similarity is at least
+        ``(k - 3d) / (k + 4d)``: the fuzzy search uses that as its threshold.
+        """
+        if len(normalized) <= SHORT_NAME and max_distance <= SHORT_EDITS:
+            return set().union(*(self._deletes.get(variant, ())
+                                 for variant in deletions(normalized, max_distance)))
+        grams = trigrams(normalized)
+        floor = (len(grams) - 3 * max_distance) / (len(grams) + 4 * max_distance)
+        return {self._normalized[person_id] for person_id in
+                self._fuzzy_matches(normalized, CANDIDATE_BUDGET, min(MIN_SIMILARITY, floor))}
+
+    def _edit_matches(self, normalized, max_distance, limit):
+        """Ids of up to ``limit`` people named 1 to ``max_distance`` edits away, closest first"""
+        matches = []
+        for other in self._edit_candidates(normalized, max_distance):
+            if abs(len(other) - len(normalized)) > max_distance:
+                continue
+            distance = edit_distance(normalized, other, limit=max_distance)
+            if 0 < distance <= max_distance:
+                matches.append((distance, other))
+        matches.sort()
+        ids = (person_id for _, other in matches for person_id in self._exact[other])
+        return list(itertools.islice(ids, limit))
+
+    def search(self, query, limit=10, min_similarity=MIN_SIMILARITY):
+        """People whose name starts with, is an edit away from or resembles ``query``, best match first"""
+        normalized = normalize_name(query)
+        if not normalized:
+            return []
+        ids = list(self._exact.get(normalized, []))
+        for person_id in self._prefix_matches(normalized, limit):
+            if person_id not in ids:
+                ids.append(person_id)
+        if len(ids) < limit and len(normalized) <= SHORT_NAME:
+            # Too few trigrams for the fuzzy search to find these
+            for person_id in self._edit_matches(normalized, min(SEARCH_EDITS, len(normalized) // 2),
+                                                limit):
+                if person_id not in ids:
+                    ids.append(person_id)
+        if len(ids) < limit:
+            for person_id in self._fuzzy_matches(normalized, limit, min_similarity):
+                if person_id not in ids:
+                    ids.append(person_id)
+        return [self.people[person_id] for person_id in ids[:limit]]
+
+    def similar(self, name, max_distance=2, limit=5):
+        """Other people whose name is within ``max_distance`` edits of ``name``, closest first.
+
+        At most half of the letters may differ, so "Jon" is like "John" but not "Bob".
+        """
+        normalized = normalize_name(name)
+        matches = self._edit_matches(normalized, min(max_distance, len(normalized) // 2), limit)
+        return [self.people[person_id] for person_id in matches]
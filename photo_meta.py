@@ -0,0 +1,129 @@
+"""Per-photo metadata captured at ingest.
+
+Every person and event keeps a ``photo_meta`` dict (path -> metadata) next
+to its ``photos`` list, and people keep a ``cover_photo``: the most recent
+healthy photo.  Both are kept up to date as photos are added or removed, so
+drawing the galleries never has to stat files or parse file names.
+"""
+import os
+import re
+from datetime import datetime
+
+from PIL import Image
+
+from imaging import get_capture_time
+from visual_index import image_hash
+
+LEGACY_TIMESTAMP = re.compile(r'_(\d{8}_\d{6})(?:_[0-9a-f]+)?\.\w+$')
+
+
+def new_photo_meta(path, img, info, uploaded_at=None):
+    """Metadata for a photo that was just written to ``path``.
+
+    ``img`` and ``info`` are what ``imaging.process_upload`` returned.
+    """
+    width, height = info.get('source_size') or (None, None)
+    return {
+        "captured_at": info.get('captured_at'),
+        "uploaded_at": uploaded_at or datetime.now().isoformat(timespec='seconds'),
+        "width": width,
+        "height": height,
+        "bytes": os.path.getsize(path),
+        "ok": True,
+        "phash": image_hash(img),
+    }
+
+
+def scan_photo_meta(path):
+    """Build metadata for a photo stored before metadata was captured"""
+    if not path or not os.path.exists(path):
+        return {"captured_at": None, "uploaded_at": None, "width": None,
+                "height": None, "bytes": None, "ok": False, "phash": None}
+    stat = os.stat(path)
+    match = LEGACY_TIMESTAMP.search(path)
+    if match:
+        uploaded_at = datetime.strptime(match.group(1), '%Y%m%d_%H%M%S')
+    else:
+        uploaded_at = datetime.fromtimestamp(stat.st_mtime)
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            captured_at = get_capture_time(img)
+            phash = image_hash(img)
+    except Exception:
+        return {"captured_at": None, "uploaded_at": uploaded_at.isoformat(timespec='seconds'),
+                "width": None, "height": None, "bytes": stat.st_size, "ok": False, "phash": None}
+    return {
+        "captured_at": captured_at,
+        "uploaded_at": uploaded_at.isoformat(timespec='seconds'),
+        "width": width,
+        "height": height,
+        "bytes": stat.st_size,
+        "ok": True,
+        "phash": phash,
+    }
+
+
+def photo_sort_key(meta):
+    """When the photo was taken, falling back to when it was uploaded"""
+    return meta.get('captured_at') or meta.get('uploaded_at') or ''
+
+
+def ensure_photo_meta(record):
+    """Fill in metadata for photos that have none (or no hash) yet; returns the paths filled"""
+    photo_meta = record.setdefault('photo_meta', {})
+    missing = [p for p in record.get('photos', [])
+               if p not in photo_meta or (photo_meta[p].get('ok') and not photo_meta[p].get('phash'))]
+    for path in missing:
+        photo_meta[path] = scan_photo_meta(path)
+    return missing
+
+
+def refresh_cover(person):
+    """Point ``cover_photo`` at the most recent healthy photo"""
+    photo_meta = person.get('photo_meta', {})
+    healthy = [p for p in person.get('photos', []) if photo_meta.get(p, {}).get('ok', True)]
+    person['cover_photo'] = max(
+        healthy, key=lambda p: photo_sort_key(photo_meta.get(p, {})), default=None)
+    return person['cover_photo']
+
+
+def add_photo(record, path, meta):
+    record['photos'].append(path)
+    record.setdefault('photo_meta', {})[path] = meta
+    cover = record.get('cover_photo')
+    if cover is None or photo_sort_key(meta) >= photo_sort_key(record['photo_meta'].get(cover, {})):
+        record['cover_photo'] = path
+
+
+def remove_photo(record, index):
+    """Remove the photo at ``index`` and return its path"""
+    path = record['photos'].pop(index)
+    if path not in record['photos']:
+        record.get('photo_meta', {}).pop(path, None)
+    if record.get('cover_photo') == path:
+        refresh_cover(record)
+    return path
+
+
+def mark_missing(record, path):
+    """Record that ``path`` can no longer be read and pick another cover"""
+    record.setdefault('photo_meta', {}).setdefault(path, {})['ok'] = False
+    if record.get('cover_photo') == path:
+        refresh_cover(record)
+
+
+def mark_found(record, path, meta):
+    """Record that ``path`` can be read again, with ``meta`` from ``scan_photo_meta``.
+
+    The upload time recorded before is kept, and the cover picked again.
+    """
+    photo_meta = record.setdefault('photo_meta', {})
+    meta = dict(meta, uploaded_at=photo_meta.get(path, {}).get('uploaded_at') or meta['uploaded_at'])
+    photo_meta[path] = meta
+    refresh_cover(record)
+
+
+def is_missing(record, path):
+    """Whether ``path`` of ``record`` is marked as missing"""
+    return not record.get('photo_meta', {}).get(path, {}).get('ok', True)
@@ -0,0 +1,189 @@
+"""Where the time of each rerun goes.
+
+A ``RunProfile`` collects named spans while the script runs: the page
+sections, store reads and writes, and image I/O.  Spans with the same name
+are summed (a page draws many photos); a span opened inside another one is
+named after both, e.g. ``grid/show_photo``.  Finished runs are added to a
+process-wide ``Metrics``, which keeps a histogram per span and exports them:
+
+    PROFILE_JSONL=profile.jsonl   append every run to this file, one JSON object per line
+    PROFILE_PROM=app.prom         keep the metrics in this file in the Prometheus text
+                                  format (e.g. for the node_exporter textfile collector)
+    DEBUG_PANEL=1                 show the timings in the sidebar (or open the app with ?debug=1)
+
+Callbacks run before the script, so they are counted in the run they
+trigger.  A run cut short by ``st.rerun()`` is counted with the run it starts.
+A fragment rerun is a run of its own, recorded with the fragment's name
+(``fragment``) and counted under ``fragment_run`` instead of ``run``.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+PROFILE_JSONL = os.environ.get('PROFILE_JSONL')
+PROFILE_PROM = os.environ.get('PROFILE_PROM')
+DEBUG_PANEL = os.environ.get('DEBUG_PANEL', '') not in ('', '0')
+
+# Upper bounds (seconds) of the histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RunProfile:
+    """Spans of one rerun"""
+
+    def __init__(self):
+        self.started = None
+        self.started_at = None
+        # path -> [calls, seconds, depth], in the order spans were first opened
+        self.spans = {}
+        self._open = []
+
+    def begin(self):
+        if self.started is None:
+            self.started = time.perf_counter()
+            self.started_at = datetime.now().isoformat(timespec='milliseconds')
+
+    @contextmanager
+    def span(self, name):
+        self.begin()
+        path = '/'.join(self._open + [name])
+        entry = self.spans.setdefault(path, [0, 0.0, len(self._open)])
+        self._open.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry[0] += 1
+            entry[1] += time.perf_counter() - start
+            self._open.pop()
+
+    def finish(self, session=None, fragment=None):
+        """The run as a JSON-serializable dict"""
+        self.begin()
+        return {
+            "session": session,
+            "fragment": fragment,
+            "started_at": self.started_at,
+            "total_s": time.perf_counter() - self.started,
+            "spans": [{"name": path, "calls": calls, "seconds": seconds, "depth": depth}
+                      for path, (calls, seconds, depth) in self.spans.items()],
+        }
+
+
+def timed(name, get_profile):
+    """Decorator recording every call as span ``name`` of ``get_profile()``"""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_profile().span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class Instrumented:
+    """Proxy recording every method call of ``target`` as span ``prefix.method``"""
+
+    def __init__(self, target, prefix, get_profile):
+        self._target = target
+        self._prefix = prefix
+        self._get_profile = get_profile
+
+    def __getattr__(self, attr):
+        value = getattr(self._target, attr)
+        if not callable(value):
+            return value
+        return timed(f"{self._prefix}.{attr}", self._get_profile)(value)
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+class Metrics:
+    """Histograms of the time per run spent in each span, for the whole process"""
+
+    def __init__(self, jsonl_path=PROFILE_JSONL, prom_path=PROFILE_PROM):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.runs = 0
+        # name -> [runs seen in, calls, seconds, max seconds, bucket counts]
+        self._spans = {}
+        # Functions returning more [(name, type, help, value)] to export
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    def _observe(self, name, calls, seconds):
+        entry = self._spans.get(name)
+        if entry is None:
+            entry = self._spans[name] = [0, 0, 0.0, 0.0, [0] * len(BUCKETS)]
+        entry[0] += 1
+        entry[1] += calls
+        entry[2] += seconds
+        entry[3] = max(entry[3], seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                entry[4][i] += 1
+
+    def record(self, run):
+        """Add a finished run and export it"""
+        with self._lock:
+            self.runs += 1
+            self._observe('fragment_run' if run.get('fragment') else 'run', 1, run['total_s'])
+            for span in run['spans']:
+                self._observe(span['name'], span['calls'], span['seconds'])
+            if self.jsonl_path:
+                with open(self.jsonl_path, 'a') as f:
+                    f.write(json.dumps(run) + '\n')
+            if self.prom_path:
+                temp_path = f"{self.prom_path}.{os.getpid()}.tmp"
+                with open(temp_path, 'w') as f:
+                    f.write(self._prometheus_text())
+                os.replace(temp_path, self.prom_path)
+
+    def summary(self):
+        """``[(name, runs, mean seconds per run, max seconds)]``"""
+        with self._lock:
+            return [(name, runs, seconds / runs, max_seconds)
+                    for name, (runs, calls, seconds, max_seconds, buckets) in self._spans.items()]
+
+    def prometheus_text(self):
+        with self._lock:
+            return self._prometheus_text()
+
+    def _prometheus_text(self):
+        lines = [
+            "# HELP app_reruns_total Script runs of the app.",
+            "# TYPE app_reruns_total counter",
+            f"app_reruns_total {self.runs}",
+            "# HELP app_span_calls_total Times each part of the app ran.",
+            "# TYPE app_span_calls_total counter",
+        ]
+        for name, (runs, calls, seconds, max_seconds, buckets) in self._spans.items():
+            lines.append(f'app_span_calls_total{{span="{_label(name)}"}} {calls}')
+        lines += [
+            "# HELP app_span_seconds Time per run spent in each part of the app.",
+            "# TYPE app_span_seconds histogram",
+        ]
+        for name, (runs, calls, seconds, max_seconds, buckets) in self._spans.items():
+            label = _label(name)
+            for bound, count in zip(BUCKETS, buckets):
+                lines.append(f'app_span_seconds_bucket{{span="{label}",le="{bound}"}} {count}')
+            lines.append(f'app_span_seconds_bucket{{span="{label}",le="+Inf"}} {runs}')
+            lines.append(f'app_span_seconds_sum{{span="{label}"}} {seconds}')
+            lines.append(f'app_span_seconds_count{{span="{label}"}} {runs}')
+        for collect in self._collectors:
+            for name, metric_type, help_text, value in collect():
+                lines += [
+                    f"# HELP {name} {help_text}",
+                    f"# TYPE {name} {metric_type}",
+                    f"{name} {value}",
+                ]
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,381 @@
+"""One copy of the people and events for the whole process.
+
+Every browser session used to load its own copy of the data, build its own
+indexes and write its copy back.  Now all sessions share one ``SharedData``:
+
+* Published lists and records are never changed in place.  A write copies
+  the record it changes and publishes a new list (copy-on-write), so a
+  session drawing the page keeps a consistent view without taking a lock.
+* Writes are serialized by one lock, persisted by the store before they are
+  published, and bump ``version``.  Sessions compare ``version`` with the
+  one they last drew to notice changes made by other sessions.
+* The name, location, photo, meeting and event indexes are shared as well; they change
+  under the same lock and are read through the lookup methods here, which
+  also combine them for the people and event filters (see ``facets``).
+* ``sync()`` reloads everything when another process wrote to the store,
+  e.g. a bulk import.  Writes do the same first, so they never build on
+  stale data.
+
+Writes take person and event ids rather than records, so they always apply
+to the latest copy, whatever version the caller drew.
+"""
+import threading
+from contextlib import contextmanager
+
+import photo_meta
+from facets import EventIndex, intersect
+from locations import LocationIndex
+from names import NameIndex
+from timeline import MeetingTimeline
+from visual_index import VisualIndex
+
+
+def _copy_record(record):
+    """Copy of a person or event that can be changed without touching ``record``"""
+    copy = dict(record)
+    copy['photos'] = list(record.get('photos', []))
+    copy['photo_meta'] = {path: dict(meta) for path, meta in record.get('photo_meta', {}).items()}
+    if 'meetings' in record:
+        copy['meetings'] = [dict(meeting) for meeting in record['meetings']]
+    return copy
+
+
+class SharedData:
+    def __init__(self, store, countries, us_states):
+        self.store = store
+        self.countries = countries
+        self.us_states = us_states
+        self.version = 0
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        self._store_version = self.store.data_version()
+        self.people = self.store.load_people()
+        self.events = self.store.load_events()
+        self._person_pos = {person['id']: i for i, person in enumerate(self.people)}
+        self._event_pos = {event['id']: i for i, event in enumerate(self.events)}
+        self.names = NameIndex(self.people)
+        self.locations = LocationIndex(self.countries, self.us_states, self.people)
+        self.visual = VisualIndex(self.people)
+        self.timeline = MeetingTimeline(self.people)
+        self.event_index = EventIndex(self.events)
+
+    def _publish(self):
+        self.version += 1
+
+    def _reload_if_changed(self):
+        if self.store.data_version() == self._store_version:
+            return False
+        self._load()
+        self.version += 1
+        return True
+
+    def sync(self):
+        """Reload if another process wrote to the store; returns whether it did"""
+        if self.store.data_version() == self._store_version:
+            return False
+        with self._lock:
+            return self._reload_if_changed()
+
+    @contextmanager
+    def _writing(self):
+        """Hold the lock for a write, after taking in what other processes wrote.
+
+        The store's version does not move on our own writes, so a commit made
+        elsewhere while we write is still seen by the next ``sync``.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            yield
+
+    # Lookups
+
+    def get_person(self, person_id):
+        return self.names.get(person_id)
+
+    def get_event(self, event_id):
+        pos = self._event_pos.get(event_id)
+        return self.events[pos] if pos is not None else None
+
+    def lookup(self, name):
+        with self._lock:
+            return self.names.lookup(name)
+
+    def similar(self, name):
+        with self._lock:
+            return self.names.similar(name)
+
+    def search(self, query, limit):
+        with self._lock:
+            return self.names.search(query, limit=limit)
+
+    def visual_query(self, hex_hash):
+        """``[(person_id, path, distance)]`` of the people who look alike, closest first"""
+        with self._lock:
+            return [match for match in self.visual.query(hex_hash)
+                    if self.names.get(match[0]) is not None]
+
+    def has_meeting(self, person_id, date):
+        with self._lock:
+            return self.timeline.has(person_id, date)
+
+    def last_seen(self, person_id):
+        with self._lock:
+            return self.timeline.last_seen(person_id)
+
+    def meeting_stats(self, cutoff):
+        """Meetings per month, location and country, and the people not met since ``cutoff``"""
+        with self._lock:
+            stale_ids, stale_dates = self.timeline.not_seen_since(cutoff)
+            return {
+                "per_month": self.timeline.per_month(),
+                "per_location": self.timeline.per_location(),
+                "per_country": self.timeline.per_country(),
+                "not_seen": [(self.names.get(pid), date) for pid, date in zip(stale_ids, stale_dates)],
+                "never_met": len(self.people) - self.timeline.people_count(),
+            }
+
+    def facet_options(self):
+        """Countries, US states and meeting locations with someone in them, for the filters"""
+        with self._lock:
+            return {
+                "countries": sorted(self.locations.by_country),
+                "states": sorted(self.locations.by_state),
+                "locations": self.timeline.location_names(),
+            }
+
+    def filter_people(self, country=None, state=None, location=None, met_from=None,
+                      met_to=None, not_seen_since=None):
+        """People matching every filter given, in grid order (everyone without filters)"""
+        with self._lock:
+            ids = intersect([
+                self.locations.by_country.get(country, {}) if country else None,
+                self.locations.by_state.get(state, {}) if state else None,
+                self.timeline.people_at(location) if location else None,
+                self.timeline.people_between(met_from, met_to) if met_from or met_to else None,
+                self.timeline.people_not_seen_since(not_seen_since) if not_seen_since else None,
+            ])
+            if ids is None:
+                return self.people
+            return [self.people[pos] for pos in sorted(self._person_pos[pid] for pid in ids)]
+
+    def filter_events(self, name=None, start=None, end=None):
+        """Events matching every filter given, most recent first"""
+        with self._lock:
+            named = self.event_index.named(name) if name else None
+            return [self.events[self._event_pos[event_id]]
+                    for event_id in self.event_index.between(start, end)
+                    if named is None or event_id in named]
+
+    def map_rows(self):
+        """``(digest, rows)`` of the location index"""
+        with self._lock:
+            return self.locations.digest(), self.locations.map_rows()
+
+    # People
+
+    def _copy_person(self, person_id):
+        person = self.names.get(person_id)
+        return _copy_record(person) if person is not None else None
+
+    def _replace_person(self, person):
+        people = list(self.people)
+        people[self._person_pos[person['id']]] = person
+        self.people = people
+        self.names.update(person)
+        self.locations.update(person)
+
+    def add_person(self, person):
+        """Store and publish a new person; sets ``person['id']``"""
+        with self._writing():
+            self.store.add_person(person)
+            self._person_pos[person['id']] = len(self.people)
+            self.people = self.people + [person]
+            self.names.add(person)
+            self.locations.add(person)
+            self.visual.add_person(person)
+            self.timeline.add_person(person)
+            self._publish()
+            return person
+
+    def update_person(self, person_id, **fields):
+        """Change name, country or state; returns the new copy of the person"""
+        with self._writing():
+            person = self._copy_person(person_id)
+            if person is None:
+                return None
+            person.update(fields)
+            self.store.update_person(person)
+            self._replace_person(person)
+            self.timeline.update_person(person)
+            self._publish()
+            return person
+
+    def delete_person(self, person_id):
+        """Returns the removed person, or None if they were already gone"""
+        with self._writing():
+            person = self.names.get(person_id)
+            if person is None:
+                return None
+            self.store.delete_person(person)
+            self.people = [p for p in self.people if p['id'] != person_id]
+            self._person_pos = {p['id']: i for i, p in enumerate(self.people)}
+            self.names.remove(person)
+            self.locations.remove(person)
+            self.visual.remove_person(person)
+            self.timeline.remove_person(person_id)
+            self._publish()
+            return person
+
+    def clear_people(self):
+        """Returns the removed people"""
+        with self._writing():
+            removed = self.people
+            self.store.clear_people()
+            self.people = []
+            self._person_pos = {}
+            self.names.clear()
+            self.locations.clear()
+            self.visual.clear()
+            self.timeline.clear()
+            self._publish()
+            return removed
+
+    def add_photo(self, person_id, path, meta):
+        with self._writing():
+            person = self._copy_person(person_id)
+            if person is None:
+                return None
+            photo_meta.add_photo(person, path, meta)
+            self.store.add_photo(person, path)
+            self._replace_person(person)
+            self.visual.add(person_id, path, meta.get('phash'))
+            self._publish()
+            return person
+
+    def remove_photo(self, person_id, path):
+        """Remove one copy of ``path``; returns whether there was one"""
+        with self._writing():
+            person = self._copy_person(person_id)
+            if person is None or path not in person['photos']:
+                return False
+            photo_meta.remove_photo(person, person['photos'].index(path))
+            self.store.remove_photo(person, path)
+            self._replace_person(person)
+            self.visual.remove(person_id, path)
+            self._publish()
+            return True
+
+    def mark_photo_missing(self, person_id, path):
+        with self._writing():
+            person = self._copy_person(person_id)
+            if person is None or path not in person['photos']:
+                return
+            photo_meta.mark_missing(person, path)
+            self.store.update_photo_meta(person, path)
+            self._replace_person(person)
+            # A photo that can't be drawn is no match for a photo search
+            for _ in range(person['photos'].count(path)):
+                self.visual.remove(person_id, path)
+            self._publish()
+
+    def mark_photo_found(self, person_id, path, meta):
+        """Clear the missing mark of ``path``, with ``meta`` read from the file again"""
+        with self._writing():
+            person = self._copy_person(person_id)
+            if person is None or not photo_meta.is_missing(person, path):
+                return
+            photo_meta.mark_found(person, path, meta)
+            self.store.update_photo_meta(person, path)
+            self._replace_person(person)
+            for _ in range(person['photos'].count(path)):
+                self.visual.add(person_id, path, meta.get('phash'))
+            self._publish()
+
+    def add_meeting(self, person_id, meeting):
+        with self._writing():
+            person = self._copy_person(person_id)
+            if person is None:
+                return None
+            person['meetings'].append(meeting)
+            person['meetings'].sort(key=lambda x: x['date'])
+            self.store.add_meeting(person, meeting)
+            self._replace_person(person)
+            self.timeline.add(person_id, meeting, person.get('country'))
+            self._publish()
+            return person
+
+    def remove_meeting(self, person_id, meeting):
+        with self._writing():
+            person = self._copy_person(person_id)
+            if person is None or meeting not in person['meetings']:
+                return None
+            person['meetings'].remove(meeting)
+            self.store.remove_meeting(person, meeting)
+            self._replace_person(person)
+            self.timeline.remove(person_id, meeting)
+            self._publish()
+            return person
+
+    # Events
+
+    def add_event(self, event):
+        """Store and publish a new event; sets ``event['id']``"""
+        with self._writing():
+            self.store.add_event(event)
+            self._event_pos[event['id']] = len(self.events)
+            self.events = self.events + [event]
+            self.event_index.add(event)
+            self._publish()
+            return event
+
+    def delete_event(self, event_id):
+        """Returns the removed event, or None if it was already gone"""
+        with self._writing():
+            event = self.get_event(event_id)
+            if event is None:
+                return None
+            self.store.delete_event(event)
+            self.events = [e for e in self.events if e['id'] != event_id]
+            self._event_pos = {e['id']: i for i, e in enumerate(self.events)}
+            self.event_index.remove(event_id)
+            self._publish()
+            return event
+
+    def clear_events(self):
+        """Returns the removed events"""
+        with self._writing():
+            removed = self.events
+            self.store.clear_events()
+            self.events = []
+            self._event_pos = {}
+            self.event_index.clear()
+            self._publish()
+            return removed
+
+    def mark_event_photo_missing(self, event_id, path):
+        with self._writing():
+            event = self.get_event(event_id)
+            if event is None or path not in event['photos']:
+                return
+            event = _copy_record(event)
+            photo_meta.mark_missing(event, path)
+            self._replace_event(event, path)
+
+    def mark_event_photo_found(self, event_id, path, meta):
+        """Clear the missing mark of ``path``, with ``meta`` read from the file again"""
+        with self._writing():
+            event = self.get_event(event_id)
+            if event is None or not photo_meta.is_missing(event, path):
+                return
+            event = _copy_record(event)
+            photo_meta.mark_found(event, path, meta)
+            self._replace_event(event, path)
+
+    def _replace_event(self, event, path):
+        self.store.update_event_photo_meta(event, path)
+        events = list(self.events)
+        events[self._event_pos[event['id']]] = event
+        self.events = events
+        self._publish()
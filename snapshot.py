@@ -0,0 +1,350 @@
+"""Static, read-only snapshot of the galleries for viewers who only browse.
+
+Every viewer of the app costs a script run and session state on the
+server, even one who only looks at the grid.  The snapshot is the people
+grid, a page per person with their meetings, the maps and the Box Cutters
+gallery as plain HTML files (and the same data as JSON), which any static
+file server can serve::
+
+    python snapshot.py site/                 write the snapshot into site/
+    python snapshot.py site/ --watch 30      and again whenever the data changes
+    python -m http.server --directory site   e.g.
+
+* Photos are the thumbnails and person-view sizes the image store already
+  holds, hard-linked into ``photos/`` (copied across file systems), so
+  nothing is decoded or encoded again.
+* The maps are rendered once into the page, next to a local copy of
+  plotly.js, and draw the bundled geometry, so they work offline.
+* ``snapshot.json`` remembers what each file was made from.  A later export
+  skips every file whose inputs did not change, and deletes the files of
+  people, events and photos that are gone, so adding a meeting rewrites
+  that person's page and the grid page they are on, not the whole site.
+  Files are replaced atomically and pages are written after the photos
+  they show, so a viewer never gets a half-written snapshot.
+
+Data comes from the store the app is configured with (``STORAGE_BACKEND``,
+``DATA_DB_PATH``, ``IMAGE_STORE_DIR``).
+
+    SNAPSHOT_PAGE_SIZE=60   people per page of the grid
+"""
+import argparse
+import hashlib
+import html
+import json
+import math
+import os
+import shutil
+import sys
+import time
+
+from image_store import derivative_path, is_blob_path
+from locations import COUNTRIES, US_STATES, build_map_figures
+from shared_data import SharedData
+from storage import open_store
+
+SNAPSHOT_PAGE_SIZE = int(os.environ.get('SNAPSHOT_PAGE_SIZE', 60))
+EVENTS_PER_PAGE = 10
+MANIFEST = 'snapshot.json'
+# Bump when the pages change shape, so the next export rewrites all of them
+FORMAT = 1
+
+STYLE = """body { font-family: sans-serif; margin: 0 auto; max-width: 1100px; padding: 1rem; }
+nav a { margin-right: 1rem; }
+.grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(200px, 1fr)); gap: 1rem; }
+.grid img, .photos img { width: 100%; border-radius: 4px; }
+.photos { display: grid; grid-template-columns: repeat(auto-fill, minmax(320px, 1fr)); gap: 1rem; }
+.caption { color: #666; font-size: 0.9rem; }
+.pager { margin: 1.5rem 0; text-align: center; }
+.pager a { margin: 0 1rem; }
+table { border-collapse: collapse; }
+td, th { border-bottom: 1px solid #ddd; padding: 0.3rem 1rem 0.3rem 0; text-align: left; }
+"""
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<link rel="stylesheet" href="style.css">
+{head}</head>
+<body>
+<nav><a href="index.html">People</a><a href="map.html">Map</a><a href="events.html">Box Cutters</a></nav>
+<h1>{title}</h1>
+{body}
+</body>
+</html>
+"""
+
+
+def digest(value):
+    """Content hash of a JSON-able ``value``, what a file is made from"""
+    return hashlib.sha1(json.dumps([FORMAT, value], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _replace(path, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+class SiteWriter:
+    """Files of a snapshot, skipping those made from the same inputs as last time"""
+
+    def __init__(self, root):
+        self.root = root
+        try:
+            with open(os.path.join(root, MANIFEST)) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            manifest = {}
+        self.previous = manifest.get('files', {}) if manifest.get('format') == FORMAT else {}
+        self.files = {}
+        self.written = 0
+        self.skipped = 0
+
+    def _unchanged(self, name, key):
+        if self.files.get(name) == key:
+            # Already written in this export, e.g. a photo two people share
+            return True
+        self.files[name] = key
+        if self.previous.get(name) == key and os.path.exists(os.path.join(self.root, name)):
+            self.skipped += 1
+            return True
+        self.written += 1
+        return False
+
+    def write(self, name, key, render):
+        """Write ``render()`` (text or bytes) to ``name``, unless it was made from ``key`` last time"""
+        if self._unchanged(name, key):
+            return
+
+        def write(tmp):
+            content = render()
+            with open(tmp, 'wb') as f:
+                f.write(content.encode() if isinstance(content, str) else content)
+        _replace(os.path.join(self.root, name), write)
+
+    def link(self, name, source):
+        """Hard-link (or copy) the file ``source`` to ``name``; photo files never change in place"""
+        if self._unchanged(name, source):
+            return
+
+        def link(tmp):
+            try:
+                os.link(source, tmp)
+            except OSError:
+                shutil.copyfile(source, tmp)
+        _replace(os.path.join(self.root, name), link)
+
+    def finish(self):
+        """Delete the files of the last snapshot that are not in this one and save the manifest"""
+        removed = 0
+        for name in set(self.previous) - set(self.files):
+            try:
+                os.remove(os.path.join(self.root, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+        def save(tmp):
+            with open(tmp, 'w') as f:
+                json.dump({'format': FORMAT, 'files': self.files}, f)
+        _replace(os.path.join(self.root, MANIFEST), save)
+        return removed
+
+
+def _page_name(first, prefix, page, ext='html'):
+    return first if page == 1 and ext == 'html' else f"{prefix}-{page}.{ext}"
+
+
+def _pager(first, prefix, page, pages):
+    if pages <= 1:
+        return ''
+    links = []
+    if page > 1:
+        links.append(f'<a href="{_page_name(first, prefix, page - 1)}">&larr;</a>')
+    links.append(f"Page {page} of {pages}")
+    if page < pages:
+        links.append(f'<a href="{_page_name(first, prefix, page + 1)}">&rarr;</a>')
+    return f'<div class="pager">{"".join(links)}</div>'
+
+
+def _photo(site, record, path, size=None):
+    """Put a photo of ``record`` in the snapshot; returns its URL, or None if it can't be shown"""
+    if not record['photo_meta'].get(path, {}).get('ok', True):
+        return None
+    source = path
+    if size and os.path.exists(derivative_path(path, size)):
+        source = derivative_path(path, size)
+    if not os.path.exists(source):
+        return None
+    if is_blob_path(os.path.normpath(path)):
+        # Blobs are named after their content already
+        name = os.path.basename(source)
+    else:
+        name = hashlib.sha1(source.encode()).hexdigest()[:20] + os.path.splitext(source)[1]
+    site.link(f"photos/{name}", source)
+    return f"photos/{name}"
+
+
+def _where(person):
+    if person.get('country') == 'United States' and person.get('state'):
+        return f"{person['state']}, United States"
+    return person.get('country') or ''
+
+
+def export_people(site, data, people, page_size):
+    """The grid pages and a page per person; returns the number of grid pages"""
+    pages = max(1, math.ceil(len(people) / page_size))
+    for page in range(1, pages + 1):
+        items = []
+        for person in people[(page - 1) * page_size:page * page_size]:
+            photos = [url for url in (_photo(site, person, path, 'medium') for path in person['photos'])
+                      if url]
+            item = {
+                'id': person['id'],
+                'name': person['name'],
+                'where': _where(person),
+                'cover': person.get('cover_photo') and _photo(site, person, person['cover_photo']),
+                'last_seen': data.last_seen(person['id']),
+                'meetings': sorted(person.get('meetings', []), key=lambda m: m['date'], reverse=True),
+                'photos': photos,
+            }
+            items.append(item)
+            site.write(f"person-{person['id']}.html", digest(item), lambda item=item: render_person(item))
+
+        key = digest([page, pages, items])
+        site.write(_page_name('index.html', 'people', page, 'json'), key,
+                   lambda: json.dumps({'page': page, 'pages': pages, 'people': items}))
+        site.write(_page_name('index.html', 'people', page), key,
+                   lambda: render_people_page(items, page, pages, len(people)))
+    return pages
+
+
+def render_person(item):
+    photos = ''.join(f'<img src="{html.escape(url)}" alt="" loading="lazy">' for url in item['photos'])
+    meetings = ''.join(
+        f"<tr><td>{html.escape(m['date'])}</td><td>{html.escape(m.get('location') or '')}</td></tr>"
+        for m in item['meetings'])
+    body = (f'<p class="caption">{html.escape(item["where"])}</p>'
+            f'<div class="photos">{photos}</div>'
+            '<h2>Meetings</h2>'
+            + (f'<table><tr><th>Date</th><th>Location</th></tr>{meetings}</table>'
+               if meetings else '<p>No meetings recorded.</p>'))
+    return PAGE.format(title=html.escape(item['name']), head='', body=body)
+
+
+def render_people_page(items, page, pages, total):
+    cards = []
+    for item in items:
+        cover = (f'<img src="{html.escape(item["cover"])}" alt="" loading="lazy">'
+                 if item['cover'] else '')
+        seen = item['last_seen']
+        caption = (f'<div class="caption">Last seen: {html.escape(seen["date"] or "")}<br>'
+                   f'At: {html.escape(seen["location"])}</div>' if seen else '')
+        cards.append(f'<div><a href="person-{item["id"]}.html">{cover}'
+                     f'<div>{html.escape(item["name"])}</div></a>{caption}</div>')
+    body = (f'<p class="caption">{total} people</p><div class="grid">{"".join(cards)}</div>'
+            + _pager('index.html', 'people', page, pages))
+    return PAGE.format(title="MLH Coaches You've Met", head='', body=body)
+
+
+def export_map(site, data):
+    """The map page, rendered again only when the people per place change"""
+    import plotly
+    import plotly.offline
+
+    site.write('plotly.min.js', plotly.__version__, lambda: plotly.offline.get_plotlyjs())
+    map_digest, rows = data.map_rows()
+    site.write('locations.json', map_digest, lambda: json.dumps(rows))
+    site.write('map.html', map_digest, lambda: render_map(rows))
+
+
+def render_map(rows):
+    if not rows:
+        return PAGE.format(title="Where Coaches Are From", head='',
+                           body='<p>No one has been added yet.</p>')
+    figures = [fig for fig in build_map_figures(rows) if fig is not None]
+    body = ''.join(fig.to_html(full_html=False, include_plotlyjs=False) for fig in figures)
+    return PAGE.format(title="Where Coaches Are From",
+                       head='<script src="plotly.min.js"></script>\n', body=body)
+
+
+def export_events(site, events, per_page):
+    """The Box Cutters pages, most recent event first; returns the number of pages"""
+    pages = max(1, math.ceil(len(events) / per_page))
+    for page in range(1, pages + 1):
+        items = []
+        for event in events[(page - 1) * per_page:page * per_page]:
+            items.append({
+                'id': event['id'],
+                'name': event['name'],
+                'date': event['date'],
+                'photos': [url for url in (_photo(site, event, path) for path in event['photos'])
+                           if url],
+            })
+        key = digest([page, pages, items])
+        site.write(_page_name('events.html', 'events', page, 'json'), key,
+                   lambda: json.dumps({'page': page, 'pages': pages, 'events': items}))
+        site.write(_page_name('events.html', 'events', page), key,
+                   lambda: render_events_page(items, page, pages))
+    return pages
+
+
+def render_events_page(items, page, pages):
+    sections = []
+    for item in items:
+        photos = ''.join(f'<img src="{html.escape(url)}" alt="" loading="lazy">'
+                         for url in item['photos'])
+        sections.append(f'<h2>{html.escape(item["name"])}</h2>'
+                        f'<p class="caption">{html.escape(item["date"] or "")}</p>'
+                        f'<div class="grid">{photos}</div>')
+    body = ''.join(sections) or '<p>No events added yet.</p>'
+    return PAGE.format(title="Hackathon Box Cutters", head='',
+                       body=body + _pager('events.html', 'events', page, pages))
+
+
+def export(data, root, page_size=SNAPSHOT_PAGE_SIZE, events_per_page=EVENTS_PER_PAGE):
+    """Bring the snapshot under ``root`` up to date with ``data``; returns a report"""
+    started = time.perf_counter()
+    # Published lists are never changed in place, so these stay consistent
+    people, events = data.people, data.filter_events()
+    site = SiteWriter(root)
+    site.write('style.css', STYLE, lambda: STYLE)
+    people_pages = export_people(site, data, people, page_size)
+    export_map(site, data)
+    event_pages = export_events(site, events, events_per_page)
+    summary = {'people': len(people), 'people_pages': people_pages,
+               'events': len(events), 'event_pages': event_pages}
+    site.write('summary.json', digest(summary), lambda: json.dumps(summary))
+    removed = site.finish()
+    return dict(summary, written=site.written, unchanged=site.skipped, removed=removed,
+                seconds=time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output', help="directory to write the snapshot into")
+    parser.add_argument('--page-size', type=int, default=SNAPSHOT_PAGE_SIZE,
+                        help="people per page of the grid")
+    parser.add_argument('--events-per-page', type=int, default=EVENTS_PER_PAGE)
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                        help="keep running and export again when the data changed, checking this often")
+    args = parser.parse_args()
+
+    data = SharedData(open_store(), COUNTRIES, US_STATES)
+    print(json.dumps(export(data, args.output, args.page_size, args.events_per_page)), flush=True)
+    while args.watch:
+        time.sleep(args.watch)
+        try:
+            if data.sync():
+                print(json.dumps(export(data, args.output, args.page_size, args.events_per_page)),
+                      flush=True)
+        except Exception as e:
+            print(f"Snapshot failed: {e}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
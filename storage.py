@@ -0,0 +1,657 @@
+"""Storage backends for people and events.
+
+The app keeps people and events as plain dicts (see ``shared_data``).  A
+store persists those dicts; every write method describes the change that was
+made so a backend only has to touch the affected rows.  ``SQLiteStore`` is
+the default, ``JsonStore`` keeps the original ``people_data.json`` /
+``events_data.json`` layout.
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from photo_meta import ensure_photo_meta, refresh_cover, scan_photo_meta
+
+PEOPLE_JSON = 'people_data.json'
+EVENTS_JSON = 'events_data.json'
+DEFAULT_DB_PATH = 'app_data.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS people (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    country TEXT,
+    state TEXT,
+    cover_photo TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_people_name ON people (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_people_location ON people (country, state);
+
+CREATE TABLE IF NOT EXISTS photos (
+    id INTEGER PRIMARY KEY,
+    person_id INTEGER NOT NULL REFERENCES people (id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    captured_at TEXT,
+    uploaded_at TEXT,
+    width INTEGER,
+    height INTEGER,
+    bytes INTEGER,
+    ok INTEGER,
+    phash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_photos_person ON photos (person_id);
+
+CREATE TABLE IF NOT EXISTS meetings (
+    id INTEGER PRIMARY KEY,
+    person_id INTEGER NOT NULL REFERENCES people (id) ON DELETE CASCADE,
+    date TEXT NOT NULL,
+    location TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_meetings_person_date ON meetings (person_id, date);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_date ON events (date);
+
+CREATE TABLE IF NOT EXISTS event_photos (
+    id INTEGER PRIMARY KEY,
+    event_id INTEGER NOT NULL REFERENCES events (id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    captured_at TEXT,
+    uploaded_at TEXT,
+    width INTEGER,
+    height INTEGER,
+    bytes INTEGER,
+    ok INTEGER,
+    phash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_event_photos_event ON event_photos (event_id);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+PHOTO_META_COLUMNS = ['captured_at', 'uploaded_at', 'width', 'height', 'bytes', 'ok', 'phash']
+# Columns added after the first release, for upgrading existing databases
+ADDED_COLUMNS = {
+    'people': [('cover_photo', 'TEXT')],
+    'photos': [('captured_at', 'TEXT'), ('uploaded_at', 'TEXT'), ('width', 'INTEGER'),
+               ('height', 'INTEGER'), ('bytes', 'INTEGER'), ('ok', 'INTEGER'), ('phash', 'TEXT')],
+}
+ADDED_COLUMNS['event_photos'] = ADDED_COLUMNS['photos']
+
+
+def normalize_person(person):
+    """Bring a person dict up to the current shape (photos list, meetings list)"""
+    if 'photos' not in person:
+        photo = person.pop('photo', None)
+        person['photos'] = [photo] if photo else []
+    person['photos'] = [p for p in person['photos'] if p]
+    if 'meetings' not in person:
+        # Very old records only had a list of dates
+        person['meetings'] = [{"date": d, "location": ""} for d in person.pop('dates', [])]
+    person.setdefault('country', 'United States')
+    person.setdefault('state', None)
+    if ensure_photo_meta(person) or 'cover_photo' not in person:
+        refresh_cover(person)
+    return person
+
+
+def normalize_event(event):
+    event.setdefault('photos', [])
+    ensure_photo_meta(event)
+    return event
+
+
+def _assign_ids(records):
+    """Give every record without an id one that is unique within the list"""
+    next_id = max((r['id'] for r in records if r.get('id') is not None), default=0) + 1
+    for record in records:
+        if record.get('id') is None:
+            record['id'] = next_id
+            next_id += 1
+    return records
+
+
+class Store:
+    """Interface shared by all storage backends"""
+
+    def load_people(self):
+        raise NotImplementedError
+
+    def load_events(self):
+        raise NotImplementedError
+
+    def iter_people(self, after_id=0):
+        """People with an id above ``after_id``, in id order"""
+        for person in sorted(self.load_people(), key=lambda p: p['id']):
+            if person['id'] > after_id:
+                yield person
+
+    def get_person(self, person_id):
+        """The stored person with id ``person_id``, or None"""
+        for person in self.iter_people(after_id=person_id - 1):
+            return person if person['id'] == person_id else None
+        return None
+
+    def data_version(self):
+        """A value that changes when another process writes to the store, not on our own writes"""
+        raise NotImplementedError
+
+    def add_person(self, person):
+        """Persist a new person with its photos and meetings; sets ``person['id']``"""
+        raise NotImplementedError
+
+    def update_person(self, person):
+        """Persist name/country/state of an existing person"""
+        raise NotImplementedError
+
+    def delete_person(self, person):
+        raise NotImplementedError
+
+    def add_photo(self, person, path):
+        """Persist a photo already added to ``person`` (with its metadata and cover)"""
+        raise NotImplementedError
+
+    def remove_photo(self, person, path):
+        raise NotImplementedError
+
+    def update_photo_meta(self, person, path):
+        """Persist changed metadata of one photo of ``person``, and its cover"""
+        raise NotImplementedError
+
+    def add_meeting(self, person, meeting):
+        raise NotImplementedError
+
+    def remove_meeting(self, person, meeting):
+        raise NotImplementedError
+
+    def clear_people(self):
+        raise NotImplementedError
+
+    def add_event(self, event):
+        """Persist a new event with its photos; sets ``event['id']``"""
+        raise NotImplementedError
+
+    def delete_event(self, event):
+        raise NotImplementedError
+
+    def update_event_photo_meta(self, event, path):
+        raise NotImplementedError
+
+    def clear_events(self):
+        raise NotImplementedError
+
+
+@contextmanager
+def _file_lock(path):
+    """Hold an exclusive lock on ``path``.lock, shared with other processes"""
+    if fcntl is None:
+        yield
+        return
+    with open(path + '.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write_json_atomic(path, data):
+    """Write to a temp file and rename it over ``path`` so a crash never truncates it"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class JsonStore(Store):
+    """The original whole-file JSON layout.
+
+    Every write still rewrites the whole file, but records are matched by id
+    against what is on disk so concurrent writers don't drop each other's
+    rows.  The read-modify-write holds a file lock, so other processes wait
+    their turn, and files are replaced atomically.
+    """
+
+    def __init__(self, people_path=PEOPLE_JSON, events_path=EVENTS_JSON):
+        self.people_path = people_path
+        self.events_path = events_path
+        self._lock = threading.Lock()
+        # path -> (mtime before our latest run of writes, mtime after it)
+        self._own_writes = {}
+
+    def _read(self, path, normalize):
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r') as f:
+            return _assign_ids([normalize(r) for r in json.load(f)])
+
+    def load_people(self):
+        with self._lock:
+            return self._read(self.people_path, normalize_person)
+
+    def load_events(self):
+        with self._lock:
+            return self._read(self.events_path, normalize_event)
+
+    @staticmethod
+    def _mtime(path):
+        return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+    def data_version(self):
+        # Like SQLite's data_version: our own writes don't count, so the
+        # modification time a file had before them stands in for theirs
+        with self._lock:
+            version = []
+            for path in (self.people_path, self.events_path):
+                mtime = self._mtime(path)
+                before, after = self._own_writes.get(path, (None, None))
+                version.append(before if mtime == after else mtime)
+            return tuple(version)
+
+    def _modify(self, path, normalize, change):
+        with self._lock, _file_lock(path):
+            before = self._mtime(path)
+            own_before, own_after = self._own_writes.get(path, (None, None))
+            if own_after is not None and before == own_after:
+                # Nobody wrote since our last write
+                before = own_before
+            records = self._read(path, normalize)
+            records = change(records)
+            _write_json_atomic(path, records)
+            self._own_writes[path] = (before, self._mtime(path))
+
+    def _upsert(self, path, normalize, record):
+        def change(records):
+            if record.get('id') is None:
+                record['id'] = max((r['id'] for r in records), default=0) + 1
+            for i, r in enumerate(records):
+                if r['id'] == record['id']:
+                    records[i] = record
+                    break
+            else:
+                records.append(record)
+            return records
+        self._modify(path, normalize, change)
+
+    def _delete(self, path, normalize, record):
+        self._modify(path, normalize,
+                     lambda records: [r for r in records if r['id'] != record.get('id')])
+
+    def add_person(self, person):
+        self._upsert(self.people_path, normalize_person, person)
+
+    def update_person(self, person):
+        self._upsert(self.people_path, normalize_person, person)
+
+    def delete_person(self, person):
+        self._delete(self.people_path, normalize_person, person)
+
+    def add_photo(self, person, path):
+        self._upsert(self.people_path, normalize_person, person)
+
+    def remove_photo(self, person, path):
+        self._upsert(self.people_path, normalize_person, person)
+
+    def update_photo_meta(self, person, path):
+        self._upsert(self.people_path, normalize_person, person)
+
+    def add_meeting(self, person, meeting):
+        self._upsert(self.people_path, normalize_person, person)
+
+    def remove_meeting(self, person, meeting):
+        self._upsert(self.people_path, normalize_person, person)
+
+    def clear_people(self):
+        self._modify(self.people_path, normalize_person, lambda records: [])
+
+    def add_event(self, event):
+        self._upsert(self.events_path, normalize_event, event)
+
+    def delete_event(self, event):
+        self._delete(self.events_path, normalize_event, event)
+
+    def update_event_photo_meta(self, event, path):
+        self._upsert(self.events_path, normalize_event, event)
+
+    def clear_events(self):
+        self._modify(self.events_path, normalize_event, lambda records: [])
+
+
+class SQLiteStore(Store):
+    """Indexed SQLite store; each write only touches the rows that changed.
+
+    One connection is shared by every Streamlit session thread, guarded by a
+    lock.  WAL journaling keeps the database consistent if the process dies
+    mid-write.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        self._conn.executescript(SCHEMA)
+        self._upgrade_schema()
+
+    def _upgrade_schema(self):
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row['name'] for row in self._conn.execute(f'PRAGMA table_info({table})')}
+            for column, column_type in columns:
+                if column not in existing:
+                    self._conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work(self._conn)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return result
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def data_version(self):
+        # Changes when another connection commits, not on our own writes
+        return self._query('PRAGMA data_version')[0][0]
+
+    def get_meta(self, key, default=None):
+        rows = self._query('SELECT value FROM meta WHERE key = ?', (key,))
+        return rows[0]['value'] if rows else default
+
+    def set_meta(self, key, value):
+        self._transaction(lambda c: c.execute(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value)))
+
+    @staticmethod
+    def _meta_from_row(row):
+        meta = {column: row[column] for column in PHOTO_META_COLUMNS}
+        meta['ok'] = bool(meta['ok'])
+        return meta
+
+    @staticmethod
+    def _meta_params(record, path):
+        meta = record.get('photo_meta', {}).get(path, {})
+        return tuple(meta.get(column) for column in PHOTO_META_COLUMNS)
+
+    @staticmethod
+    def _person_from_row(row):
+        return {
+            "id": row['id'],
+            "name": row['name'],
+            "photos": [],
+            "photo_meta": {},
+            "cover_photo": row['cover_photo'],
+            "country": row['country'],
+            "state": row['state'],
+            "meetings": [],
+        }
+
+    def load_people(self):
+        people = {}
+        for row in self._query('SELECT id, name, country, state, cover_photo FROM people ORDER BY id'):
+            people[row['id']] = self._person_from_row(row)
+        for row in self._query(
+                f'SELECT person_id, path, {", ".join(PHOTO_META_COLUMNS)} FROM photos ORDER BY id'):
+            person = people[row['person_id']]
+            person['photos'].append(row['path'])
+            person['photo_meta'][row['path']] = self._meta_from_row(row)
+        for row in self._query(
+                'SELECT person_id, date, location FROM meetings ORDER BY person_id, date, id'):
+            people[row['person_id']]['meetings'].append({
+                "date": row['date'],
+                "location": row['location']
+            })
+        return list(people.values())
+
+    def iter_people(self, after_id=0, batch_size=500):
+        """People with an id above ``after_id``, in id order, read ``batch_size`` at a time"""
+        while True:
+            rows = self._query(
+                'SELECT id, name, country, state, cover_photo FROM people '
+                'WHERE id > ? ORDER BY id LIMIT ?', (after_id, batch_size))
+            if not rows:
+                return
+            people = {row['id']: self._person_from_row(row) for row in rows}
+            first, last = rows[0]['id'], rows[-1]['id']
+            for row in self._query(
+                    f'SELECT person_id, path, {", ".join(PHOTO_META_COLUMNS)} FROM photos '
+                    'WHERE person_id BETWEEN ? AND ? ORDER BY id', (first, last)):
+                person = people[row['person_id']]
+                person['photos'].append(row['path'])
+                person['photo_meta'][row['path']] = self._meta_from_row(row)
+            for row in self._query(
+                    'SELECT person_id, date, location FROM meetings '
+                    'WHERE person_id BETWEEN ? AND ? ORDER BY person_id, date, id', (first, last)):
+                people[row['person_id']]['meetings'].append({
+                    "date": row['date'],
+                    "location": row['location']
+                })
+            yield from people.values()
+            after_id = last
+
+    def get_person(self, person_id):
+        for person in self.iter_people(after_id=person_id - 1, batch_size=1):
+            return person if person['id'] == person_id else None
+        return None
+
+    def load_events(self):
+        events = {}
+        for row in self._query('SELECT id, name, date FROM events ORDER BY id'):
+            events[row['id']] = {
+                "id": row['id'],
+                "name": row['name'],
+                "date": row['date'],
+                "photos": [],
+                "photo_meta": {}
+            }
+        for row in self._query(
+                f'SELECT event_id, path, {", ".join(PHOTO_META_COLUMNS)} FROM event_photos ORDER BY id'):
+            event = events[row['event_id']]
+            event['photos'].append(row['path'])
+            event['photo_meta'][row['path']] = self._meta_from_row(row)
+        return list(events.values())
+
+    @classmethod
+    def _insert_photo(cls, conn, table, owner_column, record, path):
+        conn.execute(
+            f'INSERT INTO {table} ({owner_column}, path, {", ".join(PHOTO_META_COLUMNS)}) '
+            f'VALUES (?, ?, {", ".join("?" * len(PHOTO_META_COLUMNS))})',
+            (record['id'], path) + cls._meta_params(record, path))
+
+    @classmethod
+    def _insert_person(cls, conn, person):
+        cursor = conn.execute(
+            'INSERT INTO people (id, name, country, state, cover_photo) VALUES (?, ?, ?, ?, ?)',
+            (person.get('id'), person['name'], person.get('country'), person.get('state'),
+             person.get('cover_photo')))
+        person['id'] = cursor.lastrowid
+        for path in person.get('photos', []):
+            cls._insert_photo(conn, 'photos', 'person_id', person, path)
+        conn.executemany('INSERT INTO meetings (person_id, date, location) VALUES (?, ?, ?)',
+                         [(person['id'], m['date'], m.get('location'))
+                          for m in person.get('meetings', [])])
+
+    @classmethod
+    def _insert_event(cls, conn, event):
+        cursor = conn.execute('INSERT INTO events (id, name, date) VALUES (?, ?, ?)',
+                              (event.get('id'), event['name'], event['date']))
+        event['id'] = cursor.lastrowid
+        for path in event.get('photos', []):
+            cls._insert_photo(conn, 'event_photos', 'event_id', event, path)
+
+    @staticmethod
+    def _update_cover(conn, person):
+        conn.execute('UPDATE people SET cover_photo = ? WHERE id = ?',
+                     (person.get('cover_photo'), person['id']))
+
+    def add_person(self, person):
+        self._transaction(lambda c: self._insert_person(c, person))
+
+    def update_person(self, person):
+        self._transaction(lambda c: c.execute(
+            'UPDATE people SET name = ?, country = ?, state = ? WHERE id = ?',
+            (person['name'], person.get('country'), person.get('state'), person['id'])))
+
+    def delete_person(self, person):
+        self._transaction(lambda c: c.execute('DELETE FROM people WHERE id = ?', (person['id'],)))
+
+    def add_photo(self, person, path):
+        def work(conn):
+            self._insert_photo(conn, 'photos', 'person_id', person, path)
+            self._update_cover(conn, person)
+        self._transaction(work)
+
+    def remove_photo(self, person, path):
+        def work(conn):
+            conn.execute(
+                'DELETE FROM photos WHERE id = '
+                '(SELECT id FROM photos WHERE person_id = ? AND path = ? LIMIT 1)',
+                (person['id'], path))
+            self._update_cover(conn, person)
+        self._transaction(work)
+
+    def update_photo_meta(self, person, path):
+        def work(conn):
+            conn.execute(
+                f'UPDATE photos SET {", ".join(c + " = ?" for c in PHOTO_META_COLUMNS)} '
+                'WHERE person_id = ? AND path = ?',
+                self._meta_params(person, path) + (person['id'], path))
+            self._update_cover(conn, person)
+        self._transaction(work)
+
+    def add_meeting(self, person, meeting):
+        self._transaction(lambda c: c.execute(
+            'INSERT INTO meetings (person_id, date, location) VALUES (?, ?, ?)',
+            (person['id'], meeting['date'], meeting.get('location'))))
+
+    def remove_meeting(self, person, meeting):
+        self._transaction(lambda c: c.execute(
+            'DELETE FROM meetings WHERE id = '
+            '(SELECT id FROM meetings WHERE person_id = ? AND date = ? AND location IS ? LIMIT 1)',
+            (person['id'], meeting['date'], meeting.get('location'))))
+
+    def clear_people(self):
+        self._transaction(lambda c: c.execute('DELETE FROM people'))
+
+    def add_event(self, event):
+        self._transaction(lambda c: self._insert_event(c, event))
+
+    def delete_event(self, event):
+        self._transaction(lambda c: c.execute('DELETE FROM events WHERE id = ?', (event['id'],)))
+
+    def update_event_photo_meta(self, event, path):
+        self._transaction(lambda c: c.execute(
+            f'UPDATE event_photos SET {", ".join(c + " = ?" for c in PHOTO_META_COLUMNS)} '
+            'WHERE event_id = ? AND path = ?',
+            self._meta_params(event, path) + (event['id'], path)))
+
+    def clear_events(self):
+        self._transaction(lambda c: c.execute('DELETE FROM events'))
+
+    def migrate_from_json(self, people_path=PEOPLE_JSON, events_path=EVENTS_JSON):
+        """One-shot import of the legacy JSON files.
+
+        Runs only once per database; the JSON files are left in place as a
+        backup.  Returns the number of people and events imported.
+        """
+        if self.get_meta('migrated_from_json'):
+            return 0, 0
+        legacy = JsonStore(people_path, events_path)
+        people = legacy.load_people()
+        events = legacy.load_events()
+
+        def work(conn):
+            for person in people:
+                self._insert_person(conn, person)
+            for event in events:
+                self._insert_event(conn, event)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', '1')")
+        self._transaction(work)
+        return len(people), len(events)
+
+    def backfill_photo_meta(self):
+        """Scan photos stored before metadata was captured; returns how many"""
+        rows = self._query(
+            "SELECT 'photos' AS tbl, id, path FROM photos WHERE ok IS NULL OR (ok AND phash IS NULL) "
+            "UNION ALL SELECT 'event_photos', id, path FROM event_photos WHERE ok IS NULL")
+        if not rows:
+            return 0
+        updates = [(row['tbl'], row['id'], scan_photo_meta(row['path'])) for row in rows]
+
+        def work(conn):
+            for table, row_id, meta in updates:
+                conn.execute(
+                    f'UPDATE {table} SET {", ".join(c + " = ?" for c in PHOTO_META_COLUMNS)} '
+                    'WHERE id = ?',
+                    tuple(meta[c] for c in PHOTO_META_COLUMNS) + (row_id,))
+        self._transaction(work)
+
+        changed = []
+        for person in self.load_people():
+            cover = person['cover_photo']
+            if refresh_cover(person) != cover:
+                changed.append(person)
+
+        def update_covers(conn):
+            for person in changed:
+                self._update_cover(conn, person)
+        self._transaction(update_covers)
+        return len(updates)
+
+
+BACKENDS = {
+    'sqlite': SQLiteStore,
+    'json': JsonStore,
+}
+
+
+def open_store(backend=None):
+    """Create the configured store.
+
+    The backend comes from ``STORAGE_BACKEND`` (``sqlite`` by default, or
+    ``json``); the SQLite file from ``DATA_DB_PATH``.
+    """
+    backend = backend or os.environ.get('STORAGE_BACKEND', 'sqlite')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend {backend!r}, expected one of {sorted(BACKENDS)}")
+    if backend == 'sqlite':
+        store = SQLiteStore(os.environ.get('DATA_DB_PATH', DEFAULT_DB_PATH))
+        store.migrate_from_json()
+        store.backfill_photo_meta()
+        return store
+    return JsonStore()
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from photo_meta import refresh_cover  # noqa: E402
+from storage import JsonStore, SQLiteStore  # noqa: E402
+
+
+def photo_meta(phash='0' * 32, uploaded_at='2024-01-01T00:00:00'):
+    return {"captured_at": None, "uploaded_at": uploaded_at, "width": 10, "height": 10,
+            "bytes": 3, "ok": True, "phash": phash}
+
+
+def new_person(name, photos=(), meetings=(), country='United States', state=None):
+    person = {
+        "name": name,
+        "country": country,
+        "state": state,
+        "photos": list(photos),
+        "photo_meta": {path: photo_meta() for path in photos},
+        "meetings": [dict(m) for m in meetings],
+    }
+    refresh_cover(person)
+    return person
+
+
+@pytest.fixture(params=['sqlite', 'json'])
+def open_store(request, tmp_path):
+    """Opens a store on the same files each time it is called, like another process would"""
+    def open_store():
+        if request.param == 'sqlite':
+            return SQLiteStore(str(tmp_path / 'app_data.db'))
+        return JsonStore(str(tmp_path / 'people.json'), str(tmp_path / 'events.json'))
+    return open_store
@@ -0,0 +1,34 @@
+from bulk import Importer
+from conftest import new_person, photo_meta
+from image_store import ImageStore
+
+
+def test_import_merges_into_stored_people_without_duplicates(open_store, tmp_path):
+    store = open_store()
+    store.add_person(new_person('Ada Lovelace', photos=['images/a.webp']))
+    importer = Importer(store, ImageStore(str(tmp_path / 'images')), photos=None)
+    meeting = {"date": "2024-05-01", "location": "Paris"}
+
+    for _ in range(2):  # a replayed chunk changes nothing
+        importer.apply({"name": "ADA LOVELACE", "meetings": [meeting]},
+                       [('images/a.webp', photo_meta()), ('images/b.webp', photo_meta())])
+        importer.apply({"name": "Bob", "country": "France", "meetings": []}, [])
+
+    people = {p['name']: p for p in open_store().load_people()}
+    assert sorted(people) == ['Ada Lovelace', 'Bob']
+    assert people['Ada Lovelace']['photos'] == ['images/a.webp', 'images/b.webp']
+    assert people['Ada Lovelace']['meetings'] == [meeting]
+    assert people['Bob']['country'] == 'France'
+    assert importer.imported == {"people": 1, "photos": 1, "meetings": 1}
+    assert importer.person_ids == {'ada lovelace': people['Ada Lovelace']['id'],
+                                   'bob': people['Bob']['id']}
+
+
+def test_get_person(open_store):
+    store = open_store()
+    ada, bob = new_person('Ada'), new_person('Bob')
+    store.add_person(ada)
+    store.add_person(bob)
+    assert open_store().get_person(bob['id'])['name'] == 'Bob'
+    store.delete_person(ada)
+    assert open_store().get_person(ada['id']) is None
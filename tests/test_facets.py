@@ -0,0 +1,50 @@
+from facets import EventIndex, intersect
+
+
+def test_intersect():
+    assert intersect([]) is None
+    assert intersect([None, None]) is None
+    assert intersect([{1, 2, 3}, None, {2: 'Bob', 3: 'Cy'}.keys(), {3: 'Cy', 4: 'Di'}]) == {3}
+    assert intersect([{1}, set()]) == set()
+    # The result is a new set
+    ids = {1, 2}
+    assert intersect([ids]) is not ids
+
+
+def events():
+    return [
+        {'id': 1, 'name': 'Summer Party', 'date': '2024-07-01'},
+        {'id': 2, 'name': 'Party at Zoë’s', 'date': '2024-02-10'},
+        {'id': 3, 'name': 'Sunday brunch', 'date': '2023-12-24'},
+        {'id': 4, 'name': 'Undated party'},
+    ]
+
+
+def test_events_by_name():
+    index = EventIndex(events())
+    assert index.named('par') == {1, 2, 4}
+    assert index.named('SU') == {1, 3}
+    assert index.named('party su') == {1}
+    assert index.named('zoe') == {2}
+    assert index.named('partyy') == set()
+    assert index.named('zz') == set()
+
+
+def test_events_by_date_most_recent_first():
+    index = EventIndex(events())
+    assert index.between() == [1, 2, 3, 4]
+    assert index.between('2024-01-01') == [1, 2]
+    assert index.between(end='2024-02-10') == [2, 3, 4]
+    assert index.between('2024-02-10', '2024-02-10') == [2]
+
+
+def test_index_follows_changes():
+    index = EventIndex(events())
+    index.remove(1)
+    index.remove(1)
+    index.add({'id': 5, 'name': 'Spring party', 'date': '2024-04-01'})
+    assert len(index) == 4
+    assert index.named('party') == {2, 4, 5}
+    assert index.between('2024-01-01') == [5, 2]
+    index.clear()
+    assert len(index) == 0 and index.named('party') == set() and index.between() == []
@@ -0,0 +1,60 @@
+import os
+import time
+
+import pytest
+
+from image_cache import ImageCache
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_least_recently_used_photos_are_evicted(tmp_path):
+    cache = ImageCache(max_bytes=25)
+    a, b, c = (write(tmp_path, name, name.encode() * 10) for name in 'abc')
+    cache.get(a)
+    cache.get(b)
+    cache.get(a)
+    cache.get(c)
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions']) == (2, 20, 1)
+
+    cache.get(a)
+    assert cache.stats()['hits'] == 2
+    cache.get(b)
+    assert cache.stats()['misses'] == 4
+
+
+def test_files_larger_than_the_budget_are_not_kept(tmp_path):
+    cache = ImageCache(max_bytes=5)
+    path = write(tmp_path, 'big', b'x' * 10)
+    assert cache.get(path) == b'x' * 10
+    assert cache.stats()['entries'] == 0
+
+
+def test_changed_files_are_read_again(tmp_path):
+    cache = ImageCache()
+    path = write(tmp_path, 'a', b'old')
+    assert cache.get(path) == b'old'
+    write(tmp_path, 'a', b'new!')
+    later = time.time() + 10
+    os.utime(path, (later, later))
+    assert cache.get(path) == b'new!'
+    assert cache.stats()['bytes'] == 4
+
+    os.remove(path)
+    with pytest.raises(FileNotFoundError):
+        cache.get(path)
+
+
+def test_prefetched_photos_are_hits(tmp_path):
+    cache = ImageCache()
+    paths = [write(tmp_path, name, b'photo') for name in 'ab']
+    cache.prefetch(paths + [str(tmp_path / 'gone')])
+    cache._executor.shutdown(wait=True)
+    assert cache.stats()['prefetched'] == 2
+    assert cache.get(paths[0]) == b'photo'
+    assert cache.stats()['hits'] == 1
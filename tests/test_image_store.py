@@ -0,0 +1,70 @@
+import os
+import time
+
+from image_store import ImageStore, derivative_path, write_blob
+
+
+def test_refs_keep_the_blob_until_the_last_release(tmp_path):
+    store = ImageStore(str(tmp_path / 'images'))
+    path = write_blob(b'photo', store.root, 'webp', derivatives=[('medium', b'bigger', 'webp')])
+    assert write_blob(b'photo', store.root, 'webp') == path
+    store.add_ref(path)
+    store.add_ref(path)
+    assert store.refcount(path) == 2
+
+    assert store.release(path) is False
+    assert os.path.exists(path)
+    assert store.release(path) is True
+    assert not os.path.exists(path)
+    assert not os.path.exists(derivative_path(path, 'medium'))
+    assert store.refcount(path) == 0
+    assert store.release(path) is False
+
+
+def test_legacy_paths_are_deleted_on_release(tmp_path):
+    store = ImageStore(str(tmp_path / 'images'))
+    legacy = tmp_path / 'images' / 'ada_20240101_120000.jpg'
+    legacy.write_bytes(b'old')
+    assert store.release(str(legacy)) is True
+    assert not legacy.exists()
+
+
+def test_reclaim_spares_recent_orphans(tmp_path):
+    store = ImageStore(str(tmp_path / 'images'))
+    path = write_blob(b'orphan', store.root, 'webp')
+    before = time.time() - 60
+    assert store.reclaim(path, before) is False
+    assert os.path.exists(path)
+
+    os.utime(path, (before - 60, before - 60))
+    assert store.reclaim(path, before) is True
+    assert not os.path.exists(path)
+
+
+def test_reclaim_spares_recently_referenced_blobs(tmp_path):
+    store = ImageStore(str(tmp_path / 'images'))
+    path = write_blob(b'shared', store.root, 'webp')
+    os.utime(path, (0, 0))
+    store.add_ref(path)
+    assert store.reclaim(path, time.time() - 60) is False
+    assert os.path.exists(path)
+
+
+def test_set_refcount_only_applies_to_the_expected_count(tmp_path):
+    store = ImageStore(str(tmp_path / 'images'))
+    path = write_blob(b'counted', store.root, 'webp')
+    store.add_ref(path)
+    later = time.time() + 1
+    assert store.set_refcount(path, 3, expected=2, before=later) is False
+    assert store.set_refcount(path, 3, expected=1, before=later) is True
+    assert store.refcount(path) == 3
+
+
+def test_add_ref_reports_a_blob_deleted_since_it_was_found(tmp_path):
+    store = ImageStore(str(tmp_path / 'images'))
+    path = write_blob(b'photo', store.root, 'webp')
+    assert store.add_ref(path) is True
+    found = write_blob(b'photo', store.root, 'webp')  # exists: not written again
+    store.release(path)
+    assert store.add_ref(found) is False
+    assert store.refcount(found) == 1
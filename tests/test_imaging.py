@@ -0,0 +1,65 @@
+import io
+
+import pytest
+from PIL import Image
+
+from imaging import ImageTooLargeError, open_reduced, process_sizes
+
+
+def encoded(size, fmt='JPEG', mode='RGB', exif=None):
+    buffer = io.BytesIO()
+    img = Image.new(mode, size, 'blue')
+    if exif:
+        img.save(buffer, fmt, exif=exif)
+    else:
+        img.save(buffer, fmt)
+    buffer.seek(0)
+    return buffer
+
+
+def test_jpeg_is_decoded_at_reduced_resolution():
+    img, info = open_reduced(encoded((4000, 3000)), min_side=300)
+    assert info['source_size'] == (4000, 3000)
+    assert info['format'] == 'JPEG'
+    assert 300 <= min(img.size) < 600
+
+
+def test_other_formats_are_reduced_after_decoding():
+    img, info = open_reduced(encoded((2400, 1800), fmt='PNG', mode='P'), min_side=300)
+    assert info['format'] == 'PNG'
+    assert img.mode == 'RGB'
+    assert 300 <= min(img.size) < 600
+
+
+def test_small_images_are_not_reduced():
+    img, _ = open_reduced(encoded((200, 100), fmt='PNG'), min_side=300)
+    assert img.size == (200, 100)
+
+
+def test_orientation_and_capture_time_are_read_from_exif():
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    exif[0x0132] = '2023:07:14 18:30:00'
+    _, info = open_reduced(encoded((640, 480), exif=exif))
+    assert info['orientation'] == 6
+    assert info['captured_at'] == '2023-07-14T18:30:00'
+
+
+def test_images_over_the_pixel_limit_are_refused():
+    with pytest.raises(ImageTooLargeError):
+        open_reduced(encoded((1000, 1000), fmt='PNG'), max_pixels=999_999)
+    open_reduced(encoded((1000, 1000), fmt='PNG'), max_pixels=1_000_000)
+
+
+def test_images_over_the_decode_limit_are_refused():
+    # A JPEG is measured after the decoder has scaled it down
+    open_reduced(encoded((4000, 4000)), min_side=300, max_decode_bytes=1_000_000)
+    with pytest.raises(ImageTooLargeError):
+        open_reduced(encoded((4000, 4000), fmt='PNG'), min_side=300, max_decode_bytes=1_000_000)
+
+
+def test_sizes_are_not_scaled_up():
+    images, _ = process_sizes(encoded((500, 400)), [300, 768])
+    assert list(images) == [300]
+    images, _ = process_sizes(encoded((1600, 1200)), [300, 768])
+    assert {size: img.size for size, img in images.items()} == {768: (768, 768), 300: (300, 300)}
@@ -0,0 +1,64 @@
+import io
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from PIL import Image
+
+import ingest
+from image_store import ImageStore
+from ingest import _add_ref, ingest_batch, process_to_blob
+
+
+def jpeg_bytes(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def test_ingest_shares_blobs_of_identical_uploads(tmp_path):
+    store = ImageStore(str(tmp_path / 'images'))
+    uploads = [io.BytesIO(jpeg_bytes('red')), io.BytesIO(jpeg_bytes('red')),
+               io.BytesIO(b'not an image')]
+    photos, errors = ingest_batch(uploads, store, parallel=False)
+    assert len(photos) == 2 and len(errors) == 1
+    assert photos[0][0] == photos[1][0]
+    assert store.refcount(photos[0][0]) == 2
+
+
+def test_blob_released_before_the_reference_is_written_again(tmp_path):
+    store = ImageStore(str(tmp_path / 'images'))
+    data = jpeg_bytes('blue')
+    earlier = process_to_blob(data, store.root)
+    store.add_ref(earlier[0])
+
+    # A worker finds the blob there, then its last reference goes
+    photo = process_to_blob(data, store.root)
+    assert store.release(earlier[0]) is True
+
+    photo = _add_ref(store, photo, data)
+    assert os.path.exists(photo[0])
+    assert store.refcount(photo[0]) == 1
+
+
+class KillsWorkers(io.BytesIO):
+    """An upload that kills the pool's workers when it is read, as the OOM killer would"""
+
+    def getvalue(self):
+        for process in list(ingest.get_executor()._processes.values()):
+            process.kill()
+        return super().getvalue()
+
+
+def test_pool_is_replaced_when_a_worker_dies(tmp_path):
+    store = ImageStore(str(tmp_path / 'images'))
+    executor = ingest.get_executor()
+    with pytest.raises(BrokenProcessPool):
+        executor.submit(os._exit, 1).result()
+
+    uploads = [io.BytesIO(jpeg_bytes('red')), KillsWorkers(jpeg_bytes('green')),
+               io.BytesIO(jpeg_bytes('blue'))]
+    photos, errors = ingest_batch(uploads, store, parallel=True)
+    assert errors == []
+    assert len(photos) == 3
+    assert ingest.get_executor() is not executor
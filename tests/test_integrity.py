@@ -0,0 +1,135 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+from conftest import new_person
+from image_store import ImageStore, write_blob
+from integrity import IntegrityScanner, StoreRecords
+from shared_data import SharedData
+from storage import SQLiteStore
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_in_another_process(db_path, root):
+    """Store a person with a photo the way a bulk import does; returns the photo's path"""
+    script = textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {REPO!r})
+        from image_store import ImageStore, write_blob
+        from storage import SQLiteStore
+        images = ImageStore({root!r})
+        path = write_blob(b'imported photo', images.root, 'webp')
+        images.add_ref(path)
+        SQLiteStore({db_path!r}).add_person({{
+            "name": "Imported", "photos": [path],
+            "photo_meta": {{path: {{"ok": True, "uploaded_at": "2024-01-01T00:00:00"}}}},
+            "cover_photo": path, "meetings": []}})
+        print(path)
+    """)
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def test_gc_keeps_photos_imported_by_another_process(tmp_path):
+    db_path, root = str(tmp_path / 'app_data.db'), str(tmp_path / 'images')
+    data = SharedData(SQLiteStore(db_path), countries=[], us_states=[])
+    images = ImageStore(root)
+    scanner = IntegrityScanner(data, images, roots=[root], grace_seconds=0)
+    scanner.scan()
+
+    path = import_in_another_process(db_path, root)
+    report = scanner.scan(repair=True)
+    assert report['orphans'] == 0
+    assert report['reclaimed'] == 0
+    assert os.path.exists(path)
+    assert [p['name'] for p in data.people] == ['Imported']
+
+
+def test_gc_reclaims_unreferenced_files(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'app_data.db'))
+    images = ImageStore(str(tmp_path / 'images'))
+    kept = write_blob(b'kept', images.root, 'webp')
+    images.add_ref(kept)
+    store.add_person(new_person('Ada', photos=[kept]))
+    orphan = write_blob(b'orphan', images.root, 'webp')
+
+    records = StoreRecords(store)
+    scanner = IntegrityScanner(records, images, roots=[images.root], grace_seconds=0)
+    report = scanner.scan(repair=True)
+    assert report['reclaimed'] == 1
+    assert os.path.exists(kept)
+    assert not os.path.exists(orphan)
+
+    other = ImageStore(images.root)
+    imported = write_blob(b'imported', other.root, 'webp')
+    other.add_ref(imported)
+    SQLiteStore(store.db_path).add_person(new_person('Bob', photos=[imported]))
+    assert scanner.scan(repair=True)['reclaimed'] == 0
+    assert os.path.exists(imported)
+
+
+def test_photo_marked_missing_is_shown_again_when_its_file_is_back(tmp_path):
+    from PIL import Image
+
+    data = SharedData(SQLiteStore(str(tmp_path / 'app_data.db')), countries=[], us_states=[])
+    images = ImageStore(str(tmp_path / 'images'))
+    path = str(tmp_path / 'images' / 'legacy.png')
+    Image.new('RGB', (8, 8), 'red').save(path)
+    person = data.add_person(new_person('Ada', photos=[path]))
+    scanner = IntegrityScanner(data, images, roots=[images.root], grace_seconds=0)
+
+    moved = path + '.bak'
+    os.rename(path, moved)
+    assert scanner.scan(repair=True)['marked_missing'] == 1
+    assert data.get_person(person['id'])['cover_photo'] is None
+
+    os.rename(moved, path)
+    report = scanner.scan(repair=True)
+    assert report['restored'] == 1
+    assert report['marked_found'] == 1
+    person = data.get_person(person['id'])
+    assert person['photo_meta'][path]['ok'] is True
+    assert person['photo_meta'][path]['uploaded_at'] == '2024-01-01T00:00:00'
+    assert person['cover_photo'] == path
+    assert scanner.scan(repair=True)['restored'] == 0
+
+
+def test_record_paths_in_any_form_match_the_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = SQLiteStore(str(tmp_path / 'app_data.db'))
+    images = ImageStore('images')
+    relative = write_blob(b'relative', images.root, 'webp')
+    absolute = os.path.abspath(write_blob(b'absolute', images.root, 'webp'))
+    dotted = './' + write_blob(b'dotted', images.root, 'webp')
+    outside = tmp_path / 'elsewhere.jpg'
+    outside.write_bytes(b'outside')
+    store.add_person(new_person('Ada', photos=[relative, absolute, dotted, str(outside)]))
+
+    scanner = IntegrityScanner(StoreRecords(store), images, roots=[images.root], grace_seconds=0)
+    report = scanner.scan(repair=True)
+    assert report['dangling'] == 0
+    assert report['orphans'] == 0
+    assert report['marked_missing'] == 0
+    assert all(os.path.exists(path) for path in (relative, absolute, dotted))
+
+
+def test_gone_photos_are_marked_missing_after_the_grace_period(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'app_data.db'))
+    images = ImageStore(str(tmp_path / 'images'))
+    gone = str(tmp_path / 'images' / 'gone.jpg')
+    store.add_person(new_person('Ada', photos=[gone]))
+    records = StoreRecords(store)
+
+    scanner = IntegrityScanner(records, images, roots=[images.root], grace_seconds=3600)
+    report = scanner.scan(repair=True)
+    assert report['dangling'] == 1
+    assert report['marked_missing'] == 0
+    assert records.people[0]['photo_meta'][gone]['ok'] is True
+
+    # Another scanner on the same manifest remembers when the photo went
+    scanner = IntegrityScanner(records, images, roots=[images.root], grace_seconds=0)
+    assert scanner.scan(repair=True)['marked_missing'] == 1
+    assert records.people[0]['photo_meta'][gone]['ok'] is False
+    assert scanner.scan(repair=True)['dangling'] == 0
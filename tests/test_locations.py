@@ -0,0 +1,54 @@
+from locations import COUNTRIES, US_STATES, LocationIndex, build_map_figures
+
+
+def person(person_id, name, country='United States', state=None):
+    return {'id': person_id, 'name': name, 'country': country, 'state': state}
+
+
+def rows_by_place(index):
+    return {(row['country'], row.get('state')): (row['people'], row['count'])
+            for row in index.map_rows()}
+
+
+def test_people_are_counted_per_country_and_state():
+    index = LocationIndex(COUNTRIES, US_STATES, [
+        person(1, 'Ada', state='Ohio'), person(2, 'Bob', state='Ohio'),
+        person(3, 'Cy', 'Canada', state='Ohio'), person(4, 'Di', state='Texas')])
+    assert rows_by_place(index) == {
+        ('United States', None): ('Ada, Bob, Di', 3),
+        ('United States', 'Ohio'): ('Ada, Bob', 2),
+        ('United States', 'Texas'): ('Di', 1),
+        ('Canada', None): ('Cy', 1),
+    }
+
+
+def test_index_follows_edits_and_removals():
+    index = LocationIndex(COUNTRIES, US_STATES, [person(1, 'Ada', state='Ohio'),
+                                                 person(2, 'Bob', 'Mexico')])
+    digest = index.digest()
+    index.update(person(1, 'Ada', state='Ohio'))
+    assert index.digest() == digest
+
+    index.update(person(1, 'Ada Lovelace', 'United Kingdom'))
+    index.remove(person(2, 'Bob', 'Mexico'))
+    assert rows_by_place(index) == {('United Kingdom', None): ('Ada Lovelace', 1)}
+    assert index.digest() != digest
+
+    index.remove(person(1, 'Ada Lovelace', 'United Kingdom'))
+    index.add(person(2, 'Bob', 'Mexico'))
+    index.add(person(1, 'Ada', state='Ohio'))
+    # Equal rows give an equal digest, however they were reached
+    assert index.digest() == LocationIndex(COUNTRIES, US_STATES, [
+        person(2, 'Bob', 'Mexico'), person(1, 'Ada', state='Ohio')]).digest()
+
+
+def test_map_figures_only_carry_the_places_with_people():
+    index = LocationIndex(COUNTRIES, US_STATES, [person(1, 'Ada', state='Ohio'),
+                                                 person(2, 'Bob', 'Canada')])
+    fig, fig_us = build_map_figures(index.map_rows())
+    assert sorted(f['id'] for f in fig.data[0].geojson['features']) == ['CAN', 'USA']
+    assert [f['id'] for f in fig_us.data[0].geojson['features']] == ['Ohio']
+
+    fig, fig_us = build_map_figures(LocationIndex(COUNTRIES, US_STATES, [
+        person(2, 'Bob', 'Canada')]).map_rows())
+    assert fig_us is None
@@ -0,0 +1,70 @@
+from names import NameIndex, edit_distance, normalize_name
+
+
+def index(*names):
+    return NameIndex([{"id": i, "name": name} for i, name in enumerate(names, 1)])
+
+
+def test_normalize_name():
+    assert normalize_name(' José  GARCÍA ') == 'jose garcia'
+
+
+def test_edit_distance():
+    assert edit_distance('john', 'jon') == 1
+    assert edit_distance('kitten', 'sitting') == 3
+
+
+def test_lookup_ignores_case_and_accents():
+    names = index('José García', 'Ada Lovelace')
+    assert names.lookup('jose garcia')['id'] == 1
+    assert names.lookup('Nobody') is None
+
+
+def test_search_prefix_on_any_word():
+    names = index('Ada Lovelace', 'Grace Hopper', 'Adam Smith')
+    assert [p['name'] for p in names.search('ad')] == ['Ada Lovelace', 'Adam Smith']
+    assert [p['name'] for p in names.search('hop')] == ['Grace Hopper']
+
+
+def test_search_fuzzy():
+    names = index('Katherine Johnson', 'Grace Hopper')
+    assert [p['name'] for p in names.search('Katharine Jonson')] == ['Katherine Johnson']
+
+
+def test_similar_finds_misspellings_but_not_the_name_itself():
+    names = index('Jonathan Smith', 'Johnathan Smith', 'Grace Hopper')
+    assert [p['name'] for p in names.similar('Jonathan Smith')] == ['Johnathan Smith']
+
+
+def test_index_follows_renames_and_removals():
+    names = index('Ada Lovelace')
+    person = {"id": 1, "name": "Ada King"}
+    names.update(person)
+    assert names.lookup('ada lovelace') is None
+    assert names.lookup('ada king') is person
+    names.remove(person)
+    assert names.search('ada') == []
+
+
+def test_similar_short_names():
+    names = index('John', 'Joan Baez', 'Bob')
+    assert [p['name'] for p in names.similar('Jon')] == ['John']
+    assert [p['name'] for p in names.similar('Jhon')] == ['John']
+    assert names.similar('John') == []
+
+
+def test_search_finds_names_one_edit_away():
+    names = index('John', 'Grace Hopper')
+    assert [p['name'] for p in names.search('Jon')] == ['John']
+
+
+def test_short_name_deletions_follow_adds_and_removals():
+    names = index('John', 'Jon Smith')
+    assert [p['name'] for p in names.similar('Jhon')] == ['John']
+    names.remove({"id": 1, "name": "John"})
+    assert names.similar('Jhon') == []
+    names.add({"id": 3, "name": "Joan"})
+    names.add({"id": 4, "name": "Joan"})
+    assert [p['id'] for p in names.similar('Jon')] == [3, 4]
+    names.clear()
+    assert names.similar('Jon') == []
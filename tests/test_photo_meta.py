@@ -0,0 +1,62 @@
+from PIL import Image
+
+from conftest import new_person, photo_meta
+from photo_meta import (add_photo, is_missing, mark_found, mark_missing, refresh_cover,
+                        remove_photo, scan_photo_meta)
+
+
+def test_cover_is_the_most_recent_healthy_photo():
+    person = new_person('Ada')
+    add_photo(person, 'old.jpg', photo_meta(uploaded_at='2024-01-01T00:00:00'))
+    add_photo(person, 'new.jpg', photo_meta(uploaded_at='2024-03-01T00:00:00'))
+    assert person['cover_photo'] == 'new.jpg'
+    # Taken earlier, even if uploaded last
+    taken = dict(photo_meta(uploaded_at='2024-06-01T00:00:00'), captured_at='2020-01-01T00:00:00')
+    add_photo(person, 'scan.jpg', taken)
+    assert person['cover_photo'] == 'new.jpg'
+    assert refresh_cover(person) == 'new.jpg'
+
+
+def test_removing_the_cover_picks_another():
+    person = new_person('Ada', photos=['a.jpg', 'b.jpg', 'a.jpg'])
+    person['photo_meta']['b.jpg']['uploaded_at'] = '2024-02-01T00:00:00'
+    refresh_cover(person)
+    assert remove_photo(person, 0) == 'a.jpg'
+    # Still stored once more
+    assert 'a.jpg' in person['photo_meta']
+    assert remove_photo(person, 0) == 'b.jpg'
+    assert 'b.jpg' not in person['photo_meta']
+    assert person['cover_photo'] == 'a.jpg'
+    remove_photo(person, 0)
+    assert person['cover_photo'] is None
+
+
+def test_missing_photos_are_not_the_cover_until_found(tmp_path):
+    path = str(tmp_path / 'a.png')
+    person = new_person('Ada', photos=[path, 'b.jpg'])
+    person['photo_meta'][path]['uploaded_at'] = '2024-05-01T00:00:00'
+    refresh_cover(person)
+    assert person['cover_photo'] == path
+
+    mark_missing(person, path)
+    assert is_missing(person, path)
+    assert person['cover_photo'] == 'b.jpg'
+    mark_missing(person, 'b.jpg')
+    assert person['cover_photo'] is None
+
+    Image.new('RGB', (20, 10)).save(path)
+    meta = scan_photo_meta(path)
+    assert meta['ok'] and (meta['width'], meta['height']) == (20, 10)
+    mark_found(person, path, meta)
+    assert not is_missing(person, path)
+    assert person['photo_meta'][path]['uploaded_at'] == '2024-05-01T00:00:00'
+    assert person['cover_photo'] == path
+
+
+def test_unreadable_files_are_not_ok(tmp_path):
+    assert scan_photo_meta(str(tmp_path / 'gone.jpg'))['ok'] is False
+    broken = tmp_path / 'broken.jpg'
+    broken.write_bytes(b'not a photo')
+    meta = scan_photo_meta(str(broken))
+    assert meta['ok'] is False
+    assert meta['bytes'] == len(b'not a photo')
@@ -0,0 +1,57 @@
+import json
+
+from profiling import Instrumented, Metrics, RunProfile, timed
+
+
+def test_nested_spans_are_named_after_their_parents():
+    profile = RunProfile()
+    with profile.span('grid'):
+        for _ in range(3):
+            with profile.span('show_photo'):
+                pass
+    with profile.span('show_photo'):
+        pass
+    spans = {span['name']: (span['calls'], span['depth'])
+             for span in profile.finish(session='s')['spans']}
+    assert spans == {'grid': (1, 0), 'grid/show_photo': (3, 1), 'show_photo': (1, 0)}
+
+
+def test_decorated_functions_and_proxies_record_spans():
+    profile = RunProfile()
+
+    @timed('work', lambda: profile)
+    def work(x):
+        return x * 2
+
+    store = Instrumented({'a': 1}, 'store', lambda: profile)
+    assert work(2) == 4
+    assert store.get('a') == 1
+    assert [span['name'] for span in profile.finish()['spans']] == ['work', 'store.get']
+
+
+def test_runs_are_exported_as_jsonl_and_prometheus(tmp_path):
+    jsonl, prom = tmp_path / 'profile.jsonl', tmp_path / 'app.prom'
+    metrics = Metrics(jsonl_path=str(jsonl), prom_path=str(prom))
+    metrics.add_collector(lambda: [('app_people', 'gauge', 'People stored.', 3)])
+    profile = RunProfile()
+    with profile.span('a "quoted" span'):
+        pass
+    metrics.record(profile.finish(session='s1'))
+    metrics.record({'session': 's1', 'fragment': 'uploads', 'started_at': None,
+                    'total_s': 0.3, 'spans': [{'name': 'uploads', 'calls': 2, 'seconds': 0.3,
+                                               'depth': 0}]})
+
+    runs = [json.loads(line) for line in jsonl.read_text().splitlines()]
+    assert [run['fragment'] for run in runs] == [None, 'uploads']
+
+    text = prom.read_text()
+    assert text == metrics.prometheus_text()
+    assert 'app_reruns_total 2\n' in text
+    assert 'app_span_calls_total{span="a \\"quoted\\" span"} 1\n' in text
+    assert 'app_span_calls_total{span="uploads"} 2\n' in text
+    assert 'app_span_seconds_bucket{span="fragment_run",le="0.25"} 0\n' in text
+    assert 'app_span_seconds_bucket{span="fragment_run",le="0.5"} 1\n' in text
+    assert 'app_span_seconds_count{span="run"} 1\n' in text
+    assert '# TYPE app_people gauge\napp_people 3\n' in text
+    assert [name for name, *_ in metrics.summary()] == ['run', 'a "quoted" span',
+                                                        'fragment_run', 'uploads']
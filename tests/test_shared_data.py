@@ -0,0 +1,99 @@
+from conftest import new_person, photo_meta
+from shared_data import SharedData
+
+
+def shared(store):
+    return SharedData(store, countries=['United States', 'France'], us_states=['Ohio'])
+
+
+def test_sync_picks_up_writes_from_another_process(open_store):
+    data = shared(open_store())
+    assert data.sync() is False
+
+    open_store().add_person(new_person('Remote', photos=['images/r.jpg']))
+    version = data.version
+    assert data.sync() is True
+    assert data.version > version
+    assert [p['name'] for p in data.people] == ['Remote']
+    assert data.lookup('remote')['name'] == 'Remote'
+    assert data.sync() is False
+
+
+def test_writes_are_published_and_persisted(open_store):
+    data = shared(open_store())
+    person = data.add_person(new_person('Ada', photos=['images/a.jpg']))
+    published = data.people
+
+    data.add_meeting(person['id'], {"date": "2024-05-01", "location": "Paris"})
+    assert published[0]['meetings'] == []  # copy-on-write
+    assert data.get_person(person['id'])['meetings'] == [{"date": "2024-05-01", "location": "Paris"}]
+    assert data.remove_photo(person['id'], 'images/a.jpg') is True
+    assert data.get_person(person['id'])['photos'] == []
+
+    reloaded = shared(open_store())
+    assert reloaded.get_person(person['id'])['meetings'] == [{"date": "2024-05-01", "location": "Paris"}]
+    assert reloaded.get_person(person['id'])['photos'] == []
+
+
+def test_local_write_does_not_hide_another_process_write(open_store):
+    data = shared(open_store())
+    open_store().add_person(new_person('FromOtherProcess'))
+    data.add_person(new_person('Local'))
+    assert sorted(p['name'] for p in data.people) == ['FromOtherProcess', 'Local']
+    assert data.sync() is False
+
+
+def test_write_racing_another_process_is_synced_later(open_store):
+    data = shared(open_store())
+    other = open_store()
+    data.add_person(new_person('Local'))
+    other.add_person(new_person('FromOtherProcess'))
+    data.add_person(new_person('Local again'))
+    other.add_person(new_person('Later'))
+    assert data.sync() is True
+    assert sorted(p['name'] for p in data.people) == ['FromOtherProcess', 'Later', 'Local',
+                                                      'Local again']
+
+
+def test_own_writes_do_not_change_the_data_version(open_store):
+    store = open_store()
+    version = store.data_version()
+    store.add_person(new_person('Ada'))
+    store.add_event({"name": "Launch", "date": "2024-01-01", "photos": []})
+    assert store.data_version() == version
+    open_store().add_person(new_person('Bob'))
+    assert store.data_version() != version
+
+
+
+def test_photo_search_forgets_missing_and_deleted_photos(open_store):
+    data = shared(open_store())
+    ada = new_person('Ada', photos=['images/a.jpg', 'images/b.jpg'])
+    ada['photo_meta']['images/b.jpg']['phash'] = 'f' * 32
+    data.add_person(ada)
+    bob = data.add_person(new_person('Bob', photos=['images/c.jpg']))
+    assert {m[0] for m in data.visual_query('0' * 32)} == {ada['id'], bob['id']}
+
+    data.mark_photo_missing(ada['id'], 'images/a.jpg')
+    assert [m[:2] for m in data.visual_query('0' * 32)] == [(bob['id'], 'images/c.jpg')]
+    assert [m[:2] for m in shared(open_store()).visual_query('0' * 32)] == [
+        (bob['id'], 'images/c.jpg')]
+
+    data.delete_person(bob['id'])
+    assert data.visual_query('0' * 32) == []
+    assert [m[0] for m in data.visual_query('f' * 32)] == [ada['id']]
+
+
+def test_photo_found_again_is_shown_and_searchable(open_store):
+    data = shared(open_store())
+    ada = data.add_person(new_person('Ada', photos=['images/a.jpg']))
+    data.mark_photo_missing(ada['id'], 'images/a.jpg')
+    assert data.get_person(ada['id'])['cover_photo'] is None
+    assert data.visual_query('0' * 32) == []
+
+    data.mark_photo_found(ada['id'], 'images/a.jpg', dict(photo_meta(), uploaded_at=None))
+    person = shared(open_store()).get_person(ada['id'])
+    assert person['photo_meta']['images/a.jpg']['ok'] is True
+    assert person['photo_meta']['images/a.jpg']['uploaded_at'] == '2024-01-01T00:00:00'
+    assert person['cover_photo'] == 'images/a.jpg'
+    assert [m[0] for m in data.visual_query('0' * 32)] == [ada['id']]
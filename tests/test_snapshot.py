@@ -0,0 +1,66 @@
+import json
+import os
+
+from conftest import new_person
+from locations import COUNTRIES, US_STATES
+from shared_data import SharedData
+from snapshot import SiteWriter, export
+from storage import SQLiteStore
+
+
+def test_files_made_from_the_same_inputs_are_not_written_again(tmp_path):
+    site = SiteWriter(str(tmp_path))
+    calls = []
+    site.write('a.html', 'key-a', lambda: calls.append('a') or 'A')
+    site.write('b.json', 'key-b', lambda: calls.append('b') or b'B')
+    assert site.finish() == 0
+
+    site = SiteWriter(str(tmp_path))
+    site.write('a.html', 'key-a', lambda: calls.append('a') or 'A')
+    site.write('a.html', 'key-a', lambda: calls.append('a') or 'A')
+    site.write('c.html', 'key-c', lambda: calls.append('c') or 'C')
+    assert site.finish() == 1
+    assert calls == ['a', 'b', 'c']
+    assert (site.written, site.skipped) == (1, 1)
+    assert sorted(os.listdir(tmp_path)) == ['a.html', 'c.html', 'snapshot.json']
+
+    # A file deleted by hand is written again
+    os.remove(tmp_path / 'a.html')
+    site = SiteWriter(str(tmp_path))
+    site.write('a.html', 'key-a', lambda: calls.append('a') or 'A')
+    assert calls[-1] == 'a'
+
+
+def test_export_only_rewrites_what_changed(tmp_path):
+    photos = tmp_path / 'images'
+    photos.mkdir()
+    for name in ('ada.jpg', 'bob.jpg'):
+        (photos / name).write_bytes(b'photo of ' + name.encode())
+    data = SharedData(SQLiteStore(str(tmp_path / 'app_data.db')), COUNTRIES, US_STATES)
+    ada = data.add_person(new_person('Ada', photos=[str(photos / 'ada.jpg')]))
+    data.add_person(new_person('Bob', photos=[str(photos / 'bob.jpg')], country='Canada'))
+    data.add_person(new_person('Cy'))
+    site = str(tmp_path / 'site')
+
+    first = export(data, site, page_size=2)
+    assert first['people_pages'] == 2
+    assert first['unchanged'] == 0
+    assert len(os.listdir(os.path.join(site, 'photos'))) == 2
+    with open(os.path.join(site, 'people-2.json')) as f:
+        assert [p['name'] for p in json.load(f)['people']] == ['Cy']
+
+    assert export(data, site, page_size=2)['written'] == 0
+
+    data.add_meeting(ada['id'], {'date': '2024-05-01', 'location': 'Paris'})
+    report = export(data, site, page_size=2)
+    # Ada's page, and the grid page she is on as HTML and JSON
+    assert report['written'] == 3
+    with open(os.path.join(site, f"person-{ada['id']}.html")) as f:
+        assert 'Paris' in f.read()
+
+    data.delete_person(ada['id'])
+    report = export(data, site, page_size=2)
+    assert report['people_pages'] == 1
+    assert not os.path.exists(os.path.join(site, f"person-{ada['id']}.html"))
+    assert not os.path.exists(os.path.join(site, 'people-2.json'))
+    assert len(os.listdir(os.path.join(site, 'photos'))) == 1
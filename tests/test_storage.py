@@ -0,0 +1,83 @@
+from conftest import new_person, photo_meta
+
+
+def test_people_round_trip(open_store):
+    store = open_store()
+    ada = new_person('Ada', photos=['images/a.jpg'], meetings=[{"date": "2024-05-01", "location": "Paris"}],
+                     country='France')
+    bob = new_person('Bob', state='Ohio')
+    store.add_person(ada)
+    store.add_person(bob)
+    assert ada['id'] != bob['id']
+
+    people = {p['id']: p for p in open_store().load_people()}
+    assert people[ada['id']]['name'] == 'Ada'
+    assert people[ada['id']]['country'] == 'France'
+    assert people[ada['id']]['photos'] == ['images/a.jpg']
+    assert people[ada['id']]['photo_meta']['images/a.jpg']['phash'] == '0' * 32
+    assert people[ada['id']]['cover_photo'] == 'images/a.jpg'
+    assert people[ada['id']]['meetings'] == [{"date": "2024-05-01", "location": "Paris"}]
+    assert people[bob['id']]['state'] == 'Ohio'
+    assert [p['id'] for p in open_store().iter_people(after_id=ada['id'])] == [bob['id']]
+
+
+def test_person_changes_round_trip(open_store):
+    store = open_store()
+    person = new_person('Ada')
+    store.add_person(person)
+
+    person['name'] = 'Ada Lovelace'
+    store.update_person(person)
+    person['photos'].append('images/b.jpg')
+    person['photo_meta']['images/b.jpg'] = photo_meta()
+    person['cover_photo'] = 'images/b.jpg'
+    store.add_photo(person, 'images/b.jpg')
+    meeting = {"date": "2024-06-01", "location": "London"}
+    person['meetings'].append(meeting)
+    store.add_meeting(person, meeting)
+
+    loaded, = open_store().load_people()
+    assert loaded['name'] == 'Ada Lovelace'
+    assert loaded['photos'] == ['images/b.jpg']
+    assert loaded['cover_photo'] == 'images/b.jpg'
+    assert loaded['meetings'] == [meeting]
+
+    person['meetings'].remove(meeting)
+    store.remove_meeting(person, meeting)
+    person['photos'].remove('images/b.jpg')
+    del person['photo_meta']['images/b.jpg']
+    person['cover_photo'] = None
+    store.remove_photo(person, 'images/b.jpg')
+
+    loaded, = open_store().load_people()
+    assert loaded['photos'] == []
+    assert loaded['meetings'] == []
+
+    store.delete_person(person)
+    assert open_store().load_people() == []
+
+
+def test_events_round_trip(open_store):
+    store = open_store()
+    event = {"name": "Launch party", "date": "2024-03-02", "photos": ['images/e.jpg'],
+             "photo_meta": {'images/e.jpg': photo_meta()}}
+    store.add_event(event)
+
+    event['photo_meta']['images/e.jpg']['ok'] = False
+    store.update_event_photo_meta(event, 'images/e.jpg')
+
+    loaded, = open_store().load_events()
+    assert loaded['id'] == event['id']
+    assert loaded['name'] == 'Launch party'
+    assert loaded['photos'] == ['images/e.jpg']
+    assert loaded['photo_meta']['images/e.jpg']['ok'] is False
+
+    store.clear_events()
+    assert open_store().load_events() == []
+
+
+def test_writers_on_separate_connections_keep_each_others_rows(open_store):
+    first, second = open_store(), open_store()
+    first.add_person(new_person('Ada'))
+    second.add_person(new_person('Bob'))
+    assert sorted(p['name'] for p in open_store().load_people()) == ['Ada', 'Bob']
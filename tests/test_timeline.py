@@ -0,0 +1,78 @@
+from timeline import MeetingTimeline
+
+
+def person(person_id, meetings, country='United States'):
+    return {'id': person_id, 'country': country,
+            'meetings': [{'date': date, 'location': location} for date, location in meetings]}
+
+
+def timeline():
+    return MeetingTimeline([
+        person(1, [('2024-01-05', 'Paris'), ('2024-03-01', 'Lyon'), ('2024-01-20', 'Paris')],
+               'France'),
+        person(2, [('2023-11-30', 'Paris')]),
+        person(3, [('2024-03-15', ' Lyon ')], 'France'),
+    ])
+
+
+def test_lookups():
+    meetings = timeline()
+    assert len(meetings) == 5
+    assert meetings.people_count() == 3
+    assert meetings.has(1, '2024-01-20') and not meetings.has(2, '2024-01-20')
+    assert meetings.last_seen(1) == {'date': '2024-03-01', 'location': 'Lyon'}
+    assert meetings.last_seen(4) is None
+    assert meetings.location_names() == ['Lyon', 'Paris']
+    assert set(meetings.people_at('Lyon')) == {1, 3}
+    assert meetings.people_between('2024-01-01', '2024-03-01') == {1}
+    assert meetings.people_between(end='2024-01-05') == {1, 2}
+
+
+def test_analytics():
+    meetings = timeline()
+    assert meetings.per_month() == (['2023-11', '2024-01', '2024-03'], [1, 2, 2])
+    assert meetings.per_location() == (['Paris', 'Lyon'], [3, 2])
+    assert meetings.per_country() == (['France', 'United States'], [4, 1])
+    assert meetings.not_seen_since('2024-03-10') == ([2, 1], ['2023-11-30', '2024-03-01'])
+    assert meetings.people_not_seen_since('2024-01-01') == {2}
+
+
+def test_changes_are_reflected():
+    meetings = timeline()
+    meetings.add(2, {'date': '2024-04-01', 'location': 'Nice'})
+    meetings.add(4, {'date': 'someday', 'location': 'Nice'}, country='Canada')
+    assert meetings.last_seen(2) == {'date': '2024-04-01', 'location': 'Nice'}
+    assert meetings.last_seen(4) == {'date': None, 'location': 'Nice'}
+    assert set(meetings.people_at('Nice')) == {2, 4}
+    # Undated meetings are not counted by month
+    assert sum(meetings.per_month()[1]) == 6
+
+    assert meetings.remove(1, {'date': '2024-03-01', 'location': 'Lyon'})
+    assert not meetings.remove(1, {'date': '2024-03-01', 'location': 'Lyon'})
+    assert meetings.last_seen(1) == {'date': '2024-01-20', 'location': 'Paris'}
+    meetings.update_person({'id': 2, 'country': 'France'})
+    # Person 4's only meeting has no date
+    assert meetings.per_country() == (['France'], [5])
+    meetings.remove_person(3)
+    assert set(meetings.people_at('Lyon')) == set()
+    assert meetings.location_names() == ['Nice', 'Paris']
+
+
+def test_compaction_keeps_every_lookup():
+    dates = [f'2024-01-{day:02d}' for day in range(1, 29)]
+    meetings = MeetingTimeline([person(i, [(date, f'Place {i}') for date in dates])
+                                for i in range(1, 6)])
+    for i in range(1, 4):
+        for date in dates[1:]:
+            assert meetings.remove(i, {'date': date, 'location': f'Place {i}'})
+    # More than half of the rows died, so the columns were compacted
+    assert meetings._size < 5 * 28
+    assert len(meetings) == 3 + 2 * 28
+
+    assert meetings.last_seen(1) == {'date': '2024-01-01', 'location': 'Place 1'}
+    assert meetings.last_seen(5) == {'date': '2024-01-28', 'location': 'Place 5'}
+    assert meetings.has(4, '2024-01-15') and not meetings.has(2, '2024-01-15')
+    assert meetings.people_between('2024-01-02') == {4, 5}
+    assert meetings.per_location()[1] == [28, 28, 1, 1, 1]
+    assert meetings.remove(5, {'date': '2024-01-28', 'location': 'Place 5'})
+    assert meetings.last_seen(5) == {'date': '2024-01-27', 'location': 'Place 5'}
@@ -0,0 +1,47 @@
+import threading
+import time
+
+import pytest
+
+from uploads import QueueFull, UploadQueue
+
+
+class BlockingQueue(UploadQueue):
+    """Jobs stay unfinished until ``release`` is set"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(None, *args, **kwargs)
+        self.release = threading.Event()
+
+    def _run(self, job):
+        self.release.wait(5)
+
+
+def test_queued_bytes_are_limited():
+    uploads = BlockingQueue(workers=1, max_jobs=10, max_bytes=100)
+    try:
+        uploads.submit('first', [('a.jpg', b'x' * 60)])
+        assert uploads.queued_bytes == 60
+        with pytest.raises(QueueFull):
+            uploads.submit('second', [('b.jpg', b'x' * 30), ('c.jpg', b'x' * 20)])
+        with pytest.raises(QueueFull, match='smaller batches'):
+            uploads.submit('too big', [('d.jpg', b'x' * 101)])
+        uploads.submit('small', [('e.jpg', b'x' * 40)])
+    finally:
+        uploads.release.set()
+    uploads._queue.join()
+    assert uploads.queued_bytes == 0
+    uploads.submit('after', [('f.jpg', b'x' * 100)])
+
+
+def test_queued_jobs_are_limited():
+    uploads = BlockingQueue(workers=1, max_jobs=1, max_bytes=100)
+    try:
+        uploads.submit('running', [('a.jpg', b'x')])
+        while uploads._queue.qsize():  # until a worker took it
+            time.sleep(0.01)
+        uploads.submit('waiting', [('b.jpg', b'x')])
+        with pytest.raises(QueueFull):
+            uploads.submit('refused', [('c.jpg', b'x')])
+    finally:
+        uploads.release.set()
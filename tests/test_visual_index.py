@@ -0,0 +1,60 @@
+from PIL import Image, ImageDraw
+
+from visual_index import VisualIndex, image_hash
+
+
+def picture(seed, size=256):
+    img = Image.new('RGB', (size, size), 'white')
+    draw = ImageDraw.Draw(img)
+    for i in range(6):
+        x, y = (seed * 37 + i * 53) % size, (seed * 91 + i * 29) % size
+        draw.rectangle([x, y, x + size // 4, y + size // 5], fill=(seed * 40 % 256, i * 40, 90))
+    return img
+
+
+def distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def test_hash_survives_resizing_and_recompression(tmp_path):
+    img = picture(1)
+    path = tmp_path / 'copy.jpg'
+    img.resize((150, 150)).save(path, quality=60)
+    with Image.open(path) as copy:
+        assert distance(image_hash(img), image_hash(copy)) <= 10
+    assert distance(image_hash(img), image_hash(picture(2))) > 20
+    assert len(image_hash(img)) == 32
+
+
+def test_query_returns_the_closest_photo_of_each_person():
+    index = VisualIndex()
+    index.add(1, 'a.jpg', '0' * 32)
+    index.add(1, 'b.jpg', '0' * 31 + '1')
+    index.add(2, 'c.jpg', '0' * 30 + '03')
+    index.add(3, 'd.jpg', 'f' * 32)
+    assert index.query('0' * 32) == [(1, 'a.jpg', 0), (2, 'c.jpg', 2)]
+    assert index.query('0' * 32, limit=1) == [(1, 'a.jpg', 0)]
+    assert index.query('f' * 32) == [(3, 'd.jpg', 0)]
+
+
+def test_removed_photos_are_not_matched():
+    index = VisualIndex()
+    for i in range(100):
+        index.add(i, f'{i}.jpg', f'{i:032x}')
+    index.add(5, '5.jpg', f'{5:032x}')
+    index.remove(5, '5.jpg')
+    assert index.query(f'{5:032x}', max_distance=0) == [(5, '5.jpg', 0)]
+    index.remove(5, '5.jpg')
+    index.remove_person({'id': 7, 'photos': ['7.jpg']})
+    assert len(index) == 98
+    assert index.query(f'{5:032x}', max_distance=0) == []
+    assert index.query(f'{99:032x}', max_distance=0) == [(99, '99.jpg', 0)]
+
+
+def test_photos_marked_missing_are_not_indexed():
+    person = {'id': 1, 'photos': ['a.jpg', 'b.jpg'],
+              'photo_meta': {'a.jpg': {'ok': False, 'phash': '0' * 32},
+                             'b.jpg': {'ok': True, 'phash': 'f' * 32}}}
+    index = VisualIndex([person])
+    assert len(index) == 1
+    assert index.query('0' * 32) == []
@@ -0,0 +1,297 @@
+"""Every meeting of every person in NumPy columns, for analytics.
+
+People keep their meetings as a list of dicts, which is what the modal
+shows and the store saves.  ``MeetingTimeline`` holds the same meetings as
+columns (date, person, location, country of the person) next to them, kept
+up to date as people and meetings change:
+
+* "Has this person already been met on this date?" and "when was this
+  person last seen?" are dict lookups, whatever order the meeting list is
+  in, and so are the people met at a location.
+* Meetings per month, location and country and the people not seen for a
+  while are computed with a few vectorized NumPy operations over the
+  columns rather than a loop over every person.
+* Live rows are sorted by date on demand (the date index) and the order is
+  kept until the next change, so months are runs of the sorted dates and
+  the people met between two dates are a binary search away.  The people
+  sorted by the day they were last met are kept the same way.
+
+Removed meetings leave a dead row behind until more than half of the rows
+are dead, then the columns are compacted.
+"""
+import numpy as np
+
+NO_DATE = np.datetime64('NaT', 'D')
+MIN_ROWS = 64
+
+
+def _parse_dates(values):
+    try:
+        return np.array(values, dtype='datetime64[D]')
+    except (TypeError, ValueError):
+        dates = np.full(len(values), NO_DATE, dtype='datetime64[D]')
+        for i, value in enumerate(values):
+            try:
+                dates[i] = np.datetime64(value, 'D')
+            except (TypeError, ValueError):
+                pass
+        return dates
+
+
+class _Codes:
+    """Small integer codes for repeated strings (locations, countries)"""
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def __call__(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def get(self, value):
+        return self._codes.get(value)
+
+
+class MeetingTimeline:
+    COLUMNS = ('_dates', '_slots', '_location_codes', '_country_codes', '_alive')
+
+    def __init__(self, people=()):
+        self.locations = _Codes()
+        self.countries = _Codes()
+        # person id <-> slot, a dense index used by the columns
+        self._slot = {}
+        self._slot_ids = []
+        self._slot_id_array = np.zeros(0, dtype=np.int64)
+        # (person id, date string) -> rows; person id -> rows
+        self._by_day = {}
+        self._by_person = {}
+        # location code -> {person id: live meetings there}
+        self._by_location = {}
+        self._dead = 0
+        self._order = None
+        self._last_seen = None
+
+        dates, slots, locations, countries = [], [], [], []
+        for person in people:
+            slot = self._slot_of(person['id'])
+            country = self.countries(person.get('country') or 'Unknown')
+            for meeting in person.get('meetings', []):
+                row = len(dates)
+                dates.append(meeting['date'])
+                slots.append(slot)
+                locations.append(self.locations((meeting.get('location') or '').strip()))
+                countries.append(country)
+                self._count_location(locations[-1], person['id'], 1)
+                self._by_day.setdefault((person['id'], meeting['date']), []).append(row)
+                self._by_person.setdefault(person['id'], []).append(row)
+        self._size = len(dates)
+        capacity = max(MIN_ROWS, self._size * 2)
+        self._dates = np.resize(_parse_dates(dates), capacity)
+        self._slots = np.resize(np.array(slots, dtype=np.int64), capacity)
+        self._location_codes = np.resize(np.array(locations, dtype=np.int32), capacity)
+        self._country_codes = np.resize(np.array(countries, dtype=np.int32), capacity)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._alive[:self._size] = True
+
+    def __len__(self):
+        return self._size - self._dead
+
+    def _count_location(self, code, person_id, change):
+        people = self._by_location.setdefault(code, {})
+        count = people[person_id] = people.get(person_id, 0) + change
+        if not count:
+            del people[person_id]
+
+    def _ids_of(self, slots):
+        """Person ids of an array of slots"""
+        if len(self._slot_id_array) != len(self._slot_ids):
+            self._slot_id_array = np.array(self._slot_ids, dtype=np.int64)
+        return self._slot_id_array[slots].tolist()
+
+    def _slot_of(self, person_id):
+        slot = self._slot.get(person_id)
+        if slot is None:
+            slot = self._slot[person_id] = len(self._slot_ids)
+            self._slot_ids.append(person_id)
+        return slot
+
+    def add(self, person_id, meeting, country=None):
+        """Add one meeting; ``country`` is needed for a person new to the timeline"""
+        if self._size == len(self._dates):
+            for column in self.COLUMNS:
+                setattr(self, column, np.resize(getattr(self, column), self._size * 2))
+            self._alive[self._size:] = False
+        rows = self._by_person.get(person_id)
+        row = self._size
+        self._dates[row] = _parse_dates([meeting['date']])[0]
+        self._slots[row] = self._slot_of(person_id)
+        self._location_codes[row] = self.locations((meeting.get('location') or '').strip())
+        self._country_codes[row] = (self._country_codes[rows[0]] if rows
+                                    else self.countries(country or 'Unknown'))
+        self._alive[row] = True
+        self._size += 1
+        self._by_day.setdefault((person_id, meeting['date']), []).append(row)
+        self._by_person.setdefault(person_id, []).append(row)
+        self._count_location(int(self._location_codes[row]), person_id, 1)
+        self._order = None
+
+    def add_person(self, person):
+        for meeting in person.get('meetings', []):
+            self.add(person['id'], meeting, person.get('country'))
+
+    def update_person(self, person):
+        """File the meetings of ``person`` under their current country"""
+        rows = self._by_person.get(person['id'])
+        if rows:
+            self._country_codes[rows] = self.countries(person.get('country') or 'Unknown')
+
+    def _kill(self, row, person_id):
+        self._alive[row] = False
+        self._dead += 1
+        self._count_location(int(self._location_codes[row]), person_id, -1)
+        rows = self._by_person[person_id]
+        rows.remove(row)
+        if not rows:
+            del self._by_person[person_id]
+        self._order = None
+
+    def remove(self, person_id, meeting):
+        """Remove one meeting equal to ``meeting``; returns whether there was one"""
+        key = (person_id, meeting['date'])
+        rows = self._by_day.get(key, [])
+        code = self.locations.get((meeting.get('location') or '').strip())
+        for row in rows:
+            if self._location_codes[row] == code:
+                rows.remove(row)
+                if not rows:
+                    del self._by_day[key]
+                self._kill(row, person_id)
+                self._compact_if_sparse()
+                return True
+        return False
+
+    def remove_person(self, person_id):
+        for row in list(self._by_person.get(person_id, [])):
+            self._kill(row, person_id)
+        self._by_day = {key: rows for key, rows in self._by_day.items() if key[0] != person_id}
+        self._compact_if_sparse()
+
+    def clear(self):
+        self.__init__()
+
+    def _compact_if_sparse(self):
+        if self._dead * 2 <= self._size:
+            return
+        keep = np.flatnonzero(self._alive[:self._size])
+        new_row = np.full(self._size, -1, dtype=np.int64)
+        new_row[keep] = np.arange(len(keep))
+        for column in self.COLUMNS:
+            setattr(self, column, np.resize(getattr(self, column)[keep], max(MIN_ROWS, len(keep) * 2)))
+        self._alive[len(keep):] = False
+        self._size = len(keep)
+        self._dead = 0
+        self._by_day = {key: new_row[rows].tolist() for key, rows in self._by_day.items()}
+        self._by_person = {pid: new_row[rows].tolist() for pid, rows in self._by_person.items()}
+        self._order = None
+
+    # Lookups
+
+    def people_count(self):
+        """Number of people with at least one meeting"""
+        return len(self._by_person)
+
+    def has(self, person_id, date):
+        """Whether ``person_id`` has a meeting on ``date`` (``YYYY-MM-DD``)"""
+        return bool(self._by_day.get((person_id, date)))
+
+    def last_seen(self, person_id):
+        """The latest meeting of a person as ``{date, location}``, or None"""
+        rows = self._by_person.get(person_id)
+        if not rows:
+            return None
+        row = max(rows, key=lambda r: (not np.isnat(self._dates[r]), self._dates[r], r))
+        return {"date": None if np.isnat(self._dates[row]) else str(self._dates[row]),
+                "location": self.locations.values[self._location_codes[row]]}
+
+    def _sorted_rows(self):
+        """Live rows with a date, in date order"""
+        if self._order is None:
+            rows = np.flatnonzero(self._alive[:self._size] & ~np.isnat(self._dates[:self._size]))
+            self._order = rows[np.argsort(self._dates[rows], kind='stable')]
+        return self._order
+
+    def _last_seen_order(self):
+        """``(slots, days)`` of the people met, by the day they were last met"""
+        rows = self._sorted_rows()
+        # Valid as long as the date order it was computed from
+        if self._last_seen is None or self._last_seen[0] is not rows:
+            days = self._dates[rows].astype(np.int64)
+            last = np.full(len(self._slot_ids), np.iinfo(np.int64).min)
+            np.maximum.at(last, self._slots[rows], days)
+            met = np.flatnonzero(last > np.iinfo(np.int64).min)
+            met = met[np.argsort(last[met], kind='stable')]
+            self._last_seen = (rows, met, last[met])
+        return self._last_seen[1:]
+
+    def location_names(self):
+        """Meeting locations with someone met there, in alphabetical order"""
+        return sorted(self.locations.values[code] for code, people in self._by_location.items()
+                      if people and self.locations.values[code])
+
+    def people_at(self, location):
+        """Ids of the people met at ``location``, as a dict keyed by id"""
+        return self._by_location.get(self.locations.get((location or '').strip()), {})
+
+    def people_between(self, start=None, end=None):
+        """Ids of the people met from ``start`` to ``end`` (both included)"""
+        rows = self._sorted_rows()
+        dates = self._dates[rows]
+        lo = np.searchsorted(dates, np.datetime64(start, 'D'), 'left') if start else 0
+        hi = np.searchsorted(dates, np.datetime64(end, 'D'), 'right') if end else len(rows)
+        met = np.zeros(len(self._slot_ids), dtype=bool)
+        met[self._slots[rows[lo:hi]]] = True
+        return set(self._ids_of(np.flatnonzero(met)))
+
+    # Analytics
+
+    def _ranked(self, codes, labels):
+        counts = np.bincount(codes, minlength=len(labels))
+        used = np.flatnonzero(counts)
+        used = used[np.argsort(-counts[used], kind='stable')]
+        return [labels[c] for c in used], counts[used].tolist()
+
+    def per_month(self):
+        """``(months, counts)``; months as ``YYYY-MM`` strings, in order"""
+        months = self._dates[self._sorted_rows()].astype('datetime64[M]')
+        if not len(months):
+            return [], []
+        starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+        counts = np.diff(np.r_[starts, len(months)])
+        return months[starts].astype(str).tolist(), counts.tolist()
+
+    def per_location(self):
+        """``(locations, counts)``, most meetings first"""
+        labels = [location or 'Unknown' for location in self.locations.values]
+        return self._ranked(self._location_codes[self._sorted_rows()], labels)
+
+    def per_country(self):
+        """``(countries, counts)`` of the person met, most meetings first"""
+        return self._ranked(self._country_codes[self._sorted_rows()], self.countries.values)
+
+    def _last_seen_before(self, cutoff):
+        slots, days = self._last_seen_order()
+        count = np.searchsorted(days, np.datetime64(cutoff, 'D').astype(np.int64), 'left')
+        return slots[:count], days[:count]
+
+    def not_seen_since(self, cutoff):
+        """``(person_ids, last_dates)`` of people last met before ``cutoff``, longest ago first"""
+        slots, days = self._last_seen_before(cutoff)
+        return self._ids_of(slots), days.astype('datetime64[D]').astype(str).tolist()
+
+    def people_not_seen_since(self, cutoff):
+        """Ids of the people last met before ``cutoff``"""
+        return set(self._ids_of(self._last_seen_before(cutoff)[0]))
@@ -0,0 +1,183 @@
+"""Photo uploads processed in the background.
+
+Processing an upload and saving it used to happen inside the script run, so
+the page froze until every photo was written.  Now the app hands uploads to
+the process-wide ``UploadQueue`` and carries on:
+
+* A few worker threads take jobs (the files of one form submission) off a
+  bounded queue.  When it is full, or the upload bytes held for queued and
+  running jobs would grow past a limit, ``submit`` raises ``QueueFull``
+  instead of piling up work (and upload bytes) in memory.
+* Each file goes through the ingest process pool; its status is updated as
+  it goes, for the progress shown in the page.
+* The job's callbacks persist the results: ``on_photo`` as soon as a photo
+  is stored, ``on_done`` once every file of the job is through.  They run
+  in the worker thread, so they must not touch ``st``.
+
+    UPLOAD_WORKERS=2       jobs processed at once
+    UPLOAD_QUEUE_SIZE=16   jobs waiting at most
+    UPLOAD_QUEUE_MB=512    upload bytes held for unfinished jobs at most
+"""
+import io
+import itertools
+import os
+import queue
+import sys
+import threading
+import time
+
+from ingest import ingest_iter
+
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 2))
+UPLOAD_QUEUE_SIZE = int(os.environ.get('UPLOAD_QUEUE_SIZE', 16))
+UPLOAD_QUEUE_BYTES = int(float(os.environ.get('UPLOAD_QUEUE_MB', 512)) * 1024 * 1024)
+# Finished jobs are forgotten after this long, whether or not a page showed them
+FINISHED_JOB_TTL = 3600
+
+QUEUED, PROCESSING, DONE, FAILED = 'queued', 'processing', 'done', 'failed'
+
+
+class QueueFull(RuntimeError):
+    """UPLOAD_QUEUE_SIZE jobs are already waiting, or UPLOAD_QUEUE_MB would be exceeded"""
+
+
+class UploadJob:
+    def __init__(self, job_id, label, files, on_photo, on_done):
+        self.id = job_id
+        self.label = label
+        self.names = [name for name, _ in files]
+        self.status = [QUEUED] * len(files)
+        # (file name, message); no file name for an error of the whole job
+        self.errors = []
+        self.photos = [None] * len(files)
+        self.finished_at = None
+        self._files = files
+        self.size = sum(len(data) for _, data in files)
+        self._on_photo = on_photo
+        self._on_done = on_done
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def progress(self):
+        """``(files through, total files)``"""
+        return sum(s in (DONE, FAILED) for s in self.status), len(self.status)
+
+
+class UploadQueue:
+    def __init__(self, image_store, workers=UPLOAD_WORKERS, max_jobs=UPLOAD_QUEUE_SIZE,
+                 max_bytes=UPLOAD_QUEUE_BYTES):
+        self.image_store = image_store
+        self.workers = workers
+        self.max_bytes = max_bytes
+        # Upload bytes of the jobs not finished yet
+        self.queued_bytes = 0
+        self._queue = queue.Queue(maxsize=max_jobs)
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._threads = []
+        self.processed = 0
+        self.failed = 0
+
+    def submit(self, label, files, on_photo=None, on_done=None):
+        """Queue ``files`` (``[(name, bytes)]``) and return the job.
+
+        ``on_photo(path, photo_meta)`` is called for each stored photo and
+        ``on_done(photos, errors)`` at the end, with ``photos`` as
+        ``[(path, photo_meta)]`` in the order of ``files``.  When a callback
+        raises, the photos it was given are released and the error is
+        reported with the job.  Raises ``QueueFull`` when too many jobs are
+        waiting or their files would take more than ``max_bytes``.
+        """
+        with self._lock:
+            job = UploadJob(next(self._ids), label, list(files), on_photo, on_done)
+            if job.size > self.max_bytes:
+                raise QueueFull(f"These photos take {job.size / 2**20:.0f} MB, more than the "
+                                f"{self.max_bytes / 2**20:.0f} MB uploads may take at once; "
+                                "upload them in smaller batches")
+            if self.queued_bytes + job.size > self.max_bytes:
+                raise QueueFull("Too many uploads are being processed; try again in a moment")
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFull("Too many uploads are being processed; try again in a moment")
+            self.queued_bytes += job.size
+            self._jobs[job.id] = job
+            self._forget_old_jobs()
+            if not self._threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self._work, name=f'upload-{i}', daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def _forget_old_jobs(self):
+        cutoff = time.time() - FINISHED_JOB_TTL
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _stored(self, job, i, photo):
+        try:
+            if job._on_photo:
+                job._on_photo(*photo)
+        except Exception as e:
+            self.image_store.release(photo[0])
+            return e
+        job.photos[i] = photo
+        return None
+
+    def _run(self, job):
+        uploads = [io.BytesIO(data) for _, data in job._files]
+        for i in range(len(uploads)):
+            job.status[i] = PROCESSING
+        for i, photo, error in ingest_iter(uploads, self.image_store):
+            if error is None:
+                error = self._stored(job, i, photo)
+            if error is None:
+                job.status[i] = DONE
+                self.processed += 1
+            else:
+                job.status[i] = FAILED
+                job.errors.append((job.names[i], str(error)))
+                self.failed += 1
+        if job._on_done:
+            photos = [photo for photo in job.photos if photo]
+            try:
+                job._on_done(photos, list(job.errors))
+            except Exception as e:
+                if not job._on_photo:
+                    for path, _ in photos:
+                        self.image_store.release(path)
+                job.errors.append((None, str(e)))
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            except Exception as e:
+                print(f"Upload job {job.label!r} failed: {e}", file=sys.stderr)
+                job.errors.append((None, str(e)))
+            finally:
+                # Drop the upload bytes; the statuses stay for the progress display
+                job._files = None
+                with self._lock:
+                    self.queued_bytes -= job.size
+                job.finished_at = time.time()
+                self._queue.task_done()
+
+    def metrics(self):
+        """``[(name, type, help, value)]`` for the Prometheus export"""
+        return [
+            ("app_upload_queue_jobs", "gauge", "Upload jobs waiting for a worker.",
+             self._queue.qsize()),
+            ("app_upload_queue_bytes", "gauge", "Upload bytes held for unfinished jobs.",
+             self.queued_bytes),
+            ("app_upload_photos_total", "counter", "Uploaded photos stored.", self.processed),
+            ("app_upload_failures_total", "counter", "Uploaded photos that failed.", self.failed),
+        ]
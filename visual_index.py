@@ -0,0 +1,142 @@
+"""Find people by photo.
+
+Every stored photo gets a 128-bit perceptual hash at ingest (a 64-bit DCT
+hash plus a 64-bit difference hash of the processed square).  Similar
+photos have hashes that differ in few bits, so a query is one vectorized
+XOR + popcount over all hashes, grouped by person.  CPU only, and fast
+enough to stay interactive with tens of thousands of photos.
+"""
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+HASH_WORDS = 2
+# Photos further apart than this (out of 128 bits) are not considered a match
+MAX_DISTANCE = 40
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / n)
+
+
+_DCT_32 = _dct_matrix(HASH_SIZE * 4)
+
+
+def _bits_to_int(bits):
+    return int(''.join('1' if b else '0' for b in bits.ravel()), 2)
+
+
+def image_hash(img):
+    """Perceptual hash of a PIL image, as a 32-character hex string"""
+    gray = img.convert('L')
+    pixels = np.asarray(gray.resize((HASH_SIZE * 4, HASH_SIZE * 4), Image.Resampling.LANCZOS),
+                        dtype=np.float64)
+    low = (_DCT_32 @ pixels @ _DCT_32.T)[:HASH_SIZE, :HASH_SIZE]
+    dct_bits = low > np.median(low.ravel()[1:])
+
+    small = np.asarray(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS),
+                       dtype=np.int16)
+    diff_bits = small[:, 1:] > small[:, :-1]
+    return f"{_bits_to_int(dct_bits):016x}{_bits_to_int(diff_bits):016x}"
+
+
+def _hash_words(hex_hash):
+    return [int(hex_hash[i * 16:(i + 1) * 16], 16) for i in range(HASH_WORDS)]
+
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount(words):
+        return np.bitwise_count(words).sum(axis=1)
+else:
+    def _popcount(words):
+        return np.unpackbits(words.view(np.uint8), axis=1).sum(axis=1)
+
+
+class VisualIndex:
+    """Perceptual hashes of every person's photos, in one NumPy array"""
+
+    def __init__(self, people=()):
+        self._hashes = np.zeros((64, HASH_WORDS), dtype=np.uint64)
+        self._owners = np.zeros(64, dtype=np.int64)
+        self._size = 0
+        # (person id, path) -> rows holding that photo
+        self._rows = {}
+        self._keys = []
+        for person in people:
+            self.add_person(person)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, person_id, path, hex_hash):
+        if not hex_hash:
+            return
+        if self._size == len(self._hashes):
+            self._hashes = np.resize(self._hashes, (self._size * 2, HASH_WORDS))
+            self._owners = np.resize(self._owners, self._size * 2)
+        row = self._size
+        self._hashes[row] = _hash_words(hex_hash)
+        self._owners[row] = person_id
+        self._keys.append((person_id, path))
+        self._rows.setdefault((person_id, path), []).append(row)
+        self._size += 1
+
+    def remove(self, person_id, path):
+        """Forget one copy of ``path`` for ``person_id``"""
+        rows = self._rows.get((person_id, path))
+        if not rows:
+            return
+        row = rows.pop()
+        if not rows:
+            del self._rows[(person_id, path)]
+        # Move the last row into the hole
+        last = self._size - 1
+        if row != last:
+            moved = self._keys[last]
+            self._hashes[row] = self._hashes[last]
+            self._owners[row] = self._owners[last]
+            self._keys[row] = moved
+            moved_rows = self._rows[moved]
+            moved_rows[moved_rows.index(last)] = row
+        self._keys.pop()
+        self._size -= 1
+
+    def add_person(self, person):
+        """Index the photos of ``person``, except those marked missing"""
+        for path in person.get('photos', []):
+            meta = person.get('photo_meta', {}).get(path, {})
+            if meta.get('ok', True):
+                self.add(person['id'], path, meta.get('phash'))
+
+    def remove_person(self, person):
+        for path in person.get('photos', []):
+            self.remove(person['id'], path)
+
+    def clear(self):
+        self._size = 0
+        self._rows.clear()
+        self._keys.clear()
+
+    def query(self, hex_hash, limit=5, max_distance=MAX_DISTANCE):
+        """``[(person_id, path, distance)]`` of the closest photo of each matching person"""
+        if not self._size:
+            return []
+        query = np.array(_hash_words(hex_hash), dtype=np.uint64)
+        distances = _popcount(np.bitwise_xor(self._hashes[:self._size], query))
+        candidates = np.flatnonzero(distances <= max_distance)
+        candidates = candidates[np.argsort(distances[candidates], kind='stable')]
+
+        matches = []
+        seen = set()
+        for row in candidates:
+            person_id = int(self._owners[row])
+            if person_id in seen:
+                continue
+            seen.add(person_id)
+            matches.append((person_id, self._keys[row][1], int(distances[row])))
+            if len(matches) == limit:
+                break
+        return matches